@@ -0,0 +1,40 @@
+"""
+Общие зависимости эндпоинтов API
+"""
+
+from fastapi import Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import get_async_database, read_your_writes
+from app.models.user import User
+
+
+async def get_current_user(request: Request, db: AsyncSession = Depends(get_async_database)) -> User:
+    """Пользователь Telegram, определенный AuthMiddleware (сессия БД общая с эндпоинтом)"""
+    telegram_id = getattr(request.state, "telegram_id", None)
+    if not telegram_id:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Требуется аутентификация")
+
+    user_id = getattr(request.state, "user_id", None)
+    if user_id is not None:
+        # Недавние изменения баланса и выполнений пользователя читаются из primary
+        await read_your_writes(db, user_id)
+        # id из токена: поиск по первичному ключу
+        user = await db.get(User, user_id)
+        if user is not None and user.telegram_id != telegram_id:
+            user = None
+    else:
+        result = await db.execute(select(User).where(User.telegram_id == telegram_id))
+        user = result.scalar_one_or_none()
+    if user is None or not user.is_active:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Пользователь не найден")
+    return user
+
+
+async def get_admin_user(user: User = Depends(get_current_user)) -> User:
+    """Администратор или оператор из ADMIN_TELEGRAM_IDS"""
+    if user.telegram_id not in settings.admin_telegram_ids:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Недостаточно прав")
+    return user
@@ -0,0 +1,16 @@
+"""
+Служебные эндпоинты администраторов
+"""
+
+from fastapi import APIRouter, Depends
+
+from app.api.deps import get_admin_user
+from app.core.database import get_pool_status, replicas
+
+router = APIRouter(dependencies=[Depends(get_admin_user)])
+
+
+@router.get("/db")
+async def database_pool_status():
+    """Состояние пулов соединений БД и реплик (для настройки DB_POOL_* под нагрузкой)"""
+    return {"pools": get_pool_status(), "replicas": replicas.status()}
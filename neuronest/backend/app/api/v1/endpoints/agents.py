@@ -0,0 +1,307 @@
+"""
+Эндпоинты запуска AI агентов
+"""
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer, selectinload
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import asyncio
+import logging
+import uuid
+
+from app.api.deps import get_current_user
+from app.core.database import get_async_database
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, keyset_page, split_page
+from app.models.agent import Agent, AgentCategory, AgentExecution, AgentStatus, ExecutionStatus
+from app.models.user import User
+from app.models.ledger import LedgerEntry
+from app.models.transaction import Transaction, TransactionStatus, TransactionType, calculate_commission
+from app.services import execution_events, ledger
+from app.services.agent_catalog import agent_catalog, choose_encoding, etag_matches
+from app.services.agent_scheduler import agent_scheduler
+from app.services.agent_schemas import InvalidAgentSchema, SchemaValidationError, agent_schemas
+from app.services.agent_search import agent_search
+from app.services.execution_archive import execution_archive
+from app.services.result_cache import agent_result_cache
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+class ExecuteAgentRequest(BaseModel):
+    input_data: Dict[str, Any] = Field(default_factory=dict)
+
+
+@router.get("/search")
+async def search_agents(
+    q: str = Query(..., min_length=1, max_length=200),
+    category: Optional[AgentCategory] = Query(default=None),
+    tag: Optional[str] = Query(default=None, max_length=50),
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0, le=1000)
+):
+    """Полнотекстовый поиск агентов (релевантность, рейтинг, популярность)"""
+    agents = await agent_search.search(q, category=category, tag=tag, limit=limit, offset=offset)
+    return {"agents": agents, "count": len(agents)}
+
+
+@router.get("/autocomplete")
+async def autocomplete_agents(
+    prefix: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(default=10, ge=1, le=20)
+):
+    """Подсказки названий агентов"""
+    return {"suggestions": await agent_search.autocomplete(prefix, limit=limit)}
+
+
+@router.get("/catalog")
+async def get_catalog(
+    category: Optional[AgentCategory] = Query(default=None),
+    featured: Optional[bool] = Query(default=None),
+    if_none_match: Optional[str] = Header(default=None),
+    accept_encoding: Optional[str] = Header(default=None)
+):
+    """
+    Каталог активных агентов
+    Ответ из кэшированного снимка, с ETag и 304 Not Modified.
+    """
+    snapshot = await agent_catalog.snapshot()
+    view = snapshot.view(category.value if category else None, featured)
+
+    encoding = choose_encoding(accept_encoding)
+    etag = view.etag(encoding)
+    headers = {
+        "ETag": etag,
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "no-cache",
+        "X-Catalog-Version": str(snapshot.version),
+    }
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(content=view.encoded(encoding), media_type="application/json", headers=headers)
+
+
+@router.post("/{agent_id}/execute", status_code=202)
+async def execute_agent(
+    agent_id: int,
+    body: ExecuteAgentRequest,
+    idempotency_key: Optional[str] = Header(default=None, max_length=100),
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_database)
+):
+    """
+    Постановка агента в очередь выполнения
+    Оплата списывается сразу, результат доступен через статус выполнения.
+    Повтор запроса с тем же Idempotency-Key возвращает уже созданное выполнение.
+    Для агентов с кэшем результатов одинаковые входные данные завершают
+    выполнение сразу, без очереди и контейнера.
+    """
+    agent = await db.get(Agent, agent_id)
+    if agent is None or agent.status != AgentStatus.ACTIVE:
+        raise HTTPException(status_code=404, detail="Агент не найден")
+
+    # До списания оплаты: невалидный запуск не должен стоить денег
+    try:
+        agent_schemas.validate_input(agent, body.input_data)
+    except SchemaValidationError as e:
+        raise HTTPException(status_code=422, detail={"message": e.message, "path": e.path})
+    except InvalidAgentSchema as e:
+        logger.error("Некорректная input_schema агента %s: %s", agent.name, e)
+        raise HTTPException(status_code=503, detail="Агент временно недоступен")
+
+    # Повтор запроса после успешного списания не должен упираться в остаток
+    key = f"execute:{user.id}:{idempotency_key}" if idempotency_key else None
+    if key is not None:
+        previous = await _idempotent_execution(db, LedgerEntry.idempotency_key == key)
+        if previous is not None:
+            if previous.agent_id != agent.id:
+                raise HTTPException(status_code=409, detail=f"Ключ {key} использован для другой операции")
+            return _execution_response(previous)
+
+    commission = calculate_commission(agent.base_price, user.get_commission_rate())
+    total = agent.base_price + commission
+    # Остаток здесь - предварительная проверка, окончательная - в UPDATE журнала
+    if not user.can_execute_agent(total):
+        raise HTTPException(status_code=402, detail="Недостаточно средств или нет NFT-доступа")
+
+    execution = AgentExecution(
+        execution_id=str(uuid.uuid4()),
+        user_id=user.id,
+        agent_id=agent.id,
+        input_data=body.input_data,
+        price_paid=agent.base_price,
+        commission_paid=commission
+    )
+    # Сохраненный результат: выполнение завершается сразу, оплата списывается как обычно
+    cached = await agent_result_cache.get(agent, body.input_data)
+    if cached is not None:
+        execution.complete_from_cache(cached.output_data, cached.logs)
+    payment = Transaction(
+        transaction_id=str(uuid.uuid4()),
+        user_id=user.id,
+        execution=execution,
+        type=TransactionType.PAYMENT,
+        status=TransactionStatus.COMPLETED,
+        amount=agent.base_price,
+        commission=commission,
+        total_amount=total,
+        description=f"Payment for agent {agent.name}",
+        confirmed_at=datetime.utcnow()
+    )
+    db.add_all([execution, payment])
+    await db.flush()
+
+    key = key or f"execution:{execution.execution_id}"
+    try:
+        posting = await ledger.post_entry(db, user.id, -total, key, transaction_id=payment.id, description=payment.description)
+    except ledger.InsufficientFunds:
+        await db.rollback()
+        raise HTTPException(status_code=402, detail="Недостаточно средств")
+    except ledger.IdempotencyConflict as e:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if posting.replayed:
+        await db.rollback()
+        previous = await _idempotent_execution(db, LedgerEntry.id == posting.entry_id)
+        if previous is None:
+            raise HTTPException(status_code=409, detail="Idempotency-Key использован для другой операции")
+        return _execution_response(previous)
+
+    await db.commit()
+
+    # Статус pending публикуется до постановки в очередь, чтобы не обогнать события воркера
+    await execution_events.publish_status(execution)
+    if cached is not None:
+        logger.info(
+            "Выполнение %s агента %s завершено из кэша (результат %s)",
+            execution.execution_id, agent.name, cached.execution_id
+        )
+    else:
+        await agent_scheduler.enqueue(execution, premium=user.is_premium)
+        logger.info("Выполнение %s агента %s поставлено в очередь", execution.execution_id, agent.name)
+
+    return _execution_response(execution)
+
+
+def _execution_response(execution: AgentExecution) -> dict:
+    return {
+        "execution_id": execution.execution_id,
+        "status": execution.status.value,
+        "cache_hit": bool(execution.cache_hit)
+    }
+
+
+async def _idempotent_execution(db: AsyncSession, entry_filter) -> Optional[AgentExecution]:
+    """Выполнение, оплаченное записью журнала"""
+    return await db.scalar(
+        select(AgentExecution)
+        .join(Transaction, Transaction.execution_id == AgentExecution.id)
+        .join(LedgerEntry, LedgerEntry.transaction_id == Transaction.id)
+        .where(entry_filter)
+    )
+
+
+async def _get_user_execution(db: AsyncSession, execution_id: str, user: User) -> AgentExecution:
+    result = await db.execute(
+        select(AgentExecution)
+        .options(selectinload(AgentExecution.agent))
+        .where(
+            AgentExecution.execution_id == execution_id,
+            AgentExecution.user_id == user.id
+        )
+    )
+    execution = result.scalar_one_or_none()
+    if execution is None:
+        raise HTTPException(status_code=404, detail="Выполнение не найдено")
+    return execution
+
+
+@router.get("/executions")
+async def list_executions(
+    status: Optional[List[ExecutionStatus]] = Query(default=None),
+    cursor: Optional[str] = Query(default=None, max_length=200),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    include_data: bool = Query(default=False),
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_database)
+):
+    """
+    История выполнений пользователя, новые первыми
+    Постраничная выдача по курсору next_cursor; input_data, output_data и
+    logs не загружаются, пока не запрошен include_data.
+    """
+    statement = (
+        select(AgentExecution)
+        .options(selectinload(AgentExecution.agent), defer(AgentExecution.logs))
+        .where(AgentExecution.user_id == user.id)
+    )
+    if not include_data:
+        statement = statement.options(defer(AgentExecution.input_data), defer(AgentExecution.output_data))
+    if status:
+        statement = statement.where(AgentExecution.status.in_(status))
+    try:
+        statement = keyset_page(statement, AgentExecution.created_at, AgentExecution.id, cursor, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    executions, next_cursor = split_page((await db.execute(statement)).scalars().all(), limit)
+    if include_data:
+        await asyncio.gather(*(execution_archive.load_payload(execution) for execution in executions))
+    return {
+        "executions": [execution.to_dict(include_data=include_data) for execution in executions],
+        "next_cursor": next_cursor
+    }
+
+
+@router.get("/executions/{execution_id}")
+async def get_execution(
+    execution_id: str,
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_database)
+):
+    """Статус выполнения агента (результат старых выполнений читается из архива)"""
+    execution = await _get_user_execution(db, execution_id, user)
+    await execution_archive.load_payload(execution)
+    return execution.to_dict()
+
+
+@router.get("/executions/{execution_id}/events")
+async def stream_execution_events(
+    execution_id: str,
+    last_event_id: Optional[str] = Query(default=None),
+    last_event_id_header: Optional[str] = Header(default=None, alias="Last-Event-ID"),
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_database)
+):
+    """
+    События выполнения (SSE)
+    Переподключение продолжает поток с Last-Event-ID.
+    """
+    execution = await _get_user_execution(db, execution_id, user)
+    # Соединение с БД не должно удерживаться на время потока
+    await db.close()
+
+    async def stream():
+        if execution.is_completed and not await execution_events.has_events(execution_id):
+            # Поток событий уже удален по TTL: отдаем итоговый статус из БД
+            event, data = execution_events.status_event(execution)
+            yield execution_events.format_sse(("0-0", event, data))
+            return
+        async for event in execution_events.follow(execution_id, last_event_id_header or last_event_id or "0"):
+            yield ": keep-alive\n\n" if event is None else execution_events.format_sse(event)
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,63 @@
+"""
+Вход через Telegram WebApp
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+
+from app.core.database import get_async_database
+from app.core.security import AuthError, telegram_verifier, token_verifier
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+class TelegramInitData(BaseModel):
+    init_data: str = Field(..., min_length=1, max_length=4096)
+
+
+@router.post("/verify")
+async def verify_telegram(body: TelegramInitData, db: AsyncSession = Depends(get_async_database)):
+    """
+    Проверка initData Telegram WebApp и выдача токена сессии
+    Дальнейшие запросы передают токен в заголовке Authorization: Bearer.
+    """
+    try:
+        data = telegram_verifier.verify(body.init_data)
+    except (AuthError, ValueError) as e:
+        raise HTTPException(status_code=401, detail=str(e))
+
+    telegram_user = data.get("user") or {}
+    if "id" not in telegram_user:
+        raise HTTPException(status_code=401, detail="В данных нет пользователя Telegram")
+
+    user = await db.scalar(select(User).where(User.telegram_id == telegram_user["id"]))
+    if user is None:
+        user = User(telegram_id=telegram_user["id"])
+        db.add(user)
+    user.username = telegram_user.get("username")
+    user.first_name = telegram_user.get("first_name")
+    user.last_name = telegram_user.get("last_name")
+    user.language_code = telegram_user.get("language_code") or user.language_code
+    user.update_activity()
+    await db.commit()
+
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="Пользователь заблокирован")
+
+    token, expires_in = token_verifier.issue({
+        "sub": str(user.telegram_id),
+        "uid": user.id,
+        "premium": bool(user.is_premium)
+    })
+    return {
+        "access_token": token,
+        "token_type": "bearer",
+        "expires_in": expires_in,
+        "user": user.to_dict()
+    }
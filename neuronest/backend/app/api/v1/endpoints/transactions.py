@@ -0,0 +1,48 @@
+"""
+Эндпоинты истории транзакций
+"""
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import defer
+from typing import List, Optional
+
+from app.api.deps import get_current_user
+from app.core.database import get_async_database
+from app.core.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, InvalidCursor, keyset_page, split_page
+from app.models.transaction import Transaction, TransactionStatus, TransactionType
+from app.models.user import User
+
+router = APIRouter()
+
+
+@router.get("")
+async def list_transactions(
+    status: Optional[List[TransactionStatus]] = Query(default=None),
+    type: Optional[TransactionType] = Query(default=None),
+    cursor: Optional[str] = Query(default=None, max_length=200),
+    limit: int = Query(default=DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_database)
+):
+    """История транзакций пользователя, новые первыми (постранично по next_cursor)"""
+    statement = (
+        select(Transaction)
+        .options(defer(Transaction.extra_data))
+        .where(Transaction.user_id == user.id)
+    )
+    if status:
+        statement = statement.where(Transaction.status.in_(status))
+    if type:
+        statement = statement.where(Transaction.type == type)
+    try:
+        statement = keyset_page(statement, Transaction.created_at, Transaction.id, cursor, limit)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    transactions, next_cursor = split_page((await db.execute(statement)).scalars().all(), limit)
+    return {
+        "transactions": [transaction.to_dict() for transaction in transactions],
+        "next_cursor": next_cursor
+    }
@@ -0,0 +1,91 @@
+"""
+Эндпоинты проверки NFT-доступа кошельков
+"""
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+from typing import List
+import json
+import logging
+import re
+
+from app.api.deps import get_admin_user
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.user import User
+from app.services.nft_access import nft_access, save_access_results
+from ton_api import ProviderError, to_raw_address
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+RAW_ADDRESS_RE = re.compile(r"-?\d+:[0-9a-f]{64}")
+
+
+class WalletCheckRequest(BaseModel):
+    wallet_address: str = Field(..., min_length=10, max_length=100)
+
+
+class BulkWalletCheckRequest(BaseModel):
+    # Лимит проверяется до разбора адресов валидатором
+    wallet_addresses: List[str] = Field(..., min_length=1, max_length=settings.NFT_BULK_MAX_WALLETS)
+
+    @field_validator("wallet_addresses")
+    @classmethod
+    def validate_addresses(cls, addresses: List[str]) -> List[str]:
+        """Адреса TON без повторов (в исходной форме: по ней ищутся пользователи)"""
+        invalid = []
+        for address in addresses:
+            try:
+                valid = RAW_ADDRESS_RE.fullmatch(to_raw_address(address)) is not None
+            except ValueError:
+                valid = False
+            if not valid:
+                invalid.append(address[:100])
+        if invalid:
+            raise ValueError(f"Некорректные адреса TON: {', '.join(invalid[:10])}")
+        return list(dict.fromkeys(address.strip() for address in addresses))
+
+
+@router.post("/check-nft")
+async def check_wallet_nft(request: WalletCheckRequest):
+    """Проверка NFT в кошельке"""
+    try:
+        return await nft_access.check(request.wallet_address)
+    except ProviderError as e:
+        # Без ответа TON API доступ не подтверждается и не отзывается
+        logger.warning("Проверка NFT %s: %s", request.wallet_address, e)
+        raise HTTPException(status_code=503, detail="TON API временно недоступен")
+
+
+@router.post("/check-nft/bulk")
+async def check_wallets_nft_bulk(request: BulkWalletCheckRequest, admin: User = Depends(get_admin_user)):
+    """
+    Пакетная проверка NFT-доступа (администраторы и операторы)
+    Результаты отдаются в NDJSON по мере готовности, затем записываются
+    в users одним пакетным UPDATE. Кошельки, для которых TON API не ответил,
+    помечаются error и в users не записываются.
+    """
+    logger.info("Пакетная проверка NFT: %d кошельков, пользователь %s", len(request.wallet_addresses), admin.id)
+
+    async def stream():
+        results = []
+        async for result in nft_access.check_many(
+            request.wallet_addresses,
+            concurrency=settings.NFT_BULK_CONCURRENCY
+        ):
+            results.append(result)
+            yield json.dumps(result, ensure_ascii=False) + "\n"
+
+        try:
+            async with AsyncSessionLocal() as db:
+                updated = await save_access_results(db, results)
+            failed = sum(1 for result in results if "error" in result)
+            yield json.dumps({"done": True, "checked": len(results), "failed": failed, "saved": updated}) + "\n"
+        except Exception as e:
+            logger.error("Ошибка записи результатов проверки NFT: %s", e, exc_info=True)
+            yield json.dumps({"done": True, "checked": len(results), "error": "Ошибка записи результатов"}) + "\n"
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
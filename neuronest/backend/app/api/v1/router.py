@@ -4,15 +4,22 @@
 
 from fastapi import APIRouter
 
+from app.api.v1.endpoints import admin, agents, telegram, transactions, wallet
+
 api_router = APIRouter()
 
+api_router.include_router(telegram.router, prefix="/telegram", tags=["telegram"])
+api_router.include_router(wallet.router, prefix="/wallet", tags=["wallet"])
+api_router.include_router(agents.router, prefix="/agents", tags=["agents"])
+api_router.include_router(transactions.router, prefix="/transactions", tags=["transactions"])
+# Состояние пулов БД и реплик - только для ADMIN_TELEGRAM_IDS
+api_router.include_router(admin.router, prefix="/admin", tags=["admin"])
+
 # TODO: Добавить импорты роутеров когда они будут созданы
-# from app.api.v1.endpoints import agents, users, transactions
+# from app.api.v1.endpoints import users
 
 # TODO: Подключить роутеры
-# api_router.include_router(agents.router, prefix="/agents", tags=["agents"])
 # api_router.include_router(users.router, prefix="/users", tags=["users"])
-# api_router.include_router(transactions.router, prefix="/transactions", tags=["transactions"])
 
 # Временный тестовый эндпоинт
 @api_router.get("/test")
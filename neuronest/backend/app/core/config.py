@@ -4,7 +4,7 @@
 
 from pydantic_settings import BaseSettings
 from pydantic import Field, validator
-from typing import List, Optional
+from typing import Dict, List, Optional
 import os
 
 
@@ -25,6 +25,9 @@ class Settings(BaseSettings):
     DB_POOL_SIZE: int = Field(default=20, description="Размер пула соединений")
     DB_MAX_OVERFLOW: int = Field(default=30, description="Максимальное переполнение пула")
     DB_POOL_TIMEOUT: int = Field(default=30, description="Таймаут пула соединений")
+    DATABASE_REPLICA_URLS: str = Field(default="", description="URL реплик PostgreSQL для чтения через запятую")
+    DATABASE_REPLICA_MAX_LAG: float = Field(default=2.0, description="Максимальное отставание реплики в секундах")
+    DATABASE_REPLICA_HEALTH_INTERVAL: float = Field(default=5.0, description="Интервал проверки реплик в секундах")
     
     # =============================================================================
     # REDIS
@@ -38,6 +41,9 @@ class Settings(BaseSettings):
     JWT_SECRET_KEY: str = Field(..., description="Секретный ключ для JWT")
     JWT_ALGORITHM: str = Field(default="HS256", description="Алгоритм JWT")
     JWT_EXPIRATION_HOURS: int = Field(default=24, description="Срок действия JWT в часах")
+    JWT_ACCESS_TOKEN_MINUTES: int = Field(default=60, description="Срок действия токена сессии в минутах")
+    JWT_CACHE_SIZE: int = Field(default=10000, description="Недавно проверенных токенов в LRU кэше процесса")
+    ADMIN_TELEGRAM_IDS: str = Field(default="", description="Telegram id администраторов и операторов (через запятую)")
     
     ENCRYPTION_KEY: str = Field(..., description="Ключ шифрования")
     FERNET_KEY: str = Field(..., description="Ключ Fernet для шифрования")
@@ -49,6 +55,7 @@ class Settings(BaseSettings):
     TELEGRAM_BOT_USERNAME: str = Field(..., description="Username Telegram бота")
     TELEGRAM_WEBHOOK_URL: Optional[str] = Field(default=None, description="URL webhook")
     TELEGRAM_SECRET_TOKEN: Optional[str] = Field(default=None, description="Секретный токен webhook")
+    TELEGRAM_INIT_DATA_MAX_AGE: int = Field(default=86400, description="Максимальный возраст initData WebApp в секундах")
     
     # =============================================================================
     # TON BLOCKCHAIN
@@ -63,6 +70,20 @@ class Settings(BaseSettings):
     NOT_PUNKS_GIRLS_COLLECTION: str = Field(..., description="Адрес коллекции NOT Punks Girls")
     TNO_ELEMENTAL_KIDS_COLLECTION: str = Field(..., description="Адрес коллекции TNO Elemental Kids")
     
+    # Кэш владения NFT (секунды)
+    NFT_CACHE_TTL: int = Field(default=60, description="TTL кэша NFT кошелька")
+    NFT_CACHE_STALE_TTL: int = Field(default=600, description="Срок, в течение которого можно отдавать устаревшие данные NFT")
+    NFT_CACHE_UPSTREAM_TIMEOUT: float = Field(default=3.0, description="Ожидание TON API перед отдачей устаревших данных")
+    
+    # Локальный индекс владельцев NFT
+    NFT_INDEX_ENABLED: bool = Field(default=False, description="Проверять доступ по локальному индексу владельцев NFT")
+    NFT_INDEX_RESYNC_INTERVAL: int = Field(default=3600, description="Интервал полной синхронизации индекса в секундах")
+    NFT_INDEX_PAGE_SIZE: int = Field(default=1000, description="Размер страницы при выгрузке коллекции")
+    
+    # Пакетная проверка NFT-доступа
+    NFT_BULK_MAX_WALLETS: int = Field(default=1000, description="Максимум кошельков в одном пакетном запросе")
+    NFT_BULK_CONCURRENCY: int = Field(default=20, description="Параллельных проверок в пакетном запросе")
+    
     # NOTPUNKS Jetton
     NOTPUNKS_JETTON_MASTER: str = Field(..., description="Адрес мастер-контракта NOTPUNKS jetton")
     NOTPUNKS_JETTON_DECIMAL: int = Field(default=9, description="Десятичные знаки NOTPUNKS jetton")
@@ -73,6 +94,18 @@ class Settings(BaseSettings):
     RATE_LIMIT_REQUESTS_PER_MINUTE: int = Field(default=60, description="Лимит запросов в минуту")
     RATE_LIMIT_BURST: int = Field(default=10, description="Burst лимит")
     RATE_LIMIT_PREMIUM_MULTIPLIER: int = Field(default=5, description="Множитель для премиум пользователей")
+    RATE_LIMIT_IP_REQUESTS_PER_MINUTE: int = Field(default=300, description="Лимит запросов в минуту с одного IP до аутентификации")
+    RATE_LIMIT_IP_BURST: int = Field(default=50, description="Burst лимит по IP до аутентификации")
+    
+    # =============================================================================
+    # WEBSOCKET
+    # =============================================================================
+    WS_SEND_QUEUE_SIZE: int = Field(default=100, description="Размер очереди отправки на соединение")
+    WS_BACKPRESSURE_POLICY: str = Field(default="drop", description="При переполнении очереди: drop или disconnect")
+    WS_HEARTBEAT_INTERVAL: int = Field(default=30, description="Интервал ping в секундах")
+    WS_HEARTBEAT_TIMEOUT: int = Field(default=90, description="Закрывать соединения без ответа дольше, секунд")
+    WS_MAX_FOLLOWS: int = Field(default=5, description="Отслеживаемых выполнений на соединение (каждое держит соединение Redis)")
+    WS_MAX_TOPICS: int = Field(default=20, description="Подписок на темы на соединение")
     
     # =============================================================================
     # AI АГЕНТЫ
@@ -80,7 +113,35 @@ class Settings(BaseSettings):
     AGENTS_DOCKER_REGISTRY: str = Field(default="neuronest/agents", description="Docker registry для агентов")
     AGENTS_EXECUTION_TIMEOUT: int = Field(default=300, description="Таймаут выполнения агентов в секундах")
     AGENTS_MAX_CONCURRENT: int = Field(default=10, description="Максимальное количество одновременных агентов")
-    AGENTS_CLEANUP_AFTER_HOURS: int = Field(default=24, description="Время жизни результатов в часах")
+    AGENTS_CLEANUP_AFTER_HOURS: int = Field(default=24, description="Через сколько часов результаты переносятся в архив")
+    AGENTS_WORKER_CONCURRENCY: int = Field(default=10, description="Воркеров выполнения в одном процессе agent_worker")
+    AGENTS_USER_MAX_CONCURRENT: int = Field(default=2, description="Одновременных выполнений на пользователя")
+    AGENTS_PREMIUM_USER_MAX_CONCURRENT: int = Field(default=5, description="Одновременных выполнений на премиум пользователя")
+    AGENTS_POOL_ENABLED: bool = Field(default=False, description="Пул теплых контейнеров для популярных агентов")
+    AGENTS_POOL_MAX_CONTAINERS: int = Field(default=20, description="Всего теплых контейнеров в процессе воркера")
+    AGENTS_POOL_MAX_PER_AGENT: int = Field(default=5, description="Максимум теплых контейнеров на агента")
+    AGENTS_POOL_RECYCLE: bool = Field(default=False, description="Возвращать контейнер в пул после успешного выполнения")
+    AGENTS_POOL_MAX_USES: int = Field(default=50, description="Максимум выполнений в одном контейнере при повторном использовании")
+    AGENTS_POOL_ACTIVE_WINDOW_HOURS: int = Field(default=24, description="Окно активности агентов для расчета размера пула")
+    AGENTS_POOL_RECONCILE_INTERVAL: int = Field(default=60, description="Интервал сверки пула с каталогом в секундах")
+    AGENTS_POOL_IDLE_COMMAND: str = Field(default="sleep infinity", description="Команда ожидания теплого контейнера")
+    AGENTS_LOGS_TAIL_BYTES: int = Field(default=65536, description="Хвост вывода контейнера, сохраняемый в AgentExecution.logs")
+    EXECUTION_EVENTS_MAXLEN: int = Field(default=2000, description="Максимум событий в потоке одного выполнения")
+    EXECUTION_EVENTS_TTL: int = Field(default=86400, description="Время хранения потока событий выполнения в секундах")
+    AGENT_CATALOG_MIN_REBUILD_SECONDS: float = Field(default=5.0, description="Минимальный интервал пересборки каталога агентов")
+    AGENT_SCHEMA_CACHE_SIZE: int = Field(default=1024, description="Скомпилированных JSON Schema агентов в памяти процесса")
+    AGENT_STATS_FLUSH_INTERVAL: int = Field(default=30, description="Интервал записи статистики агентов в БД в секундах")
+    AGENT_STATS_FLUSH_BATCH: int = Field(default=500, description="Агентов в одном пакетном UPDATE статистики")
+    AGENT_STATS_RESERVOIR_SIZE: int = Field(default=1000, description="Последних значений времени для перцентилей без t-digest")
+    AGENTS_PREMIUM_WEIGHT: int = Field(default=4, description="Выборок из премиум очереди на одну выборку из обычной")
+    AGENTS_ARCHIVE_URL: str = Field(default="file://./data/execution_archive", description="Хранилище архива результатов выполнений")
+    AGENTS_ARCHIVE_BATCH: int = Field(default=200, description="Выполнений в одной транзакции архивации")
+    AGENTS_ARCHIVE_INTERVAL: int = Field(default=300, description="Интервал запуска архивации в секундах")
+    AGENTS_ARCHIVE_ZSTD_LEVEL: int = Field(default=3, description="Уровень сжатия zstd для архива")
+    AGENT_RESULT_CACHE_ENABLED: bool = Field(default=True, description="Кэш результатов агентов с включенным result_cache_ttl")
+    AGENT_RESULT_CACHE_MAX_ENTRIES: int = Field(default=10000, description="Максимум результатов в кэше Redis (LRU)")
+    AGENT_RESULT_CACHE_MAX_BYTES: int = Field(default=262144, description="Максимальный размер сжатого результата в кэше")
+    AGENT_RESULT_CACHE_ZSTD_LEVEL: int = Field(default=3, description="Уровень сжатия zstd для кэша результатов")
     
     # API ключи по умолчанию (пользователи могут переопределить)
     OPENAI_API_KEY: Optional[str] = Field(default=None, description="OpenAI API ключ")
@@ -93,6 +154,9 @@ class Settings(BaseSettings):
     # =============================================================================
     PAYMENT_CONFIRMATION_BLOCKS: int = Field(default=3, description="Количество блоков для подтверждения платежа")
     PAYMENT_TIMEOUT_MINUTES: int = Field(default=15, description="Таймаут платежа в минутах")
+    PAYMENT_RECEIVER_ADDRESS: Optional[str] = Field(default=None, description="Кошелек платформы для приема платежей (без него наблюдатель выключен)")
+    PAYMENT_JETTON_WALLET: Optional[str] = Field(default=None, description="Jetton кошелек NOTPUNKS платформы (проверка отправителя уведомлений)")
+    PAYMENT_WATCH_INTERVAL: float = Field(default=5.0, description="Интервал опроса новых блоков в секундах")
     COMMISSION_RATE: float = Field(default=0.07, description="Комиссия платформы (7%)")
     PREMIUM_COMMISSION_RATE: float = Field(default=0.03, description="Комиссия для премиум пользователей (3%)")
     
@@ -109,10 +173,14 @@ class Settings(BaseSettings):
     # =============================================================================
     LOG_LEVEL: str = Field(default="INFO", description="Уровень логирования")
     LOG_FORMAT: str = Field(default="json", description="Формат логов")
+    LOG_QUEUE_SIZE: int = Field(default=10000, description="Размер очереди записей лога (при переполнении записи отбрасываются)")
+    LOG_RATE_LIMITS: str = Field(default="", description="Лимиты записей ниже WARNING в секунду по логгерам: logger=N через запятую")
+    LOG_DEBUG_SAMPLE_RATE: float = Field(default=1.0, description="Доля сохраняемых DEBUG записей")
     SENTRY_DSN: Optional[str] = Field(default=None, description="Sentry DSN для отслеживания ошибок")
     
     PROMETHEUS_ENABLED: bool = Field(default=True, description="Включить Prometheus метрики")
     PROMETHEUS_PORT: int = Field(default=9090, description="Порт Prometheus")
+    PROMETHEUS_MULTIPROC_DIR: Optional[str] = Field(default=None, description="Каталог метрик для нескольких воркеров")
     
     # =============================================================================
     # HTTP/CORS
@@ -152,6 +220,26 @@ class Settings(BaseSettings):
             return [host.strip() for host in self.ALLOWED_HOSTS.split(',')]
         return self.ALLOWED_HOSTS
     
+    @property
+    def log_rate_limits(self) -> Dict[str, float]:
+        """Лимиты логгеров: имя логгера -> записей в секунду"""
+        limits = {}
+        for item in self.LOG_RATE_LIMITS.split(','):
+            if '=' in item:
+                name, rate = item.split('=', 1)
+                limits[name.strip()] = float(rate)
+        return limits
+    
+    @property
+    def admin_telegram_ids(self) -> List[int]:
+        """Telegram id с доступом к служебным эндпоинтам"""
+        return [int(value) for value in self.ADMIN_TELEGRAM_IDS.split(',') if value.strip()]
+    
+    @property
+    def database_replica_urls(self) -> List[str]:
+        """Список URL реплик для чтения"""
+        return [url.strip() for url in self.DATABASE_REPLICA_URLS.split(',') if url.strip()]
+    
     @property
     def database_config(self) -> dict:
         """Конфигурация базы данных"""
@@ -1,14 +1,27 @@
 """
 Конфигурация базы данных NeuroNest
+
+Запросы API идут через RoutingSession: при заданных DATABASE_REPLICA_URLS
+чтения уходят в исправные реплики по кругу, запись и все последующие
+запросы сессии - в primary. Фоновые сервисы используют AsyncSessionLocal
+и всегда работают с primary.
 """
 
-from sqlalchemy import create_engine, MetaData, text
+from sqlalchemy import create_engine, MetaData, event, text
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool, StaticPool
+from collections import deque
+import asyncio
+import itertools
 import logging
-from typing import Generator
+import time
+from typing import AsyncGenerator, Dict, Generator, List, Optional
 
+from app.core import metrics
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
@@ -27,15 +40,383 @@ metadata = MetaData(
 # Базовый класс для моделей
 Base = declarative_base(metadata=metadata)
 
+
+class PoolStats:
+    """Статистика пула соединений: выдачи, ожидание и удержание соединений"""
+    
+    def __init__(self, name: str, window: int = 1000):
+        self.name = name
+        self.pool = None
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait_times = deque(maxlen=window)  # Секунды ожидания соединения из пула
+        self.hold_times = deque(maxlen=window)  # Секунды удержания соединения
+    
+    def record_wait(self, seconds: float, timed_out: bool = False) -> None:
+        """Учет ожидания соединения"""
+        self.wait_times.append(seconds)
+        self._wait_metric.observe(seconds)
+        if timed_out:
+            self.timeouts += 1
+            self._timeouts_metric.inc()
+    
+    def attach(self, pool) -> None:
+        """Подписка на события выдачи и возврата соединений"""
+        self.pool = pool
+        self._wait_metric = metrics.DB_POOL_WAIT.labels(self.name)
+        self._timeouts_metric = metrics.DB_POOL_TIMEOUTS.labels(self.name)
+        checked_out_metric = metrics.DB_POOL_CHECKED_OUT.labels(self.name)
+        overflow_metric = metrics.DB_POOL_OVERFLOW.labels(self.name)
+        
+        @event.listens_for(pool, "checkout")
+        def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+            self.checkouts += 1
+            connection_record.info["checkout_at"] = time.perf_counter()
+            checked_out_metric.inc()
+            if hasattr(pool, "overflow"):
+                overflow_metric.set(max(0, pool.overflow()))
+        
+        @event.listens_for(pool, "checkin")
+        def _on_checkin(dbapi_connection, connection_record):
+            checkout_at = connection_record.info.pop("checkout_at", None)
+            if checkout_at is not None:
+                self.hold_times.append(time.perf_counter() - checkout_at)
+                checked_out_metric.dec()
+            if hasattr(pool, "overflow"):
+                # Событие приходит до возврата в пул: соединение закрывается,
+                # если в пуле уже pool_size свободных соединений
+                overflow = pool.overflow()
+                if overflow > 0 and overflow >= pool.checkedout():
+                    overflow -= 1
+                overflow_metric.set(max(0, overflow))
+    
+    @staticmethod
+    def _percentile(values, q: float) -> float:
+        if not values:
+            return 0.0
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+    
+    def snapshot(self) -> Dict[str, object]:
+        """Текущее состояние пула"""
+        pool = self.pool
+        return {
+            "size": pool.size() if hasattr(pool, "size") else None,
+            "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+            "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait_p50_ms": round(self._percentile(self.wait_times, 0.5) * 1000, 3),
+            "wait_p95_ms": round(self._percentile(self.wait_times, 0.95) * 1000, 3),
+            "wait_max_ms": round(max(self.wait_times, default=0.0) * 1000, 3),
+            "hold_p50_ms": round(self._percentile(self.hold_times, 0.5) * 1000, 3),
+            "hold_p95_ms": round(self._percentile(self.hold_times, 0.95) * 1000, 3),
+        }
+
+
+pool_stats: Dict[str, PoolStats] = {}
+
+
+def _timed_pool(base_class, stats_name: str):
+    """Класс пула, замеряющий ожидание соединения при checkout"""
+    
+    class TimedPool(base_class):
+        def _do_get(self):
+            stats = pool_stats.get(stats_name)
+            start = time.perf_counter()
+            timed_out = False
+            try:
+                return super()._do_get()
+            except PoolTimeoutError:
+                timed_out = True
+                raise
+            finally:
+                if stats:
+                    stats.record_wait(time.perf_counter() - start, timed_out)
+    
+    TimedPool.__name__ = f"Timed{base_class.__name__}"
+    return TimedPool
+
+
+def to_async_url(url: str) -> URL:
+    """URL базы данных с асинхронным драйвером (asyncpg / aiosqlite)"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        return parsed.set(drivername="postgresql+asyncpg")
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite")
+    return parsed
+
+
+def _pool_kwargs(url, base_pool_class, stats_name: str) -> dict:
+    """Параметры пула из настроек (SQLite использует пул по умолчанию)"""
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    config = settings.database_config
+    return {
+        "poolclass": _timed_pool(base_pool_class, stats_name),
+        "pool_size": config["pool_size"],
+        "max_overflow": config["max_overflow"],
+        "pool_timeout": config["pool_timeout"],
+    }
+
+
+def _register_pool_stats(name: str, pool) -> PoolStats:
+    stats = PoolStats(name)
+    stats.attach(pool)
+    pool_stats[name] = stats
+    return stats
+
+
 # Создание движка базы данных
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
-    echo=settings.DEBUG
+    echo=settings.DEBUG,
+    **_pool_kwargs(settings.DATABASE_URL, QueuePool, "primary")
+)
+_register_pool_stats("primary", engine.pool)
+
+# Асинхронный движок для async def эндпоинтов (не блокирует event loop)
+async_engine = create_async_engine(
+    to_async_url(settings.DATABASE_URL),
+    pool_pre_ping=True,
+    echo=settings.DEBUG,
+    **_pool_kwargs(settings.DATABASE_URL, AsyncAdaptedQueuePool, "primary_async")
 )
+_register_pool_stats("primary_async", async_engine.sync_engine.pool)
 
-# Фабрика сессий
+# Фабрики сессий
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+
+# =============================================================================
+# Реплики для чтения
+# =============================================================================
+
+# Отставание реплики в секундах: 0, если полученный WAL применен; NULL - нет
+# соединения с primary и отставание неизвестно
+REPLICA_LAG_SQL = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+# Ключи session.info маршрутизации
+PRIMARY_PINNED = "primary_pinned"
+SESSION_REPLICA = "replica"
+
+# Пользователь недавно менял данные: его чтения идут в primary
+PRIMARY_READS_KEY = "db:primary-reads:user:{user_id}"
+
+
+class Replica:
+    """Реплика для чтения и результат последней проверки"""
+    
+    def __init__(self, name: str, url: str):
+        self.name = name
+        self.url = make_url(url).render_as_string(hide_password=True)
+        self.engine = create_async_engine(
+            to_async_url(url),
+            pool_pre_ping=True,
+            echo=settings.DEBUG,
+            **_pool_kwargs(url, AsyncAdaptedQueuePool, name)
+        )
+        _register_pool_stats(name, self.engine.sync_engine.pool)
+        # None - еще не проверялась; до первой проверки реплика не получает запросов
+        self.healthy: Optional[bool] = None
+        self.lag: Optional[float] = None
+        self.error: Optional[str] = None
+        self._lag_metric = metrics.DB_REPLICA_LAG.labels(name)
+        self._healthy_metric = metrics.DB_REPLICA_HEALTHY.labels(name)
+        self._healthy_metric.set(0)
+        
+        @event.listens_for(self.engine.sync_engine, "handle_error")
+        def _on_error(context):
+            # Обрыв соединения: реплика исключается до следующей проверки
+            if context.is_disconnect:
+                self.set_health(False, self.lag, str(context.original_exception))
+    
+    def set_health(self, healthy: bool, lag: Optional[float], error: Optional[str] = None) -> None:
+        if healthy != self.healthy:
+            if healthy:
+                logger.info("Реплика %s принимает чтения, отставание %.2fс", self.name, lag)
+            else:
+                logger.warning("Реплика %s исключена: %s", self.name, error or f"отставание {lag}с")
+        self.healthy = healthy
+        self.lag = lag
+        self.error = error
+        self._healthy_metric.set(1 if healthy else 0)
+        if lag is not None:
+            self._lag_metric.set(lag)
+    
+    def status(self) -> Dict[str, object]:
+        return {"name": self.name, "url": self.url, "healthy": self.healthy, "lag_seconds": self.lag, "error": self.error}
+
+
+class ReplicaSet:
+    """Реплики для чтения: проверка отставания и выбор по кругу"""
+    
+    CHECK_TIMEOUT_SECONDS = 2.0
+    
+    def __init__(self, urls: List[str], max_lag: float = None, interval: float = None):
+        self.replicas = [Replica(f"replica{number}_async", url) for number, url in enumerate(urls, 1)]
+        self.max_lag = settings.DATABASE_REPLICA_MAX_LAG if max_lag is None else max_lag
+        self.interval = settings.DATABASE_REPLICA_HEALTH_INTERVAL if interval is None else interval
+        self._counter = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+    
+    def choose(self) -> Optional[Replica]:
+        """Следующая исправная реплика; None - читать из primary"""
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+    
+    async def check(self) -> None:
+        """Проверка доступности и отставания всех реплик"""
+        await asyncio.gather(*(self._check(replica) for replica in self.replicas))
+    
+    async def _check(self, replica: Replica) -> None:
+        try:
+            lag = await asyncio.wait_for(self._lag(replica), timeout=self.CHECK_TIMEOUT_SECONDS)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            replica.set_health(False, None, str(e) or type(e).__name__)
+            return
+        if lag is None:
+            replica.set_health(False, None, "нет соединения с primary")
+        else:
+            replica.set_health(lag <= self.max_lag, lag)
+    
+    @staticmethod
+    async def _lag(replica: Replica) -> Optional[float]:
+        async with replica.engine.connect() as conn:
+            if conn.dialect.name != "postgresql":
+                await conn.execute(text("SELECT 1"))
+                return 0.0
+            lag = await conn.scalar(REPLICA_LAG_SQL)
+            return None if lag is None else float(lag)
+    
+    def start(self) -> None:
+        """Запуск периодической проверки реплик (в каждом процессе API)"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+    
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+    
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.check()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Ошибка проверки реплик: %s", e, exc_info=True)
+            await asyncio.sleep(self.interval)
+    
+    def status(self) -> List[Dict[str, object]]:
+        return [replica.status() for replica in self.replicas]
+    
+    async def dispose(self) -> None:
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+replicas = ReplicaSet(settings.database_replica_urls)
+
+
+def _is_read(clause) -> bool:
+    """SELECT без FOR UPDATE; текстовые запросы считаются записью"""
+    return bool(getattr(clause, "is_select", False)) and getattr(clause, "_for_update_arg", None) is None
+
+
+class RoutingSession(Session):
+    """
+    Сессия с чтением из реплик
+    Чтения идут в реплику, выбранную при первом чтении сессии. flush, DML
+    и прочие запросы закрепляют сессию (запрос API) за primary.
+    """
+    
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if not replicas.enabled or self.info.get(PRIMARY_PINNED):
+            return super().get_bind(mapper, clause=clause, **kw)
+        if self._flushing or not _is_read(clause):
+            self.info[PRIMARY_PINNED] = True
+            return super().get_bind(mapper, clause=clause, **kw)
+        replica = self.info.get(SESSION_REPLICA)
+        if replica is None:
+            replica = replicas.choose()
+            if replica is None:
+                return super().get_bind(mapper, clause=clause, **kw)
+            self.info[SESSION_REPLICA] = replica
+        return replica.engine.sync_engine
+
+
+RoutingSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+
+def use_primary(db: AsyncSession) -> None:
+    """Дальнейшие запросы сессии - в primary"""
+    db.info[PRIMARY_PINNED] = True
+
+
+def _primary_reads_ttl_ms() -> int:
+    # Реплика с допустимым отставанием может отстать еще на интервал проверки
+    return int((settings.DATABASE_REPLICA_MAX_LAG + settings.DATABASE_REPLICA_HEALTH_INTERVAL) * 1000)
+
+
+async def mark_user_write(user_id: int) -> None:
+    """Изменены баланс или выполнения пользователя: его чтения временно идут в primary"""
+    # Отметку ставим и без своих реплик: пишут и процессы без DATABASE_REPLICA_URLS
+    # (agent_worker), а читают из реплик процессы API
+    from app.core.redis import get_redis
+    redis = await get_redis()
+    if redis is None:
+        return
+    try:
+        await redis.set(PRIMARY_READS_KEY.format(user_id=user_id), "1", px=_primary_reads_ttl_ms())
+    except Exception as e:
+        logger.warning("Не удалось отметить запись пользователя %s: %s", user_id, e)
+
+
+async def read_your_writes(db: AsyncSession, user_id: int) -> None:
+    """Закрепление сессии за primary, если пользователь недавно менял данные"""
+    if not replicas.enabled or db.info.get(PRIMARY_PINNED):
+        return
+    from app.core.redis import get_redis
+    redis = await get_redis()
+    try:
+        # Без Redis отметки неизвестны: читаем из primary
+        recent = redis is None or await redis.exists(PRIMARY_READS_KEY.format(user_id=user_id))
+    except Exception as e:
+        logger.warning("Не удалось проверить запись пользователя %s: %s", user_id, e)
+        recent = True
+    if recent:
+        use_primary(db)
 
 
 def get_database():
@@ -47,11 +428,49 @@ def get_database():
         db.close()
 
 
+async def get_async_database() -> AsyncGenerator[AsyncSession, None]:
+    """Dependency для получения асинхронной сессии базы данных (чтение из реплик)"""
+    async with RoutingSessionLocal() as db:
+        yield db
+
+
+def get_pool_status() -> Dict[str, Dict[str, object]]:
+    """Состояние всех пулов соединений"""
+    return {name: stats.snapshot() for name, stats in pool_stats.items()}
+
+
+async def close_database() -> None:
+    """Закрытие пулов соединений"""
+    await replicas.stop()
+    await replicas.dispose()
+    await async_engine.dispose()
+    engine.dispose()
+
+
+def dialect_insert(db):
+    """INSERT с поддержкой ON CONFLICT для диалекта сессии"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
+def load_models() -> None:
+    """Импорт всех моделей, чтобы связи между ними были разрешимы"""
+    from app.models import agent, agent_search, ledger, nft_holding, transaction, user  # noqa: F401
+
+
 def init_database() -> None:
     """Инициализация базы данных"""
     try:
         # Создаем все таблицы
+        load_models()
         Base.metadata.create_all(bind=engine)
+        # create_all не добавляет новые индексы в уже существующие таблицы
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
         logger.info("✅ Таблицы базы данных созданы")
         
         # Создаем начальные данные
@@ -86,11 +505,11 @@ def create_initial_data() -> None:
             db.close()
 
 
-def create_demo_agents(db: Session) -> None:
-    """Создание демонстрационных AI агентов"""
-    from app.models.agent import Agent, AgentCategory, AgentStatus
+def demo_agent_data() -> List[dict]:
+    """Данные демонстрационных AI агентов"""
+    from app.models.agent import AgentCategory, AgentStatus
     
-    demo_agents = [
+    return [
         {
             "name": "crypto-portfolio-analyzer",
             "display_name": "Crypto Portfolio Analyzer",
@@ -130,6 +549,7 @@ def create_demo_agents(db: Session) -> None:
             "base_price": 3000000000,  # 3 NOTPUNKS
             "docker_image": "neuronest/agents:nft-valuator",
             "docker_tag": "latest",
+            "result_cache_ttl": 900,  # Оценка коллекции меняется вместе с рынком
             "rating": 88,
             "status": AgentStatus.ACTIVE,
             "author": "NeuroNest Team",
@@ -160,6 +580,7 @@ def create_demo_agents(db: Session) -> None:
             "base_price": 8000000000,  # 8 NOTPUNKS
             "docker_image": "neuronest/agents:contract-auditor",
             "docker_tag": "latest",
+            "result_cache_ttl": 86400,  # Аудит зависит только от кода контракта
             "rating": 92,
             "status": AgentStatus.ACTIVE,
             "author": "NeuroNest Team",
@@ -182,6 +603,13 @@ def create_demo_agents(db: Session) -> None:
             }
         }
     ]
+
+
+def create_demo_agents(db: Session) -> None:
+    """Создание демонстрационных AI агентов"""
+    from app.models.agent import Agent
+    
+    demo_agents = demo_agent_data()
     
     # Проверяем, существуют ли уже агенты
     existing_count = db.query(Agent).count()
@@ -218,4 +646,20 @@ def create_test_db() -> None:
     
     Base.metadata.create_all(bind=test_engine)
     
-    return sessionmaker(autocommit=False, autoflush=False, bind=test_engine) 
\ No newline at end of file
+    return sessionmaker(autocommit=False, autoflush=False, bind=test_engine)
+
+
+async def create_async_test_db() -> async_sessionmaker:
+    """
+    Создание асинхронной тестовой базы данных (aiosqlite)
+    """
+    test_engine = create_async_engine(
+        "sqlite+aiosqlite:///./test.db",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    
+    async with test_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    
+    return async_sessionmaker(bind=test_engine, autoflush=False, expire_on_commit=False)
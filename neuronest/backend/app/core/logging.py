@@ -1,55 +1,180 @@
 """
 Настройка логирования для NeuroNest
+
+Event loop только кладет запись в очередь: форматирование (в том числе
+подстановка %-аргументов) и запись в stdout выполняет поток QueueListener.
+Записи ниже WARNING проходят через лимиты по логгерам и выборку DEBUG,
+отброшенные записи учитываются в поле suppressed следующей записи логгера.
 """
 
+import atexit
 import logging
+import queue
+import random
 import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+import orjson
+
 from app.core.config import settings
 
-def setup_logging():
-    """Настройка логирования приложения"""
-    
-    # Определяем уровень логирования
-    log_level = getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO)
-    
-    # Настройка формата
-    if settings.LOG_FORMAT == "json":
-        import json
-        
-        class JSONFormatter(logging.Formatter):
-            def format(self, record):
-                log_obj = {
-                    'timestamp': self.formatTime(record, self.datefmt),
-                    'level': record.levelname,
-                    'logger': record.name,
-                    'message': record.getMessage(),
-                    'pathname': record.pathname,
-                    'line': record.lineno
-                }
-                if record.exc_info:
-                    log_obj['exception'] = self.formatException(record.exc_info)
-                return json.dumps(log_obj)
-        
+_listener: Optional[QueueListener] = None
+
+
+class JSONFormatter(logging.Formatter):
+    """Запись лога одной строкой JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        log_obj = {
+            'timestamp': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pathname': record.pathname,
+            'line': record.lineno
+        }
+        suppressed = getattr(record, 'suppressed', 0)
+        if suppressed:
+            log_obj['suppressed'] = suppressed
+        if record.exc_info:
+            log_obj['exception'] = self.formatException(record.exc_info)
+        return orjson.dumps(log_obj, default=str).decode()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Лимит записей ниже WARNING в секунду по логгерам и выборка DEBUG
+    Лимит логгера действует и на дочерние логгеры (ton_api -> ton_api.*).
+    """
+
+    def __init__(self, limits: Dict[str, float] = None, debug_sample_rate: float = 1.0):
+        super().__init__()
+        self.limits = limits or {}
+        self.debug_sample_rate = debug_sample_rate
+        # Имя логгера -> [лимит, токены, время пополнения, отброшено] или None
+        self._buckets: Dict[str, Optional[list]] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        if record.levelno <= logging.DEBUG and self.debug_sample_rate < 1.0:
+            if random.random() >= self.debug_sample_rate:
+                return False
+
+        try:
+            bucket = self._buckets[record.name]
+        except KeyError:
+            bucket = self._buckets[record.name] = self._bucket(record.name)
+        if bucket is None:
+            return True
+
+        now = time.monotonic()
+        rate = bucket[0]
+        bucket[1] = min(rate, bucket[1] + (now - bucket[2]) * rate)
+        bucket[2] = now
+        if bucket[1] < 1:
+            bucket[3] += 1
+            return False
+        bucket[1] -= 1
+        if bucket[3]:
+            record.suppressed = bucket[3]
+            bucket[3] = 0
+        return True
+
+    def _bucket(self, name: str) -> Optional[list]:
+        """Лимит самого близкого настроенного предка логгера"""
+        while name:
+            if name in self.limits:
+                rate = self.limits[name]
+                return [rate, rate, time.monotonic(), 0]
+            name = name.rpartition('.')[0]
+        return None
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler без форматирования в вызывающем потоке и без ожидания очереди"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Форматирует поток QueueListener; аргументы записи не должны меняться после вызова логгера
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Переполнение: запись теряется, event loop не ждет stdout
+            self.dropped += 1
+
+
+def build_pipeline(
+    stream=None,
+    log_format: str = None,
+    queue_size: int = None,
+    rate_limits: Dict[str, float] = None,
+    debug_sample_rate: float = None
+) -> Tuple[NonBlockingQueueHandler, QueueListener]:
+    """Обработчик для логгеров и поток записи (запускается через listener.start())"""
+    if (log_format or settings.LOG_FORMAT) == "json":
         formatter = JSONFormatter()
     else:
         formatter = logging.Formatter(
             '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
-    
-    # Настройка обработчиков
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(formatter)
-    
-    # Настройка корневого логгера
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(formatter)
+
+    size = settings.LOG_QUEUE_SIZE if queue_size is None else queue_size
+    handler = NonBlockingQueueHandler(queue.Queue(size))
+    handler.addFilter(RateLimitFilter(
+        settings.log_rate_limits if rate_limits is None else rate_limits,
+        settings.LOG_DEBUG_SAMPLE_RATE if debug_sample_rate is None else debug_sample_rate
+    ))
+    return handler, QueueListener(handler.queue, output, respect_handler_level=True)
+
+
+def setup_logging():
+    """Настройка логирования приложения"""
+    global _listener
+
+    # Определяем уровень логирования
+    log_level = getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO)
+
     root_logger = logging.getLogger()
+    if _listener is None:
+        atexit.register(stop_logging)
+    else:
+        # Повторный вызов: заменяем конвейер
+        stop_logging()
+        for handler in root_logger.handlers[:]:
+            if isinstance(handler, NonBlockingQueueHandler):
+                root_logger.removeHandler(handler)
+
+    handler, _listener = build_pipeline()
+    _listener.start()
+
+    # Настройка корневого логгера
     root_logger.setLevel(log_level)
     root_logger.addHandler(handler)
-    
+
     # Отключаем дублирование логов
     root_logger.propagate = False
-    
+
     # Настройка уровней для сторонних библиотек
     logging.getLogger("uvicorn").setLevel(logging.WARNING)
     logging.getLogger("fastapi").setLevel(logging.INFO)
-    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING) 
\ No newline at end of file
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.WARNING)
+
+
+def stop_logging() -> None:
+    """Запись оставшихся в очереди записей и остановка потока логирования"""
+    global _listener
+    if _listener is not None:
+        listener, _listener = _listener, None
+        listener.stop()
@@ -0,0 +1,190 @@
+"""
+Метрики Prometheus
+
+Несколько воркеров gunicorn/uvicorn пишут метрики в общий каталог
+PROMETHEUS_MULTIPROC_DIR, /metrics собирает их через MultiProcessCollector.
+Без каталога используется обычный реестр процесса.
+
+Значения меток берутся только из конечных множеств: шаблон маршрута (а не
+путь запроса), класс статуса, имя провайдера, пула, кэша или очереди.
+"""
+
+import os
+from typing import Optional
+
+from app.core.config import settings
+
+# Режим multiprocess определяется prometheus_client при импорте по наличию
+# переменной окружения, поэтому пустое значение удаляется
+if settings.PROMETHEUS_MULTIPROC_DIR and not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = settings.PROMETHEUS_MULTIPROC_DIR
+if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+    os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+else:
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    start_http_server,
+)
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+HTTP_METHODS = frozenset({"GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"})
+UNMATCHED_ROUTE = "unmatched"
+
+# Задержки Redis и пула - доли миллисекунды, выполнения агентов - минуты
+FAST_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+AGENT_BUCKETS = (0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+# HTTP
+HTTP_REQUEST_DURATION = Histogram(
+    "neuronest_http_request_duration_seconds",
+    "Длительность HTTP запроса",
+    ["method", "route", "status"]
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "neuronest_http_requests_in_progress",
+    "HTTP запросы в обработке",
+    multiprocess_mode="livesum"
+)
+
+# База данных
+DB_POOL_CHECKED_OUT = Gauge(
+    "neuronest_db_pool_checked_out",
+    "Выданные соединения пула",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+DB_POOL_OVERFLOW = Gauge(
+    "neuronest_db_pool_overflow",
+    "Соединения сверх pool_size",
+    ["pool"],
+    multiprocess_mode="livesum"
+)
+DB_POOL_WAIT = Histogram(
+    "neuronest_db_pool_wait_seconds",
+    "Ожидание соединения из пула",
+    ["pool"],
+    buckets=FAST_BUCKETS
+)
+DB_POOL_TIMEOUTS = Counter(
+    "neuronest_db_pool_timeouts_total",
+    "Таймауты ожидания соединения из пула",
+    ["pool"]
+)
+DB_REPLICA_LAG = Gauge(
+    "neuronest_db_replica_lag_seconds",
+    "Отставание реплики для чтения",
+    ["replica"],
+    multiprocess_mode="livemax"
+)
+DB_REPLICA_HEALTHY = Gauge(
+    "neuronest_db_replica_healthy",
+    "Реплика принимает чтения (1) или исключена (0)",
+    ["replica"],
+    multiprocess_mode="livemin"
+)
+
+# Redis
+REDIS_COMMAND_DURATION = Histogram(
+    "neuronest_redis_command_duration_seconds",
+    "Время ответа Redis на команду",
+    buckets=FAST_BUCKETS
+)
+
+# TON API
+TON_API_REQUEST_DURATION = Histogram(
+    "neuronest_ton_api_request_duration_seconds",
+    "Длительность запроса к провайдеру TON API",
+    ["provider"]
+)
+TON_API_REQUESTS = Counter(
+    "neuronest_ton_api_requests_total",
+    "Запросы к провайдеру TON API по исходу",
+    ["provider", "outcome"]
+)
+
+# Кэши
+CACHE_REQUESTS = Counter(
+    "neuronest_cache_requests_total",
+    "Обращения к кэшу по результату",
+    ["cache", "result"]
+)
+
+# Агенты
+AGENT_QUEUE_DEPTH = Gauge(
+    "neuronest_agent_queue_depth",
+    "Задания в очередях агентов",
+    ["queue"],
+    multiprocess_mode="livemax"
+)
+AGENT_EXECUTION_DURATION = Histogram(
+    "neuronest_agent_execution_duration_seconds",
+    "Длительность выполнения агента",
+    ["outcome"],
+    buckets=AGENT_BUCKETS
+)
+AGENT_EXECUTIONS = Counter(
+    "neuronest_agent_executions_total",
+    "Завершенные выполнения агентов по исходу",
+    ["outcome"]
+)
+
+
+def status_class(status: int) -> str:
+    """Класс статуса HTTP (2xx, 4xx...) вместо кода"""
+    return f"{status // 100}xx"
+
+
+def observe_ton_request(provider: str, outcome: str, seconds: Optional[float]) -> None:
+    """Хук TONAPIClient: исход и задержка запроса к провайдеру"""
+    TON_API_REQUESTS.labels(provider, outcome).inc()
+    if seconds is not None:
+        TON_API_REQUEST_DURATION.labels(provider).observe(seconds)
+
+
+def cache_counter(cache: str):
+    """Хук счетчика кэша: результат обращения -> cache_requests_total"""
+    children = {}
+
+    def count(result: str) -> None:
+        child = children.get(result)
+        if child is None:
+            child = children[result] = CACHE_REQUESTS.labels(cache, result)
+        child.inc()
+
+    return count
+
+
+def registry() -> CollectorRegistry:
+    """Реестр для экспорта: метрики всех процессов или текущего"""
+    if not MULTIPROCESS:
+        return REGISTRY
+    collector_registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(collector_registry)
+    return collector_registry
+
+
+def render() -> bytes:
+    """Текст метрик в формате Prometheus"""
+    return generate_latest(registry())
+
+
+def start_exporter(port: int = None) -> None:
+    """HTTP сервер метрик для процессов без API (воркер агентов)"""
+    start_http_server(port or settings.PROMETHEUS_PORT, registry=registry())
+
+
+def mark_process_dead() -> None:
+    """Удаление livesum/livemax значений завершающегося процесса"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
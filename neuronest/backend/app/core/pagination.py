@@ -0,0 +1,61 @@
+"""
+Keyset (cursor) пагинация
+
+Страница определяется не OFFSET, а значениями ключа сортировки последней
+строки предыдущей страницы: WHERE (created_at, id) < (:created_at, :id).
+Стоимость запроса не зависит от глубины истории при наличии индекса
+(user_id, created_at DESC, id DESC).
+
+Курсор для клиента непрозрачен: base64url от JSON со значениями ключа.
+"""
+
+import base64
+import binascii
+from datetime import datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+import orjson
+from sqlalchemy import Select, tuple_
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    """Курсор поврежден или от другого запроса"""
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Непрозрачный курсор на строку"""
+    raw = orjson.dumps([created_at.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Значения ключа сортировки из курсора"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = orjson.loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, orjson.JSONDecodeError, TypeError, ValueError) as e:
+        raise InvalidCursor("Некорректный курсор") from e
+
+
+def keyset_page(statement: Select, created_at_column, id_column, cursor: Optional[str], limit: int) -> Select:
+    """
+    Запрос страницы в порядке (created_at DESC, id DESC)
+    Выбирается limit + 1 строка, чтобы узнать, есть ли следующая страница.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        statement = statement.where(tuple_(created_at_column, id_column) < tuple_(created_at, row_id))
+    return statement.order_by(created_at_column.desc(), id_column.desc()).limit(limit + 1)
+
+
+def split_page(rows: Sequence[Any], limit: int) -> Tuple[List[Any], Optional[str]]:
+    """Строки страницы и курсор следующей (None на последней странице)"""
+    items = list(rows[:limit])
+    if len(rows) <= limit or not items:
+        return items, None
+    last = items[-1]
+    return items, encode_cursor(last.created_at, last.id)
@@ -0,0 +1,185 @@
+"""
+Распределенный rate limiter для NeuroNest (GCRA)
+
+Основной лимитер работает как один атомарный Lua-скрипт в Redis, поэтому лимиты
+общие для всех uvicorn воркеров и реплик. Если Redis недоступен, используется
+локальный лимитер с тем же алгоритмом и ограниченным размером памяти.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+import logging
+import math
+import time
+from typing import Optional
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+# GCRA: в ключе хранится TAT (theoretical arrival time) в миллисекундах.
+# Время берется из Redis (TIME), чтобы часы всех воркеров совпадали.
+GCRA_LUA = """
+local key = KEYS[1]
+local emission = tonumber(ARGV[1])
+local tolerance = tonumber(ARGV[2])
+
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+
+local tat = tonumber(redis.call('GET', key))
+if not tat or tat < now then
+    tat = now
+end
+
+local new_tat = tat + emission
+local allow_at = new_tat - tolerance
+if allow_at > now then
+    return {0, 0, math.ceil(allow_at - now)}
+end
+
+redis.call('SET', key, new_tat, 'PX', math.ceil(new_tat - now))
+local remaining = math.floor((now + tolerance - new_tat) / emission)
+return {1, remaining, 0}
+"""
+
+
+@dataclass
+class RateLimitResult:
+    """Результат проверки лимита"""
+    allowed: bool
+    limit: int
+    remaining: int
+    retry_after_ms: int = 0
+
+    @property
+    def retry_after_seconds(self) -> int:
+        """Retry-After в секундах (округление вверх)"""
+        return max(1, math.ceil(self.retry_after_ms / 1000))
+
+
+class LocalRateLimiter:
+    """GCRA лимитер в памяти процесса (fallback при недоступном Redis)"""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._tat: "OrderedDict[str, float]" = OrderedDict()
+
+    def hit(self, key: str, emission_ms: float, tolerance_ms: float) -> tuple[bool, int, int]:
+        """Учет запроса: (allowed, remaining, retry_after_ms)"""
+        now = time.monotonic() * 1000
+        tat = self._tat.get(key, now)
+        if tat < now:
+            tat = now
+
+        new_tat = tat + emission_ms
+        allow_at = new_tat - tolerance_ms
+        if allow_at > now:
+            return False, 0, math.ceil(allow_at - now)
+
+        self._tat[key] = new_tat
+        self._tat.move_to_end(key)
+        self._evict(now)
+
+        remaining = int((now + tolerance_ms - new_tat) // emission_ms)
+        return True, remaining, 0
+
+    def _evict(self, now: float) -> None:
+        """Удаление устаревших и лишних ключей (LRU)"""
+        while self._tat:
+            oldest_key, oldest_tat = next(iter(self._tat.items()))
+            # Ключ с TAT в прошлом эквивалентен отсутствующему
+            if oldest_tat < now or len(self._tat) > self.max_keys:
+                self._tat.popitem(last=False)
+            else:
+                break
+
+    def __len__(self) -> int:
+        return len(self._tat)
+
+
+class RateLimiter:
+    """Rate limiter с Redis и локальным fallback"""
+
+    KEY_PREFIX = "ratelimit"
+
+    def __init__(
+        self,
+        requests_per_minute: int = None,
+        burst: int = None,
+        premium_multiplier: int = None,
+        local_max_keys: int = 10000,
+        key_prefix: str = None,
+    ):
+        self.requests_per_minute = requests_per_minute or settings.RATE_LIMIT_REQUESTS_PER_MINUTE
+        self.burst = burst or settings.RATE_LIMIT_BURST
+        self.premium_multiplier = premium_multiplier or settings.RATE_LIMIT_PREMIUM_MULTIPLIER
+        self.key_prefix = key_prefix or self.KEY_PREFIX
+        self.local = LocalRateLimiter(max_keys=local_max_keys)
+        self._script = None
+        self._script_client = None
+        self._redis_failed_at: Optional[float] = None
+
+    # Повторная попытка подключения к Redis после ошибки
+    REDIS_RETRY_SECONDS = 5.0
+
+    def limits_for(self, is_premium: bool) -> tuple[int, float, float]:
+        """(limit, emission_ms, tolerance_ms) для уровня доступа"""
+        multiplier = self.premium_multiplier if is_premium else 1
+        limit = self.requests_per_minute * multiplier
+        burst = self.burst * multiplier
+        emission_ms = 60000 / limit
+        return limit, emission_ms, emission_ms * burst
+
+    @staticmethod
+    def client_key(telegram_id: Optional[int], client_ip: Optional[str]) -> str:
+        """Ключ клиента: Telegram пользователь, иначе IP"""
+        if telegram_id:
+            return f"user:{telegram_id}"
+        return f"ip:{client_ip or 'unknown'}"
+
+    async def hit(self, key: str, is_premium: bool = False) -> RateLimitResult:
+        """Учет запроса для ключа клиента"""
+        limit, emission_ms, tolerance_ms = self.limits_for(is_premium)
+
+        redis_result = await self._hit_redis(key, emission_ms, tolerance_ms)
+        if redis_result is not None:
+            allowed, remaining, retry_after_ms = redis_result
+        else:
+            allowed, remaining, retry_after_ms = self.local.hit(key, emission_ms, tolerance_ms)
+
+        return RateLimitResult(
+            allowed=bool(allowed),
+            limit=limit,
+            remaining=int(remaining),
+            retry_after_ms=int(retry_after_ms),
+        )
+
+    async def _hit_redis(self, key: str, emission_ms: float, tolerance_ms: float):
+        """Проверка лимита в Redis; None если Redis недоступен"""
+        if self._redis_failed_at and time.monotonic() - self._redis_failed_at < self.REDIS_RETRY_SECONDS:
+            return None
+
+        client = await get_redis()
+        if client is None:
+            return None
+
+        try:
+            if self._script is None or self._script_client is not client:
+                self._script = client.register_script(GCRA_LUA)
+                self._script_client = client
+            result = await self._script(
+                keys=[f"{self.key_prefix}:{key}"],
+                args=[emission_ms, tolerance_ms],
+            )
+            if self._redis_failed_at:
+                logger.info("Rate limiter: Redis снова доступен")
+                self._redis_failed_at = None
+            return int(result[0]), int(result[1]), int(result[2])
+        except Exception as e:
+            if not self._redis_failed_at:
+                logger.warning("Rate limiter: Redis недоступен, локальный fallback: %s", e)
+            self._redis_failed_at = time.monotonic()
+            return None
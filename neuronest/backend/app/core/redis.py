@@ -3,18 +3,37 @@ Redis конфигурация для NeuroNest
 """
 
 import redis.asyncio as redis
+from app.core import metrics
 from app.core.config import settings
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
 redis_client = None
 
+
+class InstrumentedRedis(redis.Redis):
+    """Клиент Redis с замером времени ответа на каждую команду"""
+
+    # Чтение потоков с BLOCK ждет новых сообщений, а не ответа сервера
+    STREAM_READS = frozenset({"XREAD", "XREADGROUP"})
+
+    async def execute_command(self, *args, **options):
+        if args[0] in self.STREAM_READS and "BLOCK" in args:
+            return await super().execute_command(*args, **options)
+        started = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            metrics.REDIS_COMMAND_DURATION.observe(time.perf_counter() - started)
+
+
 async def init_redis():
     """Инициализация Redis подключения"""
     global redis_client
     try:
-        redis_client = await redis.from_url(
+        redis_client = await InstrumentedRedis.from_url(
             settings.REDIS_URL,
             encoding="utf-8",
             decode_responses=True
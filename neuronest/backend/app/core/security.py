@@ -0,0 +1,110 @@
+"""
+Аутентификация: проверка Telegram initData и JWT сессии
+
+initData проверяется один раз при входе (/api/v1/telegram/verify), ключ
+HMAC WebApp выводится из токена бота один раз при создании проверяющего.
+Дальше клиент передает короткоживущий JWT, а AuthMiddleware проверяет его
+с LRU кэшем недавно проверенных токенов: подпись считается только для
+новых токенов, повторный запрос с тем же токеном - поиск в словаре и
+проверка срока действия.
+"""
+
+import hashlib
+import hmac
+import json
+import time
+import urllib.parse
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from jose import JWTError, jwt
+
+from app.core.config import settings
+
+
+class AuthError(Exception):
+    """Ошибка проверки initData или токена"""
+
+
+class TelegramInitDataVerifier:
+    """Проверка подписи initData Telegram WebApp"""
+
+    def __init__(self, bot_token: str, max_age: int = None):
+        # secret_key = HMAC_SHA256("WebAppData", bot_token), не зависит от запроса
+        self._secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+        self.max_age = settings.TELEGRAM_INIT_DATA_MAX_AGE if max_age is None else max_age
+
+    def verify(self, init_data: str) -> Dict[str, Any]:
+        """Поля initData (user - разобранный JSON) или AuthError"""
+        fields = dict(urllib.parse.parse_qsl(init_data, strict_parsing=True))
+        received_hash = fields.pop("hash", None)
+        if not received_hash:
+            raise AuthError("Отсутствует hash в данных")
+
+        data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+        calculated = hmac.new(self._secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+        if not hmac.compare_digest(received_hash, calculated):
+            raise AuthError("Неверная подпись данных")
+
+        auth_date = int(fields.get("auth_date", 0))
+        if self.max_age and time.time() - auth_date > self.max_age:
+            raise AuthError("Данные Telegram устарели")
+        if "user" in fields:
+            fields["user"] = json.loads(fields["user"])
+        return fields
+
+
+class TokenVerifier:
+    """Проверка JWT с LRU кэшем уже проверенных токенов"""
+
+    def __init__(self, secret: str, algorithm: str, cache_size: int = None):
+        self.secret = secret
+        self.algorithm = algorithm
+        self.cache_size = settings.JWT_CACHE_SIZE if cache_size is None else cache_size
+        # Ключ - токен целиком: подпись действительна только вместе со своими header.payload
+        self._cache: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    def issue(self, claims: Dict[str, Any], ttl: int = None) -> Tuple[str, int]:
+        """Подписанный токен и срок его действия в секундах"""
+        ttl = ttl or settings.JWT_ACCESS_TOKEN_MINUTES * 60
+        now = int(time.time())
+        token = jwt.encode({**claims, "iat": now, "exp": now + ttl}, self.secret, algorithm=self.algorithm)
+        return token, ttl
+
+    def verify(self, token: str) -> Dict[str, Any]:
+        """Claims токена или AuthError"""
+        claims = self._cache.get(token)
+        if claims is not None:
+            if claims["exp"] > time.time():
+                self._cache.move_to_end(token)
+                return claims
+            del self._cache[token]
+            raise AuthError("Срок действия токена истек")
+
+        try:
+            claims = jwt.decode(token, self.secret, algorithms=[self.algorithm])
+        except JWTError as e:
+            raise AuthError(f"Недействительный токен: {e}")
+        if "exp" not in claims:
+            raise AuthError("Токен без срока действия")
+        if not str(claims.get("sub", "")).isdigit():
+            raise AuthError("Токен без пользователя")
+
+        self._cache[token] = claims
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return claims
+
+
+def bearer_token(authorization: Optional[bytes]) -> Optional[str]:
+    """Токен из заголовка Authorization: Bearer <token>"""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token.strip()
+
+
+telegram_verifier = TelegramInitDataVerifier(settings.TELEGRAM_BOT_TOKEN)
+token_verifier = TokenVerifier(settings.JWT_SECRET_KEY, settings.JWT_ALGORITHM)
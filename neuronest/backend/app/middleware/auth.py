@@ -2,14 +2,20 @@
 Middleware для аутентификации
 """
 
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette import status
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+from starlette.websockets import WebSocketClose
+from urllib.parse import parse_qs
 import logging
+import re
+
+from app.core.security import AuthError, TokenVerifier, bearer_token, token_verifier
 
 logger = logging.getLogger(__name__)
 
-class AuthMiddleware(BaseHTTPMiddleware):
-    """Middleware для проверки аутентификации"""
+class AuthMiddleware:
+    """ASGI middleware для проверки аутентификации (HTTP и WebSocket)"""
     
     # Пути, не требующие аутентификации
     PUBLIC_PATHS = [
@@ -17,16 +23,70 @@ class AuthMiddleware(BaseHTTPMiddleware):
         "/docs",
         "/redoc",
         "/openapi.json",
+        "/metrics",
         "/api/v1/telegram/verify"
     ]
     
-    async def dispatch(self, request: Request, call_next):
+    # Один предкомпилированный префиксный матч вместо any(startswith) по списку
+    PUBLIC_PATHS_RE = re.compile("|".join(re.escape(path) for path in PUBLIC_PATHS))
+    
+    def __init__(self, app: ASGIApp, verifier: TokenVerifier = None):
+        self.app = app
+        self.verifier = verifier or token_verifier
+    
+    @classmethod
+    def is_public_path(cls, path: str) -> bool:
+        """Проверка, является ли путь публичным"""
+        return cls.PUBLIC_PATHS_RE.match(path) is not None
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        
         # Пропускаем публичные пути
-        if any(request.url.path.startswith(path) for path in self.PUBLIC_PATHS):
-            return await call_next(request)
+        if self.is_public_path(scope["path"]):
+            await self.app(scope, receive, send)
+            return
+        
+        token = self.extract_token(scope)
+        try:
+            if token is None:
+                raise AuthError("Требуется аутентификация")
+            claims = self.verifier.verify(token)
+        except AuthError as e:
+            await self.reject(scope, receive, send, str(e))
+            return
         
-        # TODO: Добавить проверку JWT токена из заголовка Authorization
-        # Пока просто пропускаем все запросы
+        # Пользователь доступен эндпоинтам через request.state
+        state = scope.setdefault("state", {})
+        state["telegram_id"] = int(claims["sub"])
+        state["user_id"] = claims.get("uid")
+        state["is_premium"] = claims.get("premium", False)
         
-        response = await call_next(request)
-        return response 
\ No newline at end of file
+        await self.app(scope, receive, send)
+    
+    @staticmethod
+    def extract_token(scope: Scope):
+        """JWT из Authorization: Bearer, для WebSocket - также из ?token="""
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                return bearer_token(value)
+        if scope["type"] == "websocket" and scope.get("query_string"):
+            # Браузерный WebSocket не позволяет задать заголовки
+            tokens = parse_qs(scope["query_string"].decode("latin-1")).get("token")
+            if tokens:
+                return tokens[0]
+        return None
+    
+    @staticmethod
+    async def reject(scope: Scope, receive: Receive, send: Send, detail: str) -> None:
+        if scope["type"] == "websocket":
+            await WebSocketClose(code=status.WS_1008_POLICY_VIOLATION)(scope, receive, send)
+            return
+        response = JSONResponse(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            content={"detail": detail},
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+        await response(scope, receive, send)
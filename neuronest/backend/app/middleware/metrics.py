@@ -0,0 +1,60 @@
+"""
+Middleware метрик HTTP запросов
+"""
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import time
+
+from app.core import metrics
+
+
+class MetricsMiddleware:
+    """ASGI middleware: задержка по шаблону маршрута и запросы в обработке"""
+
+    # Собственные запросы Prometheus не учитываются
+    EXCLUDED_PATHS = frozenset({"/metrics"})
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        # Дочерние серии гистограммы по меткам: labels() дороже самого observe
+        self._series = {}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # WebSocket соединения долгоживущие, их длительность не задержка запроса
+        if scope["type"] != "http" or scope["path"] in self.EXCLUDED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics.HTTP_REQUESTS_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.HTTP_REQUESTS_IN_PROGRESS.dec()
+            key = (self.method(scope), self.route(scope), status_code // 100)
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = metrics.HTTP_REQUEST_DURATION.labels(
+                    key[0], key[1], metrics.status_class(status_code)
+                )
+            series.observe(elapsed)
+
+    @staticmethod
+    def method(scope: Scope) -> str:
+        method = scope["method"]
+        return method if method in metrics.HTTP_METHODS else "OTHER"
+
+    @staticmethod
+    def route(scope: Scope) -> str:
+        """Шаблон маршрута (/api/v1/agents/{agent_id}), выставленный роутером"""
+        route = scope.get("route")
+        return getattr(route, "path", None) or metrics.UNMATCHED_ROUTE
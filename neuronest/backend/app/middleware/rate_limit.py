@@ -2,41 +2,73 @@
 Middleware для ограничения количества запросов
 """
 
-from fastapi import Request, HTTPException
-from starlette.middleware.base import BaseHTTPMiddleware
-import time
-from collections import defaultdict, deque
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from starlette.websockets import WebSocketClose
+from starlette import status
 import logging
 
+from app.core.rate_limiter import RateLimiter
+
 logger = logging.getLogger(__name__)
 
-class RateLimitMiddleware(BaseHTTPMiddleware):
-    """Middleware для rate limiting"""
-    
-    def __init__(self, app, requests_per_minute: int = 60):
-        super().__init__(app)
-        self.requests_per_minute = requests_per_minute
-        self.requests = defaultdict(deque)
-    
-    async def dispatch(self, request: Request, call_next):
-        # Получаем IP адрес клиента
-        client_ip = request.client.host
-        
-        # Текущее время
-        now = time.time()
-        minute_ago = now - 60
-        
-        # Удаляем старые записи
-        while self.requests[client_ip] and self.requests[client_ip][0] < minute_ago:
-            self.requests[client_ip].popleft()
-        
-        # Проверяем лимит
-        if len(self.requests[client_ip]) >= self.requests_per_minute:
-            logger.warning(f"Rate limit exceeded for IP: {client_ip}")
-            raise HTTPException(status_code=429, detail="Too many requests")
-        
-        # Добавляем текущий запрос
-        self.requests[client_ip].append(now)
-        
-        response = await call_next(request)
-        return response 
\ No newline at end of file
+class RateLimitMiddleware:
+    """
+    ASGI middleware для rate limiting (HTTP и WebSocket)
+
+    by_ip=True - лимит только по IP, для слоя до аутентификации: запросы
+    с неверным токеном тоже учитываются. Заголовки X-RateLimit-* такой слой
+    не выставляет, их задает пользовательский лимит.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter = None, by_ip: bool = False):
+        self.app = app
+        self.limiter = limiter or RateLimiter()
+        self.by_ip = by_ip
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        # Пользователь Telegram (если известен после аутентификации), иначе IP
+        state = scope.get("state") or {}
+        client = scope.get("client")
+        telegram_id = None if self.by_ip else state.get("telegram_id")
+        key = self.limiter.client_key(telegram_id, client[0] if client else None)
+
+        result = await self.limiter.hit(key, is_premium=not self.by_ip and state.get("is_premium", False))
+
+        if not result.allowed:
+            logger.warning("Rate limit exceeded for %s", key)
+            if scope["type"] == "websocket":
+                await WebSocketClose(code=status.WS_1008_POLICY_VIOLATION)(scope, receive, send)
+                return
+            response = JSONResponse(
+                status_code=429,
+                content={"detail": "Too many requests"},
+                headers={
+                    "X-RateLimit-Limit": str(result.limit),
+                    "X-RateLimit-Remaining": "0",
+                    "Retry-After": str(result.retry_after_seconds),
+                }
+            )
+            await response(scope, receive, send)
+            return
+
+        if scope["type"] == "websocket" or self.by_ip:
+            await self.app(scope, receive, send)
+            return
+
+        limit = str(result.limit)
+        remaining = str(result.remaining)
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                headers["X-RateLimit-Limit"] = limit
+                headers["X-RateLimit-Remaining"] = remaining
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
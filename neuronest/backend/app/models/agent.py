@@ -2,9 +2,9 @@
 Модели AI агентов NeuroNest
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, BigInteger, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, BigInteger, Text, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from datetime import datetime
 from typing import Optional, List, Dict, Any
 import enum
@@ -13,6 +13,18 @@ from app.core.database import Base
 from app.core.constants import from_minimal_units
 
 
+# Веса рейтинга агента: успешность и популярность (до 100 выполнений)
+RATING_SUCCESS_WEIGHT = 0.7
+RATING_POPULARITY_WEIGHT = 0.3
+
+
+def compute_rating(successful_executions: int, total_executions: int) -> int:
+    """Рейтинг агента от 0 до 100"""
+    success_rate = (successful_executions / total_executions) * 100 if total_executions else 0.0
+    popularity = min(100, total_executions)
+    return int(success_rate * RATING_SUCCESS_WEIGHT + popularity * RATING_POPULARITY_WEIGHT)
+
+
 class AgentCategory(str, enum.Enum):
     """Категории AI агентов"""
     GAMING = "gaming"
@@ -75,6 +87,8 @@ class Agent(Base):
     execution_timeout = Column(Integer, default=300)  # Таймаут в секундах
     memory_limit = Column(String(20), default="512m")
     cpu_limit = Column(String(20), default="0.5")
+    # Кэш результатов для одинаковых входных данных; None - выключен
+    result_cache_ttl = Column(Integer, nullable=True)  # TTL в секундах
     
     # Конфигурация
     input_schema = Column(JSON, nullable=False)  # JSON Schema для входных параметров
@@ -93,6 +107,9 @@ class Agent(Base):
     successful_executions = Column(Integer, default=0)
     avg_execution_time = Column(Integer, default=0)  # Среднее время выполнения в секундах
     rating = Column(Integer, default=0)  # Рейтинг от 0 до 100
+    p50_execution_ms = Column(Integer, nullable=True)  # Медиана времени выполнения
+    p95_execution_ms = Column(Integer, nullable=True)  # 95-й перцентиль времени выполнения
+    unique_users = Column(Integer, default=0)  # Оценка числа уникальных пользователей (HyperLogLog)
     
     # Временные метки
     created_at = Column(DateTime, default=func.now())
@@ -150,13 +167,7 @@ class Agent(Base):
         self.last_execution_at = datetime.utcnow()
         
         # Обновляем рейтинг на основе успешности
-        success_weight = 0.7
-        popularity_weight = 0.3
-        
-        success_score = self.success_rate
-        popularity_score = min(100, self.total_executions)
-        
-        self.rating = int(success_score * success_weight + popularity_score * popularity_weight)
+        self.rating = compute_rating(self.successful_executions, self.total_executions)
     
     def to_dict(self) -> Dict[str, Any]:
         """Преобразование в словарь для API"""
@@ -179,6 +190,8 @@ class Agent(Base):
             "success_rate": self.success_rate,
             "avg_execution_time": self.avg_execution_time_formatted,
             "rating": self.rating,
+            "p50_execution_ms": self.p50_execution_ms,
+            "p95_execution_ms": self.p95_execution_ms,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "last_execution_at": self.last_execution_at.isoformat() if self.last_execution_at else None
         }
@@ -188,6 +201,16 @@ class AgentExecution(Base):
     """Модель выполнения агента"""
     
     __tablename__ = "agent_executions"
+    __table_args__ = (
+        # История пользователя: keyset пагинация по (created_at, id) и фильтр по статусу
+        Index("ix_agent_executions_user_created", "user_id", text("created_at DESC"), text("id DESC")),
+        Index("ix_agent_executions_user_status_created", "user_id", "status", "created_at"),
+        # Кандидаты на архивацию результатов
+        Index(
+            "ix_agent_executions_unarchived", "completed_at",
+            postgresql_where=text("archived_at IS NULL"), sqlite_where=text("archived_at IS NULL")
+        ),
+    )
     
     # Основные поля
     id = Column(Integer, primary_key=True, index=True)
@@ -206,10 +229,16 @@ class AgentExecution(Base):
     output_data = Column(JSON, nullable=True)
     error_message = Column(Text, nullable=True)
     logs = Column(Text, nullable=True)
+    # Архив результатов: output_data и logs перенесены в хранилище по ссылке payload_ref
+    payload_ref = Column(String(300), nullable=True)
+    archived_at = Column(DateTime, nullable=True)
     
     # Технические данные
     docker_container_id = Column(String(100), nullable=True)
     execution_time = Column(Integer, nullable=True)  # Время выполнения в секундах
+    start_type = Column(String(10), nullable=True)  # cold / warm
+    start_time_ms = Column(Integer, nullable=True)  # Время запуска контейнера в мс
+    cache_hit = Column(Boolean, default=False, nullable=False)  # Результат из кэша, контейнер не запускался
     
     # Финансовые данные
     price_paid = Column(BigInteger, nullable=False)
@@ -269,6 +298,12 @@ class AgentExecution(Base):
         self.execution_time = self.duration
         self.progress = 100
     
+    def complete_from_cache(self, output_data: Dict[str, Any], logs: str = "") -> None:
+        """Завершение сохраненным результатом без запуска контейнера"""
+        self.started_at = datetime.utcnow()
+        self.cache_hit = True
+        self.complete(output_data, logs)
+    
     def fail(self, error_message: str, logs: str = "") -> None:
         """Неуспешное завершение выполнения"""
         self.status = ExecutionStatus.FAILED
@@ -294,21 +329,43 @@ class AgentExecution(Base):
         """Обновление прогресса выполнения"""
         self.progress = max(0, min(100, progress))
     
-    def to_dict(self) -> Dict[str, Any]:
-        """Преобразование в словарь для API"""
-        return {
+    def to_dict(self, include_data: bool = True) -> Dict[str, Any]:
+        """
+        Преобразование в словарь для API
+        include_data=False - краткая запись для списков истории: без input_data
+        и output_data (колонки загружаются отложенно) и с кратким агентом.
+        """
+        data = {
             "id": self.id,
             "execution_id": self.execution_id,
             "status": self.status.value,
             "progress": self.progress,
-            "agent": self.agent.to_dict() if self.agent else None,
-            "input_data": self.input_data,
-            "output_data": self.output_data,
+            "agent": self._agent_dict(include_data),
             "error_message": self.error_message,
             "price_paid": self.price_paid / (10 ** 9),
             "commission_paid": self.commission_paid / (10 ** 9),
             "execution_time": self.execution_time,
+            "start_type": self.start_type,
+            "start_time_ms": self.start_time_ms,
+            "cache_hit": bool(self.cache_hit),
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "started_at": self.started_at.isoformat() if self.started_at else None,
-            "completed_at": self.completed_at.isoformat() if self.completed_at else None
+            "completed_at": self.completed_at.isoformat() if self.completed_at else None,
+            "archived_at": self.archived_at.isoformat() if self.archived_at else None
+        }
+        if include_data:
+            data["input_data"] = self.input_data
+            data["output_data"] = self.output_data
+        return data
+
+    def _agent_dict(self, full: bool) -> Optional[Dict[str, Any]]:
+        if not self.agent:
+            return None
+        if full:
+            return self.agent.to_dict()
+        return {
+            "id": self.agent.id,
+            "name": self.agent.name,
+            "display_name": self.agent.display_name,
+            "avatar_url": self.agent.avatar_url
         } 
\ No newline at end of file
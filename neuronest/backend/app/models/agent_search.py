@@ -0,0 +1,91 @@
+"""
+Схема полнотекстового поиска агентов
+
+PostgreSQL: генерируемая колонка search_vector (tsvector) с GIN индексом,
+триграммные индексы pg_trgm для поиска с опечатками, индекс префиксов
+имени для автодополнения и GIN индекс по тегам.
+SQLite: внешняя FTS5 таблица agents_fts с триггерами синхронизации.
+
+DDL идемпотентен и выполняется после каждого Base.metadata.create_all,
+поэтому применяется и к уже существующим базам.
+"""
+
+from sqlalchemy import event, text
+
+from app.core.database import Base
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    ALTER TABLE agents ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(display_name, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(tags::text, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(short_description, '')), 'C') ||
+        setweight(to_tsvector('simple', coalesce(description, '')), 'D')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_agents_search_vector ON agents USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_agents_display_name_trgm ON agents USING GIN (lower(display_name) gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_agents_display_name_prefix ON agents (lower(display_name) text_pattern_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_agents_tags ON agents USING GIN ((tags::jsonb) jsonb_path_ops)",
+]
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS agents_fts USING fts5(
+        name, display_name, tags, short_description, description,
+        content='agents', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS agents_fts_insert AFTER INSERT ON agents BEGIN
+        INSERT INTO agents_fts(rowid, name, display_name, tags, short_description, description)
+        VALUES (new.id, new.name, new.display_name, new.tags, new.short_description, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS agents_fts_delete AFTER DELETE ON agents BEGIN
+        INSERT INTO agents_fts(agents_fts, rowid, name, display_name, tags, short_description, description)
+        VALUES ('delete', old.id, old.name, old.display_name, old.tags, old.short_description, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS agents_fts_update
+    AFTER UPDATE OF name, display_name, tags, short_description, description ON agents BEGIN
+        INSERT INTO agents_fts(agents_fts, rowid, name, display_name, tags, short_description, description)
+        VALUES ('delete', old.id, old.name, old.display_name, old.tags, old.short_description, old.description);
+        INSERT INTO agents_fts(rowid, name, display_name, tags, short_description, description)
+        VALUES (new.id, new.name, new.display_name, new.tags, new.short_description, new.description);
+    END
+    """,
+]
+
+
+def install_search_schema(connection) -> None:
+    """Создание объектов поиска для диалекта соединения"""
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        for statement in POSTGRES_DDL:
+            connection.execute(text(statement))
+    elif dialect == "sqlite":
+        existed = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'agents_fts'")
+        ).first()
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+        if not existed:
+            # Индекс для агентов, созданных до появления FTS таблицы
+            rebuild_sqlite_index(connection)
+
+
+def rebuild_sqlite_index(connection) -> None:
+    """Полная перестройка FTS5 индекса (после массовой загрузки в обход триггеров)"""
+    connection.execute(text("INSERT INTO agents_fts(agents_fts) VALUES ('rebuild')"))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _after_create(target, connection, **kw) -> None:
+    if "agents" in target.tables:
+        install_search_schema(connection)
@@ -0,0 +1,48 @@
+"""
+Журнал движения средств пользователей (append-only)
+"""
+
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger, ForeignKey, Index
+from sqlalchemy.sql import func
+from typing import Dict, Any
+
+from app.core.database import Base
+from app.core.constants import from_minimal_units
+
+
+class LedgerEntry(Base):
+    """
+    Запись журнала: знаковая сумма изменения баланса
+    Записи только добавляются. users.notpunks_balance - снимок суммы записей.
+    """
+    
+    __tablename__ = "ledger_entries"
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    transaction_id = Column(Integer, ForeignKey("transactions.id"), index=True, nullable=True)
+    
+    # Положительная - зачисление, отрицательная - списание (минимальные единицы NOTPUNKS)
+    amount = Column(BigInteger, nullable=False)
+    # Ключ идемпотентности: повтор операции с тем же ключом не меняет баланс
+    idempotency_key = Column(String(200), unique=True, nullable=False)
+    description = Column(String(500), nullable=True)
+    
+    created_at = Column(DateTime, default=func.now())
+    
+    __table_args__ = (
+        Index("ix_ledger_entries_user_id_id", "user_id", "id"),
+    )
+    
+    def __repr__(self):
+        return f"<LedgerEntry(id={self.id}, user_id={self.user_id}, amount={self.amount})>"
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Преобразование в словарь для API"""
+        return {
+            "id": self.id,
+            "transaction_id": self.transaction_id,
+            "amount": from_minimal_units(self.amount),
+            "description": self.description,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,52 @@
+"""
+Модели локального индекса владельцев NFT коллекций
+"""
+
+from sqlalchemy import Column, Integer, String, DateTime, BigInteger, Index
+from sqlalchemy.sql import func
+from typing import Dict, Any
+
+from app.core.database import Base
+
+
+class NFTHolding(Base):
+    """Элемент NFT коллекции и его текущий владелец"""
+    
+    __tablename__ = "nft_holdings"
+    
+    # Адреса хранятся в raw форме (workchain:hex)
+    collection = Column(String(100), primary_key=True)
+    item_index = Column(BigInteger, primary_key=True)
+    item_address = Column(String(100), nullable=False)
+    owner = Column(String(100), nullable=True)
+    
+    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        # Проверка доступа: WHERE owner = :owner AND collection IN (...)
+        Index("ix_nft_holdings_owner_collection", "owner", "collection"),
+        Index("ix_nft_holdings_item_address", "item_address"),
+    )
+    
+    def __repr__(self):
+        return f"<NFTHolding(collection={self.collection}, item_index={self.item_index}, owner={self.owner})>"
+
+
+class NFTCollectionSync(Base):
+    """Состояние синхронизации коллекции в локальный индекс"""
+    
+    __tablename__ = "nft_collection_sync"
+    
+    collection = Column(String(100), primary_key=True)
+    items_count = Column(Integer, default=0)
+    last_full_sync_at = Column(DateTime, nullable=True)
+    last_incremental_at = Column(DateTime, nullable=True)
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """Преобразование в словарь для API"""
+        return {
+            "collection": self.collection,
+            "items_count": self.items_count,
+            "last_full_sync_at": self.last_full_sync_at.isoformat() if self.last_full_sync_at else None,
+            "last_incremental_at": self.last_incremental_at.isoformat() if self.last_incremental_at else None
+        }
@@ -2,9 +2,9 @@
 Модель транзакций NeuroNest
 """
 
-from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, BigInteger, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, JSON, BigInteger, Text, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from sqlalchemy.sql import func, text
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 import enum
@@ -36,6 +36,11 @@ class Transaction(Base):
     """Модель транзакции"""
     
     __tablename__ = "transactions"
+    __table_args__ = (
+        # История пользователя: keyset пагинация по (created_at, id) и фильтр по статусу
+        Index("ix_transactions_user_created", "user_id", text("created_at DESC"), text("id DESC")),
+        Index("ix_transactions_user_status_created", "user_id", "status", "created_at"),
+    )
     
     # Основные поля
     id = Column(Integer, primary_key=True, index=True)
@@ -65,7 +70,8 @@ class Transaction(Base):
     
     # Дополнительные данные
     description = Column(Text, nullable=True)
-    metadata = Column(JSON, default=dict)  # Дополнительные данные в JSON
+    # Атрибут "metadata" зарезервирован Declarative API, колонка сохраняет имя
+    extra_data = Column("metadata", JSON, default=dict)  # Дополнительные данные в JSON
     
     # Временные метки
     created_at = Column(DateTime, default=func.now())
@@ -203,7 +209,7 @@ class Transaction(Base):
             commission=0,
             total_amount=amount,
             description=f"Refund for failed execution #{execution_id}",
-            metadata={"original_transaction_id": original_transaction_id}
+            extra_data={"original_transaction_id": original_transaction_id}
         )
         return transaction
     
@@ -36,6 +36,7 @@ class User(Base):
     ton_wallet_connected_at = Column(DateTime, nullable=True)
     
     # Балансы и статистика
+    # Снимок суммы записей журнала, меняется только через app.services.ledger
     notpunks_balance = Column(BigInteger, default=0)  # Баланс в токенах NOTPUNKS
     total_spent = Column(BigInteger, default=0)  # Общая сумма потраченных токенов
     agents_used_count = Column(Integer, default=0)  # Количество использованных агентов
@@ -133,18 +134,6 @@ class User(Base):
         else:
             return settings.COMMISSION_RATE
     
-    def debit_balance(self, amount: int) -> bool:
-        """Списание средств с баланса"""
-        if self.notpunks_balance >= amount:
-            self.notpunks_balance -= amount
-            self.total_spent += amount
-            return True
-        return False
-    
-    def credit_balance(self, amount: int) -> None:
-        """Зачисление средств на баланс"""
-        self.notpunks_balance += amount
-    
     def to_dict(self) -> Dict[str, Any]:
         """Преобразование в словарь для API"""
         return {
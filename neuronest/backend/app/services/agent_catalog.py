@@ -0,0 +1,255 @@
+"""
+Каталог AI агентов для главного экрана
+
+Список активных агентов собирается один раз на версию каталога: JSON
+хранится в памяти процесса и в Redis, сжатые варианты (gzip, brotli если
+установлен) считаются один раз на представление. Представления по category
+и is_featured строятся из того же снимка.
+
+Любая запись Agent увеличивает версию каталога в Redis (событие сессии
+SQLAlchemy после commit). Чтобы статистика выполнений не пересобирала
+каталог на каждом запуске, новый снимок строится не чаще, чем раз в
+AGENT_CATALOG_MIN_REBUILD_SECONDS.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import logging
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import orjson
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis import get_redis
+from app.models.agent import Agent, AgentStatus
+from app.services.agent_schemas import agent_schemas
+
+try:
+    import brotli
+except ImportError:  # brotli необязателен
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogView:
+    """Сериализованное представление каталога и его сжатые варианты"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag_base = hashlib.sha1(body).hexdigest()[:20]
+        self._encoded: Dict[str, bytes] = {}
+
+    def etag(self, encoding: Optional[str] = None) -> str:
+        """Сильный ETag: у каждого варианта кодирования свой"""
+        return f'"{self.etag_base}-{encoding}"' if encoding else f'"{self.etag_base}"'
+
+    def encoded(self, encoding: Optional[str]) -> bytes:
+        if encoding is None:
+            return self.body
+        if encoding not in self._encoded:
+            if encoding == "br":
+                self._encoded[encoding] = brotli.compress(self.body)
+            else:
+                self._encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+        return self._encoded[encoding]
+
+
+class CatalogSnapshot:
+    """Снимок каталога одной версии"""
+
+    def __init__(self, version: int, agents: List[dict]):
+        self.version = version
+        self.agents = agents
+        self.built_at = time.monotonic()
+        self._views: Dict[Tuple[Optional[str], Optional[bool]], CatalogView] = {}
+
+    def view(self, category: Optional[str] = None, featured: Optional[bool] = None) -> CatalogView:
+        """Представление с фильтрами (кэшируется в снимке)"""
+        key = (category, featured)
+        view = self._views.get(key)
+        if view is None:
+            agents = [
+                agent for agent in self.agents
+                if (category is None or agent["category"] == category)
+                and (featured is None or agent["is_featured"] == featured)
+            ]
+            view = CatalogView(orjson.dumps({"agents": agents, "total": len(agents)}))
+            self._views[key] = view
+        return view
+
+
+class AgentCatalog:
+    """Версионированный кэш каталога в памяти и Redis"""
+
+    VERSION_KEY = "agents:catalog:version"
+    SNAPSHOT_KEY = "agents:catalog:snapshot:{version}"
+    SNAPSHOT_TTL = 3600
+
+    def __init__(self, min_rebuild_seconds: float = None):
+        self.min_rebuild_seconds = (
+            settings.AGENT_CATALOG_MIN_REBUILD_SECONDS if min_rebuild_seconds is None else min_rebuild_seconds
+        )
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._local_version = 0
+        self._lock = asyncio.Lock()
+        self._count = metrics.cache_counter("agent_catalog")
+
+    async def snapshot(self) -> CatalogSnapshot:
+        """Текущий снимок; пересборка при смене версии"""
+        version = await self._current_version()
+        snapshot = self._snapshot
+        if snapshot is not None and (
+            snapshot.version == version
+            or time.monotonic() - snapshot.built_at < self.min_rebuild_seconds
+        ):
+            self._count("local_hits")
+            return snapshot
+
+        async with self._lock:
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.version == version:
+                self._count("local_hits")
+                return snapshot
+            agents = await self._load_redis(version)
+            if agents is None:
+                self._count("misses")
+                agents = await self._build()
+                await self._store_redis(version, agents)
+            else:
+                self._count("redis_hits")
+            self._snapshot = CatalogSnapshot(version, agents)
+            return self._snapshot
+
+    async def invalidate(self) -> None:
+        """Новая версия каталога для всех процессов"""
+        self._local_version += 1
+        redis = await get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.incr(self.VERSION_KEY)
+        except Exception as e:
+            logger.warning("Каталог агентов: ошибка инвалидации в Redis: %s", e)
+
+    async def _current_version(self) -> int:
+        redis = await get_redis()
+        if redis is not None:
+            try:
+                return int(await redis.get(self.VERSION_KEY) or 0)
+            except Exception as e:
+                logger.warning("Каталог агентов: Redis недоступен: %s", e)
+        return self._local_version
+
+    async def _build(self) -> List[dict]:
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(Agent)
+                .where(Agent.status == AgentStatus.ACTIVE)
+                .order_by(Agent.is_featured.desc(), Agent.rating.desc(), Agent.id)
+            )
+            return [agent.to_dict() for agent in result.scalars()]
+
+    async def _load_redis(self, version: int) -> Optional[List[dict]]:
+        redis = await get_redis()
+        if redis is None:
+            return None
+        try:
+            raw = await redis.get(self.SNAPSHOT_KEY.format(version=version))
+        except Exception as e:
+            logger.warning("Каталог агентов: ошибка чтения из Redis: %s", e)
+            return None
+        return orjson.loads(raw) if raw else None
+
+    async def _store_redis(self, version: int, agents: List[dict]) -> None:
+        redis = await get_redis()
+        if redis is None:
+            return
+        try:
+            await redis.set(
+                self.SNAPSHOT_KEY.format(version=version),
+                orjson.dumps(agents).decode(),
+                ex=self.SNAPSHOT_TTL
+            )
+        except Exception as e:
+            logger.warning("Каталог агентов: ошибка записи в Redis: %s", e)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Лучшее поддерживаемое кодирование из Accept-Encoding"""
+    accepted = {part.split(";")[0].strip() for part in (accept_encoding or "").lower().split(",")}
+    if brotli is not None and "br" in accepted:
+        return "br"
+    if "gzip" in accepted:
+        return "gzip"
+    return None
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка If-None-Match (в том числе список и *)"""
+    if not if_none_match:
+        return False
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+agent_catalog = AgentCatalog()
+
+
+# -----------------------------------------------------------------------------
+# Инвалидация при записи агентов
+# -----------------------------------------------------------------------------
+
+# Ссылки на задачи инвалидации, чтобы их не собрал сборщик мусора до завершения
+_invalidating: Set[asyncio.Task] = set()
+
+
+def _invalidation_done(task: asyncio.Task) -> None:
+    _invalidating.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Каталог агентов: ошибка инвалидации: %s", task.exception())
+
+
+def _track_agent_flush(session: Session, flush_context) -> None:
+    if any(isinstance(obj, Agent) for obj in (*session.new, *session.dirty, *session.deleted)):
+        session.info["agent_catalog_dirty"] = True
+        session.info.setdefault("agent_catalog_ids", set()).update(
+            obj.id for obj in (*session.dirty, *session.deleted) if isinstance(obj, Agent)
+        )
+
+
+def _invalidate_after_commit(session: Session) -> None:
+    if not session.info.pop("agent_catalog_dirty", False):
+        return
+    agent_schemas.discard(session.info.pop("agent_catalog_ids", ()))
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        # Синхронная сессия вне event loop: версия обновится при следующей async записи
+        logger.debug("Каталог агентов: запись вне event loop, инвалидация пропущена")
+        return
+    task = loop.create_task(agent_catalog.invalidate())
+    _invalidating.add(task)
+    task.add_done_callback(_invalidation_done)
+
+
+def _reset_after_rollback(session: Session) -> None:
+    session.info.pop("agent_catalog_dirty", None)
+    session.info.pop("agent_catalog_ids", None)
+
+
+def track_agent_writes() -> None:
+    """Подписка на события сессий (повторный вызов безопасен)"""
+    if not event.contains(Session, "after_flush", _track_agent_flush):
+        event.listen(Session, "after_flush", _track_agent_flush)
+        event.listen(Session, "after_commit", _invalidate_after_commit)
+        event.listen(Session, "after_rollback", _reset_after_rollback)
+
+
+track_agent_writes()
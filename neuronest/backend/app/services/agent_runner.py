@@ -0,0 +1,205 @@
+"""
+Запуск AI агентов в Docker контейнерах
+
+Контракт контейнера: входные данные передаются в переменной окружения
+AGENT_INPUT (JSON), результат - последняя строка stdout в формате JSON.
+Строки вида {"progress": 40} считаются прогрессом выполнения.
+Теплые контейнеры из пула (container_pool) запускают ту же команду образа
+через docker exec с тем же окружением.
+"""
+
+import asyncio
+import codecs
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import docker
+
+from app.core.config import settings
+from app.models.agent import Agent, AgentExecution
+from app.services.execution_events import parse_progress
+
+logger = logging.getLogger(__name__)
+
+
+class AgentRunError(Exception):
+    """Ошибка выполнения агента в контейнере"""
+
+    def __init__(self, message: str, logs: str = ""):
+        super().__init__(message)
+        self.logs = logs
+
+
+@dataclass
+class RunResult:
+    """Результат выполнения агента"""
+    output_data: Dict[str, Any]
+    logs: str = ""
+    container_id: Optional[str] = None
+    start_type: Optional[str] = None  # cold / warm
+    start_time_ms: Optional[int] = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+
+def image_ref(agent: Agent) -> str:
+    """Полная ссылка на образ агента (docker_image может уже содержать тег)"""
+    name = agent.docker_image
+    if ":" in name.rsplit("/", 1)[-1]:
+        return name
+    return f"{name}:{agent.docker_tag or 'latest'}"
+
+
+def parse_output(logs: str) -> Dict[str, Any]:
+    """Результат агента из последней JSON строки stdout (кроме строк прогресса)"""
+    for line in reversed(logs.strip().splitlines()):
+        line = line.strip()
+        if line.startswith("{") and parse_progress(line) is None:
+            return json.loads(line)
+    raise AgentRunError("Агент не вернул результат в формате JSON", tail_logs(logs))
+
+
+def container_options(agent: Agent) -> Dict[str, Any]:
+    """Параметры контейнера агента"""
+    return {
+        "image": image_ref(agent),
+        "network": settings.DOCKER_NETWORK,
+        "mem_limit": agent.memory_limit or settings.DOCKER_RESOURCE_LIMITS_MEMORY,
+        "nano_cpus": int(float(agent.cpu_limit or settings.DOCKER_RESOURCE_LIMITS_CPU) * 1e9),
+        "labels": {"neuronest.agent": agent.name},
+    }
+
+
+def agent_environment(execution: AgentExecution, agent: Agent) -> Dict[str, str]:
+    """Окружение выполнения: переменные агента и входные данные"""
+    environment = dict(agent.environment_vars or {})
+    environment["AGENT_INPUT"] = json.dumps(execution.input_data)
+    environment["EXECUTION_ID"] = execution.execution_id
+    return environment
+
+
+def tail_logs(logs: str) -> str:
+    """Хвост вывода для AgentExecution.logs (полный вывод - в событиях выполнения)"""
+    limit = settings.AGENTS_LOGS_TAIL_BYTES
+    return logs if len(logs) <= limit else logs[-limit:]
+
+
+OutputCallback = Callable[[str], Awaitable[None]]
+
+
+async def stream_output(chunks: Callable[[], Iterable[bytes]], on_output: Optional[OutputCallback]) -> str:
+    """
+    Чтение блокирующего потока вывода Docker в отдельном потоке
+    Фрагменты, накопившиеся пока обрабатывался предыдущий, передаются одним вызовом.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    done = object()
+
+    def pump() -> None:
+        try:
+            for chunk in chunks():
+                loop.call_soon_threadsafe(queue.put_nowait, chunk)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, done)
+
+    reader = asyncio.ensure_future(asyncio.to_thread(pump))
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    output: List[str] = []
+    finished = False
+    while not finished:
+        batch = [await queue.get()]
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch[-1] is done:
+            batch.pop()
+            finished = True
+        text = "".join(decoder.decode(chunk) for chunk in batch)
+        if finished:
+            text += decoder.decode(b"", final=True)
+        if text:
+            output.append(text)
+            if on_output is not None:
+                await on_output(text)
+    await reader
+    return "".join(output)
+
+
+class DockerAgentRunner:
+    """
+    Запуск агента в Docker
+    Если задан пул, используется теплый контейнер, иначе создается новый.
+    Вывод контейнера передается в on_output по мере поступления.
+    """
+
+    def __init__(self, client: docker.DockerClient = None, pool=None):
+        self.docker = client or docker.from_env()
+        self.pool = pool
+
+    async def run(self, execution: AgentExecution, agent: Agent, on_output: OutputCallback = None) -> RunResult:
+        """Выполнение агента в теплом или новом контейнере"""
+        if self.pool is not None:
+            warm = await self.pool.acquire(agent)
+            if warm is not None:
+                return await self._run_warm(execution, agent, warm, on_output)
+        return await self._run_cold(execution, agent, on_output)
+
+    async def _run_cold(self, execution: AgentExecution, agent: Agent, on_output: OutputCallback) -> RunResult:
+        """Создание, запуск, ожидание и удаление контейнера"""
+        started = time.perf_counter()
+        container = await asyncio.to_thread(
+            self.docker.containers.run,
+            detach=True,
+            environment=agent_environment(execution, agent),
+            **container_options(agent)
+        )
+        start_time_ms = int((time.perf_counter() - started) * 1000)
+        try:
+            logs = await stream_output(
+                lambda: container.logs(stdout=True, stderr=True, stream=True, follow=True),
+                on_output
+            )
+            status = await asyncio.to_thread(container.wait)
+        finally:
+            # Также при отмене по таймауту: контейнер не должен пережить выполнение
+            await asyncio.shield(asyncio.to_thread(container.remove, force=True))
+
+        if status.get("StatusCode", 1) != 0:
+            raise AgentRunError(f"Контейнер завершился с кодом {status.get('StatusCode')}", tail_logs(logs))
+        return RunResult(
+            output_data=parse_output(logs),
+            logs=tail_logs(logs),
+            container_id=container.id,
+            start_type="cold",
+            start_time_ms=start_time_ms
+        )
+
+    async def _run_warm(self, execution: AgentExecution, agent: Agent, warm, on_output: OutputCallback) -> RunResult:
+        """Команда агента через docker exec в уже запущенном контейнере"""
+        api = self.docker.api
+        healthy = False
+        try:
+            exec_id = (await asyncio.to_thread(
+                api.exec_create,
+                warm.container.id,
+                warm.command,
+                environment=agent_environment(execution, agent)
+            ))["Id"]
+            logs = await stream_output(lambda: api.exec_start(exec_id, stream=True), on_output)
+            exit_code = (await asyncio.to_thread(api.exec_inspect, exec_id))["ExitCode"]
+            if exit_code != 0:
+                raise AgentRunError(f"Агент завершился с кодом {exit_code}", tail_logs(logs))
+            # Контейнер с неразбираемым выводом в пул не возвращается
+            output_data = parse_output(logs)
+            healthy = True
+            return RunResult(
+                output_data=output_data,
+                logs=tail_logs(logs),
+                container_id=warm.container.id,
+                start_type="warm",
+                start_time_ms=warm.start_time_ms
+            )
+        finally:
+            await asyncio.shield(self.pool.release(agent, warm, healthy))
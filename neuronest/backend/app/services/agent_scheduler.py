@@ -0,0 +1,462 @@
+"""
+Планировщик выполнения AI агентов
+
+Очередь хранится в Redis Streams с consumer group, поэтому выполнения
+переживают перезапуск и распределяются между процессами воркеров:
+
+- глобальный лимит AGENTS_MAX_CONCURRENT - аренды (lease) в sorted set,
+  общие для всех воркеров;
+- премиум пользователи читаются из отдельного потока в первую очередь,
+  обычный поток получает долю выборок, чтобы не голодать;
+- квота одновременных выполнений на пользователя: превысившее квоту задание
+  возвращается в конец очереди с новым id, поэтому порядок FIFO не строгий -
+  задания, поставленные позже, могут выполниться раньше отложенного;
+- таймаут выполнения вызывает AgentExecution.timeout();
+- неуспешное выполнение возвращает оплату записью журнала refund:<execution_id>
+  в той же транзакции, что и итоговый статус;
+- задания упавших воркеров забираются через XAUTOCLAIM.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis import get_redis
+from app.models.agent import AgentExecution, ExecutionStatus
+from app.models.transaction import Transaction, TransactionStatus, TransactionType
+from app.services import execution_events, ledger
+from app.services.agent_schemas import SchemaValidationError, agent_schemas
+from app.services.agent_stats import agent_stats
+from app.services.result_cache import agent_result_cache
+
+logger = logging.getLogger(__name__)
+
+
+# Атомарное получение аренды слота: удаляем истекшие и добавляем, если есть место
+ACQUIRE_LEASE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZSCORE', KEYS[1], ARGV[3]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[1]), ARGV[3])
+    return 1
+end
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[2]) then
+    redis.call('ZADD', KEYS[1], now + tonumber(ARGV[1]), ARGV[3])
+    redis.call('PEXPIRE', KEYS[1], tonumber(ARGV[1]) * 2)
+    return 1
+end
+return 0
+"""
+
+# Продление аренды только если она еще существует
+RENEW_LEASE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local renewed = redis.call('ZADD', KEYS[1], 'XX', 'CH', now + tonumber(ARGV[1]), ARGV[2])
+redis.call('PEXPIRE', KEYS[1], tonumber(ARGV[1]) * 2)
+return renewed
+"""
+
+# Жива ли аренда выполнения
+LEASE_ALIVE_LUA = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local score = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if score and tonumber(score) > now then
+    return 1
+end
+return 0
+"""
+
+
+class AgentScheduler:
+    """Очередь выполнений агентов и пул воркеров"""
+
+    PREMIUM_STREAM = "agents:queue:premium"
+    STANDARD_STREAM = "agents:queue:standard"
+    GROUP = "agent-workers"
+    RUNNING_KEY = "agents:running"
+    USER_RUNNING_KEY = "agents:running:user:{user_id}"
+
+    # Аренда продлевается, пока выполнение идет; после падения воркера истекает
+    LEASE_TTL_MS = 30000
+    LEASE_RENEW_SECONDS = 10
+    RECLAIM_INTERVAL_SECONDS = 30
+    IDLE_BACKOFF_SECONDS = 0.5
+
+    def __init__(self, runner=None, concurrency: int = None, consumer_name: str = None):
+        self.runner = runner
+        self.concurrency = concurrency or settings.AGENTS_WORKER_CONCURRENCY
+        self.consumer_name = consumer_name or f"{socket.gethostname()}-{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._scripts: Dict[str, object] = {}
+        self._picks = 0
+
+    # -------------------------------------------------------------------------
+    # Постановка в очередь
+    # -------------------------------------------------------------------------
+
+    async def enqueue(self, execution: AgentExecution, premium: bool = False) -> str:
+        """Постановка выполнения в очередь"""
+        redis = await self._redis()
+        stream = self.PREMIUM_STREAM if premium else self.STANDARD_STREAM
+        return await redis.xadd(stream, {
+            "execution_id": execution.execution_id,
+            "user_id": str(execution.user_id),
+            "premium": "1" if premium else "0",
+        })
+
+    async def queue_depth(self) -> Dict[str, int]:
+        """Количество заданий в очередях и выполняющихся"""
+        redis = await self._redis()
+        return {
+            "premium": await redis.xlen(self.PREMIUM_STREAM),
+            "standard": await redis.xlen(self.STANDARD_STREAM),
+            "running": await redis.zcard(self.RUNNING_KEY),
+        }
+
+    async def publish_queue_depth(self) -> Dict[str, int]:
+        """Глубина очередей в метрики Prometheus"""
+        depth = await self.queue_depth()
+        for queue, value in depth.items():
+            metrics.AGENT_QUEUE_DEPTH.labels(queue).set(value)
+        return depth
+
+    # -------------------------------------------------------------------------
+    # Пул воркеров
+    # -------------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Запуск воркеров и восстановления зависших заданий"""
+        redis = await self._redis()
+        for stream in (self.PREMIUM_STREAM, self.STANDARD_STREAM):
+            try:
+                await redis.xgroup_create(stream, self.GROUP, id="0", mkstream=True)
+            except Exception as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._reclaim_loop()))
+        logger.info("Планировщик агентов запущен: %s, воркеров %d", self.consumer_name, self.concurrency)
+
+    async def stop(self) -> None:
+        """Остановка воркеров"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self, number: int) -> None:
+        while True:
+            try:
+                await self._work_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Воркер %d: ошибка: %s", number, e, exc_info=True)
+                await asyncio.sleep(1)
+
+    async def _work_once(self) -> None:
+        """Один цикл: получить задание, проверить квоты, выполнить"""
+        message = await self._read_next()
+        if message is None:
+            return
+        stream, message_id, fields = message
+        execution_id = fields["execution_id"]
+
+        if not await self._acquire(self.RUNNING_KEY, settings.AGENTS_MAX_CONCURRENT, execution_id):
+            # Глобальный лимит исчерпан другими процессами: задание ждет в конце очереди
+            await self._requeue(stream, message_id, fields)
+            await asyncio.sleep(self.IDLE_BACKOFF_SECONDS)
+            return
+
+        user_key = self.USER_RUNNING_KEY.format(user_id=fields["user_id"])
+        user_quota = (
+            settings.AGENTS_PREMIUM_USER_MAX_CONCURRENT
+            if fields.get("premium") == "1"
+            else settings.AGENTS_USER_MAX_CONCURRENT
+        )
+        if not await self._acquire(user_key, user_quota, execution_id):
+            await self._release(self.RUNNING_KEY, execution_id)
+            await self._requeue(stream, message_id, fields)
+            # Иначе задания одного пользователя крутятся в очереди без паузы
+            await asyncio.sleep(self.IDLE_BACKOFF_SECONDS)
+            return
+
+        try:
+            await self._execute(execution_id, [self.RUNNING_KEY, user_key])
+        finally:
+            await self._release(user_key, execution_id)
+            await self._release(self.RUNNING_KEY, execution_id)
+
+        # При ошибке до этой строки задание остается неподтвержденным и будет забрано reclaim()
+        await self._ack(stream, message_id)
+
+    async def _read_next(self) -> Optional[Tuple[str, str, Dict[str, str]]]:
+        """Следующее задание: премиум поток приоритетнее, обычный получает каждую N-ю выборку"""
+        redis = await self._redis()
+        self._picks += 1
+        order = [self.PREMIUM_STREAM, self.STANDARD_STREAM]
+        if self._picks % (settings.AGENTS_PREMIUM_WEIGHT + 1) == 0:
+            order.reverse()
+
+        for stream in order:
+            response = await redis.xreadgroup(self.GROUP, self.consumer_name, {stream: ">"}, count=1)
+            if response:
+                return self._unpack(response)
+
+        response = await redis.xreadgroup(
+            self.GROUP,
+            self.consumer_name,
+            {stream: ">" for stream in order},
+            count=1,
+            block=1000
+        )
+        return self._unpack(response) if response else None
+
+    @staticmethod
+    def _unpack(response) -> Optional[Tuple[str, str, Dict[str, str]]]:
+        for stream, messages in response:
+            for message_id, fields in messages:
+                return stream, message_id, fields
+        return None
+
+    async def _ack(self, stream: str, message_id: str) -> None:
+        """Подтверждение задания; XLEN потока остается глубиной очереди"""
+        redis = await self._redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.xack(stream, self.GROUP, message_id)
+            pipe.xdel(stream, message_id)
+            await pipe.execute()
+
+    async def _requeue(self, stream: str, message_id: str, fields: Dict[str, str]) -> None:
+        """Возврат задания в конец очереди (новый id: место в порядке FIFO теряется)"""
+        redis = await self._redis()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(stream, fields)
+            pipe.xack(stream, self.GROUP, message_id)
+            pipe.xdel(stream, message_id)
+            await pipe.execute()
+
+    # -------------------------------------------------------------------------
+    # Выполнение
+    # -------------------------------------------------------------------------
+
+    async def _execute(self, execution_id: str, lease_keys: List[str]) -> None:
+        """Выполнение агента с таймаутом и продлением аренды"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(AgentExecution)
+                .options(selectinload(AgentExecution.agent))
+                .where(AgentExecution.execution_id == execution_id)
+            )
+            execution = result.scalar_one_or_none()
+            if execution is None:
+                logger.warning("Выполнение %s не найдено, задание пропущено", execution_id)
+                return
+            if execution.status != ExecutionStatus.PENDING:
+                logger.info("Выполнение %s уже в статусе %s, задание пропущено", execution_id, execution.status.value)
+                return
+
+            agent = execution.agent
+            execution.start(container_id=None)
+            await db.commit()
+            await execution_events.publish_status(execution)
+
+            renew_task = asyncio.create_task(self._renew_leases(lease_keys, execution_id))
+            timeout = agent.execution_timeout or settings.AGENTS_EXECUTION_TIMEOUT
+            log_publisher = execution_events.LogPublisher(execution)
+            try:
+                run_result = await asyncio.wait_for(
+                    self.runner.run(execution, agent, on_output=log_publisher),
+                    timeout=timeout
+                )
+                if run_result.container_id:
+                    execution.docker_container_id = run_result.container_id
+                execution.start_type = run_result.start_type
+                execution.start_time_ms = run_result.start_time_ms
+                agent_schemas.validate_output(agent, run_result.output_data)
+                execution.complete(run_result.output_data, run_result.logs)
+            except asyncio.TimeoutError:
+                logger.warning("Выполнение %s: таймаут %sс", execution_id, timeout)
+                execution.timeout()
+            except SchemaValidationError as e:
+                logger.warning("Выполнение %s: результат не соответствует output_schema: %s", execution_id, e)
+                execution.fail(f"Результат агента не соответствует output_schema: {e}", run_result.logs)
+            except Exception as e:
+                logger.error("Выполнение %s завершилось ошибкой: %s", execution_id, e)
+                execution.fail(str(e), getattr(e, "logs", ""))
+            finally:
+                renew_task.cancel()
+                await log_publisher.flush()
+
+            duration_ms = int((execution.completed_at - execution.started_at).total_seconds() * 1000)
+            metrics.AGENT_EXECUTIONS.labels(execution.status.value).inc()
+            metrics.AGENT_EXECUTION_DURATION.labels(execution.status.value).observe(duration_ms / 1000)
+            recorded = await agent_stats.record(agent.id, duration_ms, execution.was_successful, execution.user_id)
+            if not recorded:
+                # Без Redis статистика пишется в строку агента, как раньше
+                agent.update_statistics(execution.execution_time or 0, execution.was_successful)
+            if not execution.was_successful:
+                await refund_execution(db, execution)
+            await db.commit()
+            await execution_events.publish_status(execution)
+
+            if execution.was_successful:
+                await agent_result_cache.store(
+                    agent, execution.input_data, execution.output_data, execution.logs, execution.execution_id
+                )
+
+    async def _renew_leases(self, keys: List[str], execution_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.LEASE_RENEW_SECONDS)
+            for key in keys:
+                await self._script("renew")(keys=[key], args=[self.LEASE_TTL_MS, execution_id])
+
+    # -------------------------------------------------------------------------
+    # Восстановление после падения воркеров
+    # -------------------------------------------------------------------------
+
+    async def _reclaim_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.RECLAIM_INTERVAL_SECONDS)
+            try:
+                await self.reclaim()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Ошибка восстановления заданий: %s", e, exc_info=True)
+
+    async def reclaim(self) -> int:
+        """Забрать задания, чьи воркеры перестали продлевать аренду"""
+        redis = await self._redis()
+        recovered = 0
+        for stream in (self.PREMIUM_STREAM, self.STANDARD_STREAM):
+            start_id = "0-0"
+            while True:
+                response = await redis.xautoclaim(
+                    stream,
+                    self.GROUP,
+                    self.consumer_name,
+                    min_idle_time=self.LEASE_TTL_MS,
+                    start_id=start_id,
+                    count=100
+                )
+                start_id, messages = response[0], response[1]
+                for message_id, fields in messages:
+                    if await self._recover(stream, message_id, fields):
+                        recovered += 1
+                if start_id in ("0-0", b"0-0"):
+                    break
+        if recovered:
+            logger.info("Восстановлено заданий после падения воркеров: %d", recovered)
+        return recovered
+
+    async def _recover(self, stream: str, message_id: str, fields: Dict[str, str]) -> bool:
+        execution_id = fields["execution_id"]
+        await self._load_scripts()
+        alive = await self._script("alive")(keys=[self.RUNNING_KEY], args=[execution_id])
+        if int(alive):
+            # Выполнение идет в живом воркере, он сам подтвердит задание
+            return False
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(AgentExecution).where(AgentExecution.execution_id == execution_id))
+            execution = result.scalar_one_or_none()
+            if execution is not None and execution.status == ExecutionStatus.RUNNING:
+                # Воркер упал во время выполнения: повторный запуск мог бы списать оплату дважды
+                execution.fail("Выполнение прервано: воркер остановлен")
+                await refund_execution(db, execution)
+                await db.commit()
+                await execution_events.publish_status(execution)
+
+        if execution is not None and execution.status == ExecutionStatus.PENDING:
+            await self._requeue(stream, message_id, fields)
+        else:
+            await self._ack(stream, message_id)
+        return True
+
+    # -------------------------------------------------------------------------
+    # Redis
+    # -------------------------------------------------------------------------
+
+    async def _redis(self):
+        redis = await get_redis()
+        if redis is None:
+            raise RuntimeError("Redis не инициализирован")
+        return redis
+
+    def _script(self, name: str):
+        return self._scripts[name]
+
+    async def _acquire(self, key: str, limit: int, execution_id: str) -> bool:
+        await self._load_scripts()
+        result = await self._script("acquire")(keys=[key], args=[self.LEASE_TTL_MS, limit, execution_id])
+        return bool(int(result))
+
+    async def _release(self, key: str, execution_id: str) -> None:
+        redis = await self._redis()
+        await redis.zrem(key, execution_id)
+
+    async def _load_scripts(self) -> None:
+        if self._scripts:
+            return
+        redis = await self._redis()
+        self._scripts = {
+            "acquire": redis.register_script(ACQUIRE_LEASE_LUA),
+            "renew": redis.register_script(RENEW_LEASE_LUA),
+            "alive": redis.register_script(LEASE_ALIVE_LUA),
+        }
+
+
+async def refund_execution(db: AsyncSession, execution: AgentExecution) -> None:
+    """
+    Возврат оплаты неуспешного выполнения в транзакции вызывающего кода
+    Ключ refund:<execution_id> не дает вернуть оплату дважды.
+    """
+    total = execution.price_paid + execution.commission_paid
+    if total <= 0:
+        return
+    payment = await db.scalar(
+        select(Transaction).where(
+            Transaction.execution_id == execution.id,
+            Transaction.type == TransactionType.PAYMENT
+        )
+    )
+    refund = Transaction.create_refund_transaction(
+        user_id=execution.user_id,
+        execution_id=execution.id,
+        amount=total,
+        transaction_id=str(uuid.uuid4()),
+        original_transaction_id=payment.transaction_id if payment else None
+    )
+    refund.status = TransactionStatus.COMPLETED
+    refund.confirmed_at = datetime.utcnow()
+    db.add(refund)
+    await db.flush()
+
+    posting = await ledger.post_entry(
+        db, execution.user_id, total, f"refund:{execution.execution_id}",
+        transaction_id=refund.id, description=refund.description
+    )
+    if posting.replayed:
+        # Оплата уже возвращена ранее
+        await db.delete(refund)
+    else:
+        logger.info("Выполнение %s: оплата %d возвращена", execution.execution_id, total)
+
+
+# Глобальный планировщик (в API процессе используется только для постановки в очередь)
+agent_scheduler = AgentScheduler()
@@ -0,0 +1,145 @@
+"""
+Реестр скомпилированных JSON Schema агентов
+
+input_schema и output_schema агента компилируются один раз: fastjsonschema
+генерирует Python функцию проверки, схемы, которые он не может
+скомпилировать, проверяются закэшированным валидатором jsonschema.
+Ключ - (agent.id, agent.version); запись также сверяется с текущими схемами
+агента, поэтому правка схемы без смены версии (в том числе в другом
+процессе) приводит к перекомпиляции. Запись агентов в сессии удаляет их
+валидаторы (см. agent_catalog).
+"""
+
+import copy
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, NamedTuple, Optional, Tuple
+
+import jsonschema
+from jsonschema.exceptions import best_match
+
+from app.core.config import settings
+from app.models.agent import Agent
+
+try:
+    import fastjsonschema
+except ImportError:  # fastjsonschema необязателен
+    fastjsonschema = None
+
+logger = logging.getLogger(__name__)
+
+Validator = Callable[[Any], None]
+
+
+class SchemaValidationError(ValueError):
+    """Данные не соответствуют схеме агента"""
+
+    def __init__(self, message: str, path: str = "data"):
+        super().__init__(f"{path}: {message}")
+        self.message = message
+        self.path = path
+
+
+class InvalidAgentSchema(Exception):
+    """Схема агента не является корректной JSON Schema"""
+
+
+def _jsonschema_validator(schema: Dict[str, Any]) -> Validator:
+    cls = jsonschema.validators.validator_for(schema)
+    try:
+        cls.check_schema(schema)
+    except jsonschema.SchemaError as e:
+        raise InvalidAgentSchema(e.message)
+    validator = cls(schema)
+
+    def validate(data: Any) -> None:
+        # is_valid быстрее iter_errors; подробности ошибки нужны только при отказе
+        if validator.is_valid(data):
+            return
+        error = best_match(validator.iter_errors(data))
+        path = "data" + "".join(f"[{part}]" if isinstance(part, int) else f".{part}" for part in error.absolute_path)
+        raise SchemaValidationError(error.message, path)
+
+    return validate
+
+
+def compile_schema(schema: Optional[Dict[str, Any]]) -> Optional[Validator]:
+    """Функция проверки данных по схеме (None - схема не задана)"""
+    if not schema:
+        return None
+    if fastjsonschema is not None:
+        try:
+            # Без подстановки default: данные выполнения сохраняются как получены
+            compiled = fastjsonschema.compile(schema, use_default=False)
+        except fastjsonschema.JsonSchemaDefinitionException as e:
+            logger.debug("fastjsonschema не поддерживает схему (%s), используется jsonschema", e)
+        else:
+            def validate(data: Any) -> None:
+                try:
+                    compiled(data)
+                except fastjsonschema.JsonSchemaValueException as e:
+                    raise SchemaValidationError(e.message, e.name)
+            return validate
+    return _jsonschema_validator(schema)
+
+
+class CompiledSchemas(NamedTuple):
+    input_schema: Optional[Dict[str, Any]]
+    output_schema: Optional[Dict[str, Any]]
+    validate_input: Optional[Validator]
+    validate_output: Optional[Validator]
+
+
+class AgentSchemaRegistry:
+    """LRU валидаторов входных и выходных данных агентов"""
+
+    def __init__(self, max_entries: int = None):
+        self.max_entries = settings.AGENT_SCHEMA_CACHE_SIZE if max_entries is None else max_entries
+        self._entries: "OrderedDict[Tuple[int, Optional[str]], CompiledSchemas]" = OrderedDict()
+
+    def schemas(self, agent: Agent) -> CompiledSchemas:
+        """Валидаторы агента (компиляция при первом обращении или смене схем)"""
+        key = (agent.id, agent.version)
+        entry = self._entries.get(key)
+        if (
+            entry is not None
+            and entry.input_schema == agent.input_schema
+            and entry.output_schema == agent.output_schema
+        ):
+            self._entries.move_to_end(key)
+            return entry
+
+        # Копии: JSON колонки не отслеживают изменения на месте
+        entry = CompiledSchemas(
+            copy.deepcopy(agent.input_schema),
+            copy.deepcopy(agent.output_schema),
+            compile_schema(agent.input_schema),
+            compile_schema(agent.output_schema)
+        )
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    def validate_input(self, agent: Agent, data: Any) -> None:
+        """Проверка входных данных запуска (SchemaValidationError)"""
+        validate = self.schemas(agent).validate_input
+        if validate is not None:
+            validate(data)
+
+    def validate_output(self, agent: Agent, data: Any) -> None:
+        """Проверка результата контейнера (SchemaValidationError)"""
+        validate = self.schemas(agent).validate_output
+        if validate is not None:
+            validate(data)
+
+    def discard(self, agent_ids: Iterable[int]) -> None:
+        """Удаление валидаторов измененных агентов (все версии)"""
+        agent_ids = set(agent_ids)
+        for key in [key for key in self._entries if key[0] in agent_ids]:
+            del self._entries[key]
+
+
+# Глобальный реестр
+agent_schemas = AgentSchemaRegistry()
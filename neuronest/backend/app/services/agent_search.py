@@ -0,0 +1,209 @@
+"""
+Поиск по маркетплейсу агентов
+
+PostgreSQL: tsvector (search_vector) + триграммное сходство названия для
+опечаток. SQLite: FTS5 (agents_fts) с bm25. Итоговый порядок - релевантность
+текста, смешанная с rating и popularity_score. Схема поиска описана
+в app.models.agent_search.
+
+Автодополнение ищет по префиксу названия (индекс text_pattern_ops или FTS5
+prefix) и кэширует ответы в LRU с коротким TTL.
+"""
+
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import cast, column, func, literal_column, or_, select, table, text
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import RoutingSessionLocal
+from app.models.agent import Agent, AgentStatus
+
+# Вклад релевантности текста, рейтинга и популярности в итоговый score
+WEIGHT_TEXT = 0.7
+WEIGHT_RATING = 0.2
+WEIGHT_POPULARITY = 0.1
+# popularity_score, при котором вклад популярности достигает половины
+POPULARITY_HALF = 100.0
+
+# Минимальная длина запроса для поиска с опечатками
+TRIGRAM_MIN_LENGTH = 3
+
+agents_fts = table("agents_fts", column("rowid"))
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def build_fts_query(query: str, prefix_last: bool = True) -> Optional[str]:
+    """Безопасный запрос FTS5: токены в кавычках, последний - как префикс"""
+    tokens = TOKEN_RE.findall(query.lower())
+    if not tokens:
+        return None
+    terms = [f'"{token}"' for token in tokens]
+    if prefix_last:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+
+def next_prefix(prefix: str) -> str:
+    """Верхняя граница диапазона строк с данным префиксом"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def ranking_score(relevance):
+    """Релевантность текста, смешанная с рейтингом и популярностью"""
+    popularity = Agent.popularity_score / (Agent.popularity_score + POPULARITY_HALF)
+    return relevance * WEIGHT_TEXT + (Agent.rating / 100.0) * WEIGHT_RATING + popularity * WEIGHT_POPULARITY
+
+
+class AgentSearch:
+    """Полнотекстовый поиск и автодополнение"""
+
+    def __init__(self, session_factory=None, cache_size: int = 2000, cache_ttl: float = 30.0):
+        self.session_factory = session_factory or RoutingSessionLocal
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache: "OrderedDict[tuple, tuple[float, List[dict]]]" = OrderedDict()
+
+    async def search(
+        self,
+        query: str,
+        category: Optional[str] = None,
+        tag: Optional[str] = None,
+        limit: int = 20,
+        offset: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """Агенты по запросу в порядке score"""
+        query = query.strip()
+        async with self.session_factory() as db:
+            dialect = db.bind.dialect.name
+            if dialect == "postgresql":
+                statement = self._postgres_search(query)
+            else:
+                statement = self._sqlite_search(query)
+            if statement is None:
+                return []
+
+            statement = statement.where(Agent.status == AgentStatus.ACTIVE)
+            if category:
+                statement = statement.where(Agent.category == category)
+            if tag:
+                statement = statement.where(self._tag_filter(dialect, tag))
+            statement = statement.order_by(literal_column("score").desc(), Agent.id).limit(limit).offset(offset)
+
+            result = await db.execute(statement)
+            return [
+                {**agent.to_dict(), "score": round(float(score), 4)}
+                for agent, score in result.all()
+            ]
+
+    def _postgres_search(self, query: str):
+        tsquery = func.websearch_to_tsquery("simple", query)
+        vector = literal_column("agents.search_vector")
+        lowered_name = func.lower(Agent.display_name)
+        similarity = func.similarity(lowered_name, query.lower())
+        relevance = func.ts_rank_cd(vector, tsquery) + similarity
+
+        matches = [vector.bool_op("@@")(tsquery)]
+        if len(query) >= TRIGRAM_MIN_LENGTH:
+            matches.append(lowered_name.bool_op("%")(query.lower()))
+        return select(Agent, ranking_score(relevance).label("score")).where(or_(*matches))
+
+    def _sqlite_search(self, query: str):
+        fts_query = build_fts_query(query)
+        if fts_query is None:
+            return None
+        # bm25 отрицательный, чем меньше - тем лучше; приводим к (0, 1)
+        bm25 = literal_column("bm25(agents_fts, 10.0, 10.0, 5.0, 2.0, 1.0)")
+        relevance = -bm25 / (1.0 - bm25)
+        return (
+            select(Agent, ranking_score(relevance).label("score"))
+            .join(agents_fts, agents_fts.c.rowid == Agent.id)
+            .where(literal_column("agents_fts").op("MATCH")(fts_query))
+        )
+
+    @staticmethod
+    def _tag_filter(dialect: str, tag: str):
+        if dialect == "postgresql":
+            return cast(Agent.tags, JSONB).contains([tag])
+        return text("EXISTS (SELECT 1 FROM json_each(agents.tags) WHERE json_each.value = :tag)").bindparams(tag=tag)
+
+    # -------------------------------------------------------------------------
+    # Автодополнение
+    # -------------------------------------------------------------------------
+
+    async def autocomplete(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Названия агентов по началу строки"""
+        prefix = prefix.strip().lower()
+        if not prefix:
+            return []
+
+        key = (prefix, limit)
+        now = time.monotonic()
+        cached = self._cache.get(key)
+        if cached and now - cached[0] < self.cache_ttl:
+            self._cache.move_to_end(key)
+            return cached[1]
+
+        async with self.session_factory() as db:
+            if db.bind.dialect.name == "postgresql":
+                suggestions = await self._postgres_autocomplete(db, prefix, limit)
+            else:
+                suggestions = await self._sqlite_autocomplete(db, prefix, limit)
+
+        self._cache[key] = (now, suggestions)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return suggestions
+
+    async def _postgres_autocomplete(self, db: AsyncSession, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        lowered_name = func.lower(Agent.display_name)
+        columns = (Agent.id, Agent.name, Agent.display_name)
+        # Операторы ~>=~ / ~<~ используют индекс text_pattern_ops и с параметрами
+        statement = (
+            select(*columns)
+            .where(
+                Agent.status == AgentStatus.ACTIVE,
+                lowered_name.op("~>=~")(prefix),
+                lowered_name.op("~<~")(next_prefix(prefix))
+            )
+            .order_by(Agent.popularity_score.desc(), Agent.id)
+            .limit(limit)
+        )
+        rows = (await db.execute(statement)).all()
+
+        if len(rows) < limit and len(prefix) >= TRIGRAM_MIN_LENGTH:
+            # Опечатка в начале названия: добираем по триграммному сходству
+            seen = {row.id for row in rows}
+            fuzzy = (
+                select(*columns)
+                .where(Agent.status == AgentStatus.ACTIVE, lowered_name.bool_op("%")(prefix))
+                .order_by(func.similarity(lowered_name, prefix).desc(), Agent.popularity_score.desc())
+                .limit(limit)
+            )
+            rows += [row for row in (await db.execute(fuzzy)).all() if row.id not in seen][:limit - len(rows)]
+
+        return [{"id": row.id, "name": row.name, "display_name": row.display_name} for row in rows]
+
+    async def _sqlite_autocomplete(self, db: AsyncSession, prefix: str, limit: int) -> List[Dict[str, Any]]:
+        fts_query = build_fts_query(prefix)
+        if fts_query is None:
+            return []
+        statement = (
+            select(Agent.id, Agent.name, Agent.display_name)
+            .join(agents_fts, agents_fts.c.rowid == Agent.id)
+            .where(
+                literal_column("agents_fts").op("MATCH")(f"{{name display_name}} : ({fts_query})"),
+                Agent.status == AgentStatus.ACTIVE
+            )
+            .order_by(Agent.popularity_score.desc(), Agent.id)
+            .limit(limit)
+        )
+        rows = (await db.execute(statement)).all()
+        return [{"id": row.id, "name": row.name, "display_name": row.display_name} for row in rows]
+
+
+agent_search = AgentSearch()
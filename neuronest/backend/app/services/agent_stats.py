@@ -0,0 +1,247 @@
+"""
+Статистика выполнений AI агентов
+
+Завершенные выполнения не трогают строку агента: счетчики копятся в Redis
+(hash с дельтами), уникальные пользователи - в HyperLogLog, время
+выполнения - в t-digest (модуль RedisBloom) или, если модуля нет, в
+ограниченной выборке последних значений. Периодический flusher забирает
+дельты атомарно и записывает их одним пакетным UPDATE с относительными
+приращениями, там же пересчитываются среднее время и рейтинг.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import Integer, bindparam, case, cast, func, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis import get_redis
+from app.models.agent import Agent, RATING_POPULARITY_WEIGHT, RATING_SUCCESS_WEIGHT
+from app.services.agent_catalog import agent_catalog
+
+logger = logging.getLogger(__name__)
+
+DELTA_KEY = "agents:stats:{agent_id}"
+USERS_KEY = "agents:stats:{agent_id}:users"
+TDIGEST_KEY = "agents:stats:{agent_id}:tdigest"
+SAMPLES_KEY = "agents:stats:{agent_id}:samples"
+DIRTY_KEY = "agents:stats:dirty"
+
+# Атомарно забрать и удалить накопленные дельты
+CLAIM_DELTAS_LUA = """
+local values = redis.call('HGETALL', KEYS[1])
+redis.call('DEL', KEYS[1])
+return values
+"""
+
+
+def percentile(samples: Sequence[float], q: float) -> Optional[int]:
+    """Перцентиль выборки (nearest-rank)"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return int(ordered[index])
+
+
+class AgentStatsRecorder:
+    """Запись выполнений в Redis и сброс в БД"""
+
+    def __init__(self, reservoir_size: int = None):
+        self.reservoir_size = reservoir_size or settings.AGENT_STATS_RESERVOIR_SIZE
+        # None - еще не проверяли наличие t-digest в Redis
+        self._tdigest: Optional[bool] = None
+        self._claim = None
+        self._tdigest_keys: set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    async def record(self, agent_id: int, duration_ms: int, was_successful: bool, user_id: Optional[int] = None) -> bool:
+        """Учет завершенного выполнения; False если Redis недоступен"""
+        redis = await get_redis()
+        if redis is None:
+            return False
+        try:
+            if self._tdigest is None:
+                self._tdigest = await self._detect_tdigest(redis)
+            if self._tdigest:
+                await self._ensure_tdigest(redis, TDIGEST_KEY.format(agent_id=agent_id))
+
+            async with redis.pipeline(transaction=True) as pipe:
+                key = DELTA_KEY.format(agent_id=agent_id)
+                pipe.hincrby(key, "total", 1)
+                pipe.hincrby(key, "successful", 1 if was_successful else 0)
+                pipe.hincrby(key, "time_ms", int(duration_ms))
+                pipe.hset(key, "last_at", time.time())
+                if user_id is not None:
+                    pipe.pfadd(USERS_KEY.format(agent_id=agent_id), user_id)
+                if self._tdigest:
+                    pipe.execute_command("TDIGEST.ADD", TDIGEST_KEY.format(agent_id=agent_id), duration_ms)
+                else:
+                    samples_key = SAMPLES_KEY.format(agent_id=agent_id)
+                    pipe.lpush(samples_key, int(duration_ms))
+                    pipe.ltrim(samples_key, 0, self.reservoir_size - 1)
+                pipe.sadd(DIRTY_KEY, agent_id)
+                await pipe.execute()
+            return True
+        except Exception as e:
+            logger.warning("Статистика агентов: ошибка записи в Redis: %s", e)
+            return False
+
+    async def _detect_tdigest(self, redis) -> bool:
+        probe = "agents:stats:tdigest-probe"
+        try:
+            await redis.execute_command("TDIGEST.CREATE", probe)
+            await redis.delete(probe)
+            return True
+        except Exception as e:
+            if "exist" in str(e).lower():
+                return True
+            logger.info("Статистика агентов: t-digest недоступен, используется выборка последних значений")
+            return False
+
+    async def _ensure_tdigest(self, redis, key: str) -> None:
+        if key in self._tdigest_keys:
+            return
+        try:
+            await redis.execute_command("TDIGEST.CREATE", key)
+        except Exception as e:
+            if "exist" not in str(e).lower():
+                raise
+        self._tdigest_keys.add(key)
+
+    # -------------------------------------------------------------------------
+    # Сброс в БД
+    # -------------------------------------------------------------------------
+
+    async def flush(self) -> int:
+        """Пакетная запись накопленной статистики; количество обновленных агентов"""
+        redis = await get_redis()
+        if redis is None:
+            return 0
+        if self._claim is None:
+            self._claim = redis.register_script(CLAIM_DELTAS_LUA)
+        if self._tdigest is None:
+            self._tdigest = await self._detect_tdigest(redis)
+
+        agent_ids = await redis.spop(DIRTY_KEY, settings.AGENT_STATS_FLUSH_BATCH)
+        if not agent_ids:
+            return 0
+
+        # Забранные дельты возвращаются в Redis при любой ошибке до записи в БД
+        claimed = []
+        try:
+            for agent_id in agent_ids:
+                raw = await self._claim(keys=[DELTA_KEY.format(agent_id=agent_id)])
+                deltas = dict(zip(raw[::2], raw[1::2]))
+                if deltas:
+                    claimed.append((agent_id, deltas))
+            if not claimed:
+                return 0
+            rows = [await self._row(redis, agent_id, deltas) for agent_id, deltas in claimed]
+            async with AsyncSessionLocal() as db:
+                await save_statistics(db, rows)
+        except Exception:
+            await self._restore(redis, agent_ids, claimed)
+            raise
+
+        # Строки обновлены мимо ORM, поэтому каталог инвалидируется явно
+        await agent_catalog.invalidate()
+        return len(rows)
+
+    async def _row(self, redis, agent_id, deltas: Dict[str, str]) -> Dict[str, Any]:
+        p50, p95 = await self._percentiles(redis, agent_id)
+        return {
+            "b_id": int(agent_id),
+            "b_total": int(deltas.get("total", 0)),
+            "b_successful": int(deltas.get("successful", 0)),
+            "b_time_ms": int(deltas.get("time_ms", 0)),
+            "b_last_at": datetime.utcfromtimestamp(float(deltas.get("last_at", time.time()))),
+            "b_p50": p50,
+            "b_p95": p95,
+            "b_unique_users": await redis.pfcount(USERS_KEY.format(agent_id=agent_id)),
+        }
+
+    async def _percentiles(self, redis, agent_id) -> tuple:
+        if self._tdigest:
+            values = await redis.execute_command("TDIGEST.QUANTILE", TDIGEST_KEY.format(agent_id=agent_id), 0.5, 0.95)
+            return tuple(None if str(v) == "nan" else int(float(v)) for v in values)
+        samples = [float(v) for v in await redis.lrange(SAMPLES_KEY.format(agent_id=agent_id), 0, -1)]
+        return percentile(samples, 0.5), percentile(samples, 0.95)
+
+    async def _restore(self, redis, agent_ids: List[str], claimed: List[tuple]) -> None:
+        """Возврат забранных дельт в Redis, если сброс не удался"""
+        async with redis.pipeline(transaction=False) as pipe:
+            # Незабранные агенты остаются в очереди на сброс
+            pipe.sadd(DIRTY_KEY, *agent_ids)
+            for agent_id, deltas in claimed:
+                key = DELTA_KEY.format(agent_id=agent_id)
+                for field in ("total", "successful", "time_ms"):
+                    pipe.hincrby(key, field, int(deltas.get(field, 0)))
+                if "last_at" in deltas:
+                    # Не затираем время более нового выполнения
+                    pipe.hsetnx(key, "last_at", deltas["last_at"])
+            await pipe.execute()
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        # Последний сброс, чтобы не терять накопленное при остановке
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error("Статистика агентов: ошибка сброса при остановке: %s", e)
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.AGENT_STATS_FLUSH_INTERVAL)
+            try:
+                while await self.flush() >= settings.AGENT_STATS_FLUSH_BATCH:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Статистика агентов: ошибка сброса в БД: %s", e, exc_info=True)
+
+
+async def save_statistics(db: AsyncSession, rows: List[Dict[str, Any]]) -> None:
+    """Пакетный UPDATE статистики с относительными приращениями и пересчетом рейтинга"""
+    agents = Agent.__table__
+    total = agents.c.total_executions + bindparam("b_total")
+    successful = agents.c.successful_executions + bindparam("b_successful")
+    success_rate = successful * 100.0 / case((total > 0, total), else_=1)
+    popularity = case((total > 100, 100), else_=total)
+
+    statement = (
+        update(agents)
+        .where(agents.c.id == bindparam("b_id"))
+        .values(
+            total_executions=total,
+            successful_executions=successful,
+            # avg_execution_time в секундах, дельта времени в миллисекундах
+            avg_execution_time=(
+                (agents.c.avg_execution_time * agents.c.total_executions * 1000 + bindparam("b_time_ms"))
+                / (case((total > 0, total), else_=1) * 1000)
+            ),
+            rating=cast(success_rate * RATING_SUCCESS_WEIGHT + popularity * RATING_POPULARITY_WEIGHT, Integer),
+            p50_execution_ms=func.coalesce(bindparam("b_p50", type_=Integer), agents.c.p50_execution_ms),
+            p95_execution_ms=func.coalesce(bindparam("b_p95", type_=Integer), agents.c.p95_execution_ms),
+            unique_users=bindparam("b_unique_users"),
+            last_execution_at=bindparam("b_last_at"),
+        )
+    )
+    await db.execute(statement, rows)
+    await db.commit()
+
+
+agent_stats = AgentStatsRecorder()
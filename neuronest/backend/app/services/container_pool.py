@@ -0,0 +1,268 @@
+"""
+Пул "теплых" контейнеров AI агентов
+
+Для популярных агентов заранее создаются и ставятся на паузу контейнеры
+с командой ожидания вместо команды агента. При выполнении контейнер
+снимается с паузы, а команда агента запускается через docker exec с
+входными данными в окружении - без создания и старта контейнера.
+
+Размер пула каждого агента пропорционален его total_executions среди
+агентов, запускавшихся за последние AGENTS_POOL_ACTIVE_WINDOW_HOURS часов.
+Образы активных агентов скачиваются заранее при изменении каталога.
+"""
+
+import asyncio
+import logging
+import math
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, Deque, Dict, Iterable, List, Optional, Set
+
+import docker
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.models.agent import Agent, AgentStatus
+from app.services.agent_runner import container_options, image_ref
+
+logger = logging.getLogger(__name__)
+
+POOL_LABEL = "neuronest.pool"
+
+
+def pool_targets(agents: Iterable[Agent], max_total: int, max_per_agent: int) -> Dict[str, int]:
+    """Количество теплых контейнеров на агента пропорционально числу выполнений"""
+    ranked = sorted(
+        (agent for agent in agents if agent.total_executions),
+        key=lambda agent: agent.total_executions,
+        reverse=True
+    )
+    total_executions = sum(agent.total_executions for agent in ranked)
+    targets: Dict[str, int] = {}
+    left = max_total
+    for agent in ranked:
+        if left <= 0:
+            break
+        share = math.ceil(max_total * agent.total_executions / total_executions)
+        size = min(share, max_per_agent, left)
+        targets[agent.name] = size
+        left -= size
+    return targets
+
+
+class WarmContainer:
+    """Теплый контейнер и команда агента для docker exec"""
+
+    def __init__(self, container, command: List[str], image: str):
+        self.container = container
+        self.command = command
+        self.image = image
+        self.uses = 0
+        self.start_time_ms: Optional[int] = None
+
+
+class ContainerPool:
+    """Пул приостановленных контейнеров по агентам"""
+
+    def __init__(self, client: docker.DockerClient = None):
+        self.docker = client or docker.from_env()
+        self._idle: Dict[str, Deque[WarmContainer]] = {}
+        self._targets: Dict[str, int] = {}
+        self._agents: Dict[str, Agent] = {}
+        self._commands: Dict[str, List[str]] = {}
+        self._pulled: set = set()
+        self._filling: Dict[str, asyncio.Task] = {}
+        # Ссылки на фоновые скачивания: иначе задачу может собрать GC
+        self._pulling: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._catalog_signature = None
+
+        self.counters = {"warm_hits": 0, "cold_misses": 0, "recycled": 0, "destroyed": 0}
+
+    # -------------------------------------------------------------------------
+    # Выдача и возврат контейнеров
+    # -------------------------------------------------------------------------
+
+    async def acquire(self, agent: Agent) -> Optional[WarmContainer]:
+        """Теплый контейнер агента, снятый с паузы; None если пул пуст"""
+        idle = self._idle.get(agent.name)
+        image = image_ref(agent)
+        while idle:
+            warm = idle.popleft()
+            if warm.image != image:
+                # Образ агента обновился после создания контейнера
+                await self._destroy(warm)
+                continue
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(warm.container.unpause)
+            except docker.errors.APIError as e:
+                logger.warning("Пул контейнеров: не удалось снять с паузы %s: %s", warm.container.id[:12], e)
+                await self._destroy(warm)
+                continue
+            warm.start_time_ms = int((time.perf_counter() - started) * 1000)
+            warm.uses += 1
+            self.counters["warm_hits"] += 1
+            self._schedule_fill(agent.name)
+            return warm
+
+        self.counters["cold_misses"] += 1
+        self._schedule_fill(agent.name)
+        return None
+
+    async def release(self, agent: Agent, warm: WarmContainer, healthy: bool) -> None:
+        """Возврат контейнера в пул или его удаление"""
+        idle = self._idle.setdefault(agent.name, deque())
+        if (
+            healthy
+            and settings.AGENTS_POOL_RECYCLE
+            and warm.uses < settings.AGENTS_POOL_MAX_USES
+            and len(idle) < self._targets.get(agent.name, 0)
+        ):
+            try:
+                await asyncio.to_thread(warm.container.pause)
+                idle.append(warm)
+                self.counters["recycled"] += 1
+                return
+            except docker.errors.APIError as e:
+                logger.warning("Пул контейнеров: не удалось приостановить %s: %s", warm.container.id[:12], e)
+        await self._destroy(warm)
+        self._schedule_fill(agent.name)
+
+    def stats(self) -> Dict[str, Any]:
+        """Размеры пула и счетчики попаданий"""
+        return {
+            **self.counters,
+            "targets": dict(self._targets),
+            "idle": {name: len(idle) for name, idle in self._idle.items()},
+        }
+
+    # -------------------------------------------------------------------------
+    # Жизненный цикл
+    # -------------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Удаление контейнеров прошлого запуска и фоновая сверка с каталогом"""
+        orphans = await asyncio.to_thread(
+            self.docker.containers.list,
+            all=True,
+            filters={"label": f"{POOL_LABEL}=warm"}
+        )
+        for container in orphans:
+            await asyncio.to_thread(container.remove, force=True)
+        if orphans:
+            logger.info("Пул контейнеров: удалено %d контейнеров прошлого запуска", len(orphans))
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановка сверки и удаление теплых контейнеров"""
+        tasks = [task for task in [self._task, *self._filling.values(), *self._pulling] if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for idle in self._idle.values():
+            while idle:
+                await self._destroy(idle.popleft())
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.reconcile()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Пул контейнеров: ошибка сверки с каталогом: %s", e, exc_info=True)
+            await asyncio.sleep(settings.AGENTS_POOL_RECONCILE_INTERVAL)
+
+    async def reconcile(self) -> None:
+        """Пересчет размеров пула и скачивание образов при изменении каталога"""
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(Agent).where(Agent.status == AgentStatus.ACTIVE))
+            agents = list(result.scalars())
+
+        signature = sorted((agent.name, image_ref(agent)) for agent in agents)
+        if signature != self._catalog_signature:
+            self._catalog_signature = signature
+            for image in {image_ref(agent) for agent in agents} - self._pulled:
+                task = asyncio.create_task(self._prepull(image))
+                self._pulling.add(task)
+                task.add_done_callback(self._pulling.discard)
+
+        since = datetime.utcnow() - timedelta(hours=settings.AGENTS_POOL_ACTIVE_WINDOW_HOURS)
+        recent = [agent for agent in agents if agent.last_execution_at and agent.last_execution_at >= since]
+        self._agents = {agent.name: agent for agent in agents}
+        self._targets = pool_targets(
+            recent,
+            settings.AGENTS_POOL_MAX_CONTAINERS,
+            settings.AGENTS_POOL_MAX_PER_AGENT
+        )
+
+        for name, idle in self._idle.items():
+            while len(idle) > self._targets.get(name, 0):
+                await self._destroy(idle.pop())
+        for name in self._targets:
+            self._schedule_fill(name)
+
+    # -------------------------------------------------------------------------
+    # Наполнение пула
+    # -------------------------------------------------------------------------
+
+    def _schedule_fill(self, name: str) -> None:
+        if name not in self._targets or name in self._filling:
+            return
+        task = asyncio.create_task(self._fill(name))
+        self._filling[name] = task
+        task.add_done_callback(lambda _: self._filling.pop(name, None))
+
+    async def _fill(self, name: str) -> None:
+        idle = self._idle.setdefault(name, deque())
+        while len(idle) < self._targets.get(name, 0):
+            agent = self._agents.get(name)
+            if agent is None:
+                return
+            try:
+                idle.append(await self._create(agent))
+            except Exception as e:
+                logger.warning("Пул контейнеров: не удалось создать контейнер %s: %s", name, e)
+                return
+
+    async def _create(self, agent: Agent) -> WarmContainer:
+        """Создание, запуск и приостановка контейнера с командой ожидания"""
+        image = image_ref(agent)
+        command = await self._agent_command(image)
+        options = container_options(agent)
+        options["labels"] = {**options["labels"], POOL_LABEL: "warm"}
+        container = await asyncio.to_thread(
+            self.docker.containers.run,
+            detach=True,
+            entrypoint=settings.AGENTS_POOL_IDLE_COMMAND.split(),
+            command=[],
+            **options
+        )
+        await asyncio.to_thread(container.pause)
+        return WarmContainer(container, command, image)
+
+    async def _agent_command(self, image: str) -> List[str]:
+        """ENTRYPOINT + CMD образа - команда агента для docker exec"""
+        if image not in self._commands:
+            config = (await asyncio.to_thread(self.docker.images.get, image)).attrs["Config"]
+            self._commands[image] = (config.get("Entrypoint") or []) + (config.get("Cmd") or [])
+        return self._commands[image]
+
+    async def _prepull(self, image: str) -> None:
+        repository, _, tag = image.rpartition(":")
+        try:
+            await asyncio.to_thread(self.docker.images.pull, repository, tag=tag)
+            self._pulled.add(image)
+            logger.info("Пул контейнеров: образ %s скачан", image)
+        except Exception as e:
+            logger.warning("Пул контейнеров: не удалось скачать %s: %s", image, e)
+
+    async def _destroy(self, warm: WarmContainer) -> None:
+        self.counters["destroyed"] += 1
+        try:
+            await asyncio.to_thread(warm.container.remove, force=True)
+        except docker.errors.APIError as e:
+            logger.warning("Пул контейнеров: не удалось удалить %s: %s", warm.container.id[:12], e)
@@ -0,0 +1,217 @@
+"""
+Архив результатов выполнений AI агентов
+
+output_data и logs завершенных выполнений старше AGENTS_CLEANUP_AFTER_HOURS
+переносятся из горячей таблицы agent_executions в сжатые zstd блобы. В
+строке остается ссылка payload_ref, сами колонки обнуляются небольшими
+пакетами, каждый в своей короткой транзакции. При чтении выполнения
+результат подгружается из архива по ссылке.
+
+Хранилище задается AGENTS_ARCHIVE_URL. Сейчас поддерживается локальный
+каталог (file://), ключи имеют вид объектного хранилища, поэтому S3
+совместимое хранилище подключается отдельной реализацией ArchiveStore.
+"""
+
+import asyncio
+import logging
+import os
+import tempfile
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import orjson
+import zstandard
+from sqlalchemy import bindparam, null, select, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis import get_redis
+from app.models.agent import AgentExecution
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveStore(ABC):
+    """Хранилище блобов архива (синхронное, вызывается в отдельном потоке)"""
+
+    @abstractmethod
+    def put(self, key: str, data: bytes) -> None:
+        ...
+
+    @abstractmethod
+    def get(self, key: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+
+class LocalArchiveStore(ArchiveStore):
+    """Архив в локальном каталоге (или в общем томе между API и воркерами)"""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def _path(self, key: str) -> Path:
+        path = (self.root / key).resolve()
+        if self.root.resolve() not in path.parents:
+            raise ValueError(f"Недопустимый ключ архива: {key}")
+        return path
+
+    def put(self, key: str, data: bytes) -> None:
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Атомарная запись: читатель не увидит недописанный блоб
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def get(self, key: str) -> bytes:
+        return self._path(key).read_bytes()
+
+    def delete(self, key: str) -> None:
+        self._path(key).unlink(missing_ok=True)
+
+
+def create_store(url: str) -> ArchiveStore:
+    """Хранилище по AGENTS_ARCHIVE_URL"""
+    if url.startswith("file://"):
+        return LocalArchiveStore(url[len("file://"):])
+    raise ValueError(f"Неподдерживаемое хранилище архива: {url}")
+
+
+def archive_key(execution_id: str, completed_at: datetime) -> str:
+    return f"executions/{completed_at:%Y/%m/%d}/{execution_id}.json.zst"
+
+
+class ExecutionArchiver:
+    """Перенос результатов выполнений в архив и чтение из него"""
+
+    LOCK_KEY = "agents:archive:leader"
+
+    def __init__(self, store: Optional[ArchiveStore] = None, session_factory=None):
+        self._store = store
+        self.session_factory = session_factory or AsyncSessionLocal
+        self._compressor = zstandard.ZstdCompressor(level=settings.AGENTS_ARCHIVE_ZSTD_LEVEL)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def store(self) -> ArchiveStore:
+        if self._store is None:
+            self._store = create_store(settings.AGENTS_ARCHIVE_URL)
+        return self._store
+
+    def _pack(self, output_data: Any, logs: Optional[str]) -> bytes:
+        return self._compressor.compress(orjson.dumps({"output_data": output_data, "logs": logs}))
+
+    def _unpack(self, blob: bytes) -> Dict[str, Any]:
+        return orjson.loads(self._decompressor.decompress(blob))
+
+    async def archive_once(self) -> int:
+        """Архивация одного пакета; количество обработанных выполнений"""
+        cutoff = datetime.utcnow() - timedelta(hours=settings.AGENTS_CLEANUP_AFTER_HOURS)
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                select(
+                    AgentExecution.id, AgentExecution.execution_id, AgentExecution.completed_at,
+                    AgentExecution.output_data, AgentExecution.logs
+                )
+                .where(AgentExecution.archived_at.is_(None), AgentExecution.completed_at < cutoff)
+                .order_by(AgentExecution.completed_at)
+                .limit(settings.AGENTS_ARCHIVE_BATCH)
+            )).all()
+            if not rows:
+                return 0
+
+            blobs: List[Tuple[str, bytes]] = []
+            params = []
+            now = datetime.utcnow()
+            for row in rows:
+                key = None
+                if row.output_data is not None or row.logs:
+                    key = archive_key(row.execution_id, row.completed_at)
+                    blobs.append((key, self._pack(row.output_data, row.logs)))
+                params.append({"b_id": row.id, "b_ref": key, "b_archived_at": now})
+
+            # Блобы пишутся до обнуления колонок: сбой между шагами не теряет данные
+            await asyncio.to_thread(self._put_all, blobs)
+
+            executions = AgentExecution.__table__
+            await db.execute(
+                update(executions)
+                .where(executions.c.id == bindparam("b_id"), executions.c.archived_at.is_(None))
+                .values(
+                    output_data=null(),
+                    logs=null(),
+                    payload_ref=bindparam("b_ref"),
+                    archived_at=bindparam("b_archived_at"),
+                ),
+                params
+            )
+            await db.commit()
+
+        logger.info("Архив выполнений: перенесено %d (блобов %d)", len(rows), len(blobs))
+        return len(rows)
+
+    def _put_all(self, blobs: List[Tuple[str, bytes]]) -> None:
+        for key, data in blobs:
+            self.store.put(key, data)
+
+    async def load_payload(self, execution: AgentExecution) -> None:
+        """Подгрузка output_data и logs архивного выполнения (без пометки объекта измененным)"""
+        if not execution.payload_ref:
+            return
+        try:
+            payload = self._unpack(await asyncio.to_thread(self.store.get, execution.payload_ref))
+        except Exception as e:
+            logger.warning("Архив выполнений: не удалось прочитать %s: %s", execution.payload_ref, e)
+            return
+        set_committed_value(execution, "output_data", payload.get("output_data"))
+        set_committed_value(execution, "logs", payload.get("logs"))
+
+    # -------------------------------------------------------------------------
+    # Фоновая архивация
+    # -------------------------------------------------------------------------
+
+    async def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        interval = settings.AGENTS_ARCHIVE_INTERVAL
+        while True:
+            try:
+                if await self._acquire_leadership(interval):
+                    while await self.archive_once() >= settings.AGENTS_ARCHIVE_BATCH:
+                        # Пауза между пакетами, чтобы не вытеснять рабочую нагрузку
+                        await asyncio.sleep(0.1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Архив выполнений: ошибка архивации: %s", e, exc_info=True)
+            await asyncio.sleep(interval)
+
+    async def _acquire_leadership(self, interval: int) -> bool:
+        """Архивацию ведет только один воркер (блокировка в Redis на интервал)"""
+        redis = await get_redis()
+        if redis is None:
+            return True
+        return bool(await redis.set(self.LOCK_KEY, "1", nx=True, ex=interval))
+
+
+execution_archive = ExecutionArchiver()
@@ -0,0 +1,158 @@
+"""
+События выполнения агентов
+
+Переходы состояния AgentExecution, прогресс и вывод контейнера публикуются
+компактными событиями в Redis stream на каждое выполнение. Клиенты читают
+их через SSE или WebSocket и могут продолжить с последнего полученного ID
+события (Last-Event-ID).
+"""
+
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.core.database import mark_user_write
+from app.core.redis import get_redis
+from app.models.agent import AgentExecution
+
+logger = logging.getLogger(__name__)
+
+STREAM_KEY = "exec:events:{execution_id}"
+
+# После этих событий новых не будет
+TERMINAL_EVENTS = {"completed", "failed", "timeout", "cancelled"}
+
+Event = Tuple[str, str, Dict[str, Any]]
+
+
+def stream_key(execution_id: str) -> str:
+    return STREAM_KEY.format(execution_id=execution_id)
+
+
+def status_event(execution: AgentExecution) -> Tuple[str, Dict[str, Any]]:
+    """Событие текущего статуса выполнения"""
+    status = execution.status.value
+    data: Dict[str, Any] = {"status": status, "progress": execution.progress or 0}
+    if execution.error_message:
+        data["error"] = execution.error_message
+    if execution.execution_time is not None:
+        data["execution_time"] = execution.execution_time
+    return (status if status in TERMINAL_EVENTS else "status"), data
+
+
+async def publish(execution_id: str, event: str, data: Dict[str, Any]) -> Optional[str]:
+    """Добавление события в поток выполнения; None если Redis недоступен"""
+    redis = await get_redis()
+    if redis is None:
+        return None
+    key = stream_key(execution_id)
+    try:
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.xadd(
+                key,
+                {"event": event, "data": json.dumps(data, ensure_ascii=False, separators=(",", ":"))},
+                maxlen=settings.EXECUTION_EVENTS_MAXLEN,
+                approximate=True
+            )
+            pipe.expire(key, settings.EXECUTION_EVENTS_TTL)
+            event_id, _ = await pipe.execute()
+        return event_id
+    except Exception as e:
+        # События вспомогательные: выполнение не должно падать из-за Redis
+        logger.warning("События выполнения %s: ошибка публикации: %s", execution_id, e)
+        return None
+
+
+async def publish_status(execution: AgentExecution) -> Optional[str]:
+    """Публикация текущего статуса выполнения"""
+    # До события: клиент, получивший его, читает статус из primary
+    await mark_user_write(execution.user_id)
+    event, data = status_event(execution)
+    return await publish(execution.execution_id, event, data)
+
+
+async def read(execution_id: str, last_id: str = "0", count: int = 100, block_ms: Optional[int] = None) -> List[Event]:
+    """События после last_id"""
+    redis = await get_redis()
+    response = await redis.xread({stream_key(execution_id): last_id or "0"}, count=count, block=block_ms)
+    events = []
+    for _, messages in response or ():
+        for event_id, fields in messages:
+            events.append((event_id, fields["event"], json.loads(fields["data"])))
+    return events
+
+
+async def has_events(execution_id: str) -> bool:
+    redis = await get_redis()
+    return bool(await redis.exists(stream_key(execution_id)))
+
+
+async def follow(execution_id: str, last_id: str = "0", keepalive_seconds: float = 15) -> AsyncIterator[Optional[Event]]:
+    """
+    События выполнения до терминального
+    None отдается каждые keepalive_seconds без событий (для keep-alive клиента).
+    """
+    last_id = last_id or "0"
+    while True:
+        events = await read(execution_id, last_id, block_ms=int(keepalive_seconds * 1000))
+        if not events:
+            yield None
+            continue
+        for event in events:
+            last_id = event[0]
+            yield event
+            if event[1] in TERMINAL_EVENTS:
+                return
+
+
+def format_sse(event: Event) -> str:
+    """Событие в формате text/event-stream"""
+    event_id, name, data = event
+    return f"id: {event_id}\nevent: {name}\ndata: {json.dumps(data, ensure_ascii=False, separators=(',', ':'))}\n\n"
+
+
+class LogPublisher:
+    """Публикация вывода контейнера и прогресса по мере поступления"""
+
+    def __init__(self, execution: AgentExecution):
+        self.execution = execution
+        self._partial = ""
+
+    async def __call__(self, chunk: str) -> None:
+        # Незавершенная строка ждет следующего фрагмента, чтобы не разрезать строку прогресса
+        lines = (self._partial + chunk).splitlines(keepends=True)
+        self._partial = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+        await self._publish_lines(lines)
+
+    async def flush(self) -> None:
+        """Публикация остатка вывода без перевода строки"""
+        if self._partial:
+            lines, self._partial = [self._partial], ""
+            await self._publish_lines(lines)
+
+    async def _publish_lines(self, lines: List[str]) -> None:
+        output = []
+        for line in lines:
+            progress = parse_progress(line)
+            if progress is None:
+                output.append(line)
+                continue
+            self.execution.update_progress(progress)
+            await publish(self.execution.execution_id, "progress", {"progress": self.execution.progress})
+        if output:
+            await publish(self.execution.execution_id, "log", {"chunk": "".join(output)})
+
+
+def parse_progress(line: str) -> Optional[int]:
+    """Строка прогресса агента: JSON объект с единственным ключом progress"""
+    line = line.strip()
+    if not line.startswith("{") or '"progress"' not in line:
+        return None
+    try:
+        data = json.loads(line)
+    except ValueError:
+        return None
+    if isinstance(data, dict) and list(data) == ["progress"] and isinstance(data["progress"], (int, float)):
+        return int(data["progress"])
+    return None
@@ -0,0 +1,117 @@
+"""
+Журнал движения средств и баланс пользователя
+
+Каждое изменение баланса - запись LedgerEntry с ключом идемпотентности и
+один атомарный UPDATE users ... RETURNING с проверкой неотрицательного
+остатка. Баланс не читается перед списанием, поэтому параллельные
+списания одного пользователя не теряют обновлений и не требуют
+SELECT ... FOR UPDATE.
+
+Функции работают в транзакции вызывающего кода: commit делает он.
+"""
+
+from typing import NamedTuple, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.database import dialect_insert, mark_user_write
+from app.models.ledger import LedgerEntry
+from app.models.user import User
+
+
+class InsufficientFunds(Exception):
+    """Недостаточно средств для списания"""
+
+
+class IdempotencyConflict(Exception):
+    """Ключ идемпотентности уже использован для другой операции"""
+
+
+class Posting(NamedTuple):
+    entry_id: int
+    # Баланс после операции; None для повтора по ключу идемпотентности
+    balance: Optional[int]
+    replayed: bool
+
+
+async def _apply(db: AsyncSession, user_id: int, amount: int, spent: int) -> Optional[int]:
+    """Изменение снимка баланса; None если остаток стал бы отрицательным"""
+    users = User.__table__
+    balance = users.c.notpunks_balance + amount
+    values = {"notpunks_balance": balance}
+    if spent:
+        values["total_spent"] = users.c.total_spent + spent
+    result = await db.execute(
+        update(users)
+        .where(users.c.id == user_id, balance >= 0)
+        .values(**values)
+        .returning(users.c.notpunks_balance)
+    )
+    return result.scalar()
+
+
+async def post_entry(
+    db: AsyncSession,
+    user_id: int,
+    amount: int,
+    idempotency_key: str,
+    transaction_id: Optional[int] = None,
+    description: Optional[str] = None
+) -> Posting:
+    """
+    Изменение баланса на amount (отрицательный - списание)
+    Повтор с тем же ключом возвращает исходную запись, не меняя баланс.
+    """
+    entries = LedgerEntry.__table__
+    spent = -amount if amount < 0 else 0
+    balance = await _apply(db, user_id, amount, spent)
+    if balance is None:
+        # Повтор уже выполненного списания не должен зависеть от текущего остатка
+        existing = await _find(db, idempotency_key)
+        if existing is not None:
+            return _replay(existing, user_id, amount, idempotency_key)
+        raise InsufficientFunds(f"Недостаточно средств у пользователя {user_id}")
+
+    insert = dialect_insert(db)
+    entry_id = (await db.execute(
+        insert(entries)
+        .values(
+            user_id=user_id,
+            transaction_id=transaction_id,
+            amount=amount,
+            idempotency_key=idempotency_key,
+            description=description
+        )
+        .on_conflict_do_nothing(index_elements=[entries.c.idempotency_key])
+        .returning(entries.c.id)
+    )).scalar()
+    if entry_id is not None:
+        await mark_user_write(user_id)
+        return Posting(entry_id, balance, False)
+
+    # Повтор: операция уже учтена, изменение снимка откатывается
+    await _apply(db, user_id, -amount, -spent)
+    return _replay(await _find(db, idempotency_key), user_id, amount, idempotency_key)
+
+
+async def _find(db: AsyncSession, idempotency_key: str):
+    entries = LedgerEntry.__table__
+    result = await db.execute(
+        select(entries.c.id, entries.c.user_id, entries.c.amount).where(entries.c.idempotency_key == idempotency_key)
+    )
+    return result.one_or_none()
+
+
+def _replay(existing, user_id: int, amount: int, idempotency_key: str) -> Posting:
+    if existing.user_id != user_id or existing.amount != amount:
+        raise IdempotencyConflict(f"Ключ {idempotency_key} использован для другой операции")
+    return Posting(existing.id, None, True)
+
+
+async def ledger_balance(db: AsyncSession, user_id: int) -> int:
+    """Баланс по журналу (сверка со снимком users.notpunks_balance)"""
+    result = await db.execute(
+        select(func.coalesce(func.sum(LedgerEntry.amount), 0)).where(LedgerEntry.user_id == user_id)
+    )
+    return int(result.scalar())
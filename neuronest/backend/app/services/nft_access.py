@@ -0,0 +1,167 @@
+"""
+Сервис проверки NFT-доступа для основного приложения
+
+Использует общий пул соединений TON API клиента и кэш владения NFT.
+"""
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Dict, Iterable, List
+
+from sqlalchemy import bindparam, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.user import User
+from app.services.nft_index import NFTHolderIndex
+from nft_cache import NFTOwnershipCache
+from ton_api import ProviderError, TONAPIClient, filter_collection_nfts, get_access_level
+
+logger = logging.getLogger(__name__)
+
+
+class NFTAccessService:
+    """Проверка NFT-доступа кошельков через TON API и кэш"""
+
+    def __init__(self):
+        self.client = TONAPIClient(
+            api_key=settings.TON_API_KEY or None,
+            tonapi_token=settings.TONAPI_TOKEN or None,
+            allow_mock=settings.DEVELOPMENT_MODE,
+            on_request=metrics.observe_ton_request
+        )
+        self.cache = NFTOwnershipCache(
+            fetch=self._fetch,
+            ttl=settings.NFT_CACHE_TTL,
+            stale_ttl=settings.NFT_CACHE_STALE_TTL,
+            upstream_timeout=settings.NFT_CACHE_UPSTREAM_TIMEOUT,
+            on_count=metrics.cache_counter("nft")
+        )
+        # Локальный индекс владельцев: проверки без обращения к TON API
+        self.index = NFTHolderIndex(self.client) if settings.NFT_INDEX_ENABLED else None
+
+    async def start(self) -> None:
+        """Открытие сессии TON API, подключение Redis-уровня кэша и запуск индекса"""
+        await self.client.start()
+        self.cache.redis = await get_redis()
+        if self.index:
+            await self.index.load_state()
+            self.index.start()
+
+    async def close(self) -> None:
+        """Остановка индекса и закрытие сессии TON API"""
+        if self.index:
+            await self.index.stop()
+        self.cache.redis = None
+        await self.client.close()
+
+    async def _fetch(self, wallet_address: str) -> List[Dict[str, Any]]:
+        return await self.client.get_wallet_collection_nfts(wallet_address, settings.nft_collections)
+
+    async def check(self, wallet_address: str) -> Dict[str, Any]:
+        """Проверка NFT-доступа одного кошелька"""
+        if settings.DEV_SKIP_NFT_CHECK:
+            return {
+                "wallet_address": wallet_address,
+                "has_access": True,
+                "access_level": "basic",
+                "collections": [],
+                "total_nfts": 0
+            }
+
+        if self.index and self.index.is_ready():
+            try:
+                counts = await self.index.lookup(wallet_address)
+                total = sum(counts.values())
+                return {
+                    "wallet_address": wallet_address,
+                    "has_access": total > 0,
+                    "access_level": get_access_level(total),
+                    "collections": sorted(counts),
+                    "total_nfts": total
+                }
+            except ValueError:
+                # Адрес не разбирается локально, проверяем через TON API
+                pass
+
+        nfts = await self.cache.get(wallet_address)
+        valid_nfts = filter_collection_nfts(nfts, settings.nft_collections)
+        collections = sorted({nft["collection"] for nft in valid_nfts})
+        return {
+            "wallet_address": wallet_address,
+            "has_access": bool(valid_nfts),
+            "access_level": get_access_level(len(valid_nfts)),
+            "collections": collections,
+            "total_nfts": len(valid_nfts)
+        }
+
+    async def check_many(
+        self,
+        wallet_addresses: Iterable[str],
+        concurrency: int
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Проверка набора кошельков с ограниченным параллелизмом, результаты по мере готовности"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def check_one(wallet_address: str) -> Dict[str, Any]:
+            async with semaphore:
+                try:
+                    return await self.check(wallet_address)
+                except ProviderError as e:
+                    # Нет ответа TON API: результат не должен попасть в users
+                    logger.warning("TON API недоступен для %s: %s", wallet_address, e)
+                    return {"wallet_address": wallet_address, "error": "TON API недоступен"}
+                except Exception as e:
+                    logger.warning("Ошибка проверки NFT для %s: %s", wallet_address, e)
+                    return {"wallet_address": wallet_address, "error": str(e)}
+
+        tasks = [asyncio.create_task(check_one(address)) for address in dict.fromkeys(wallet_addresses)]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield await next_result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def save_access_results(db: AsyncSession, results: List[Dict[str, Any]]) -> int:
+    """Запись результатов проверки в users одним пакетным UPDATE; количество обновленных строк"""
+    rows = [
+        {
+            "b_wallet": result["wallet_address"],
+            "b_has_access": result["has_access"],
+            "b_collections": result["collections"]
+        }
+        for result in results
+        if "error" not in result
+    ]
+    if not rows:
+        return 0
+
+    users = User.__table__
+    statement = (
+        update(users)
+        .where(users.c.ton_wallet_address == bindparam("b_wallet"))
+        .values(
+            has_nft_access=bindparam("b_has_access"),
+            nft_collections=bindparam("b_collections")
+        )
+    )
+    result = await db.execute(statement, rows)
+    # Кошельки без пользователя не обновляются: считаем только записанные строки
+    updated = result.rowcount
+    if updated < 0:
+        # asyncpg не сообщает rowcount для executemany
+        updated = await db.scalar(
+            select(func.count())
+            .select_from(users)
+            .where(users.c.ton_wallet_address.in_([row["b_wallet"] for row in rows]))
+        )
+    await db.commit()
+    return updated
+
+
+# Глобальный сервис (сессия TON API открывается в lifespan)
+nft_access = NFTAccessService()
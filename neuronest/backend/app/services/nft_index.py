@@ -0,0 +1,341 @@
+"""
+Локальный индекс владельцев NFT коллекций
+
+Фоновая задача выгружает все элементы коллекций из Settings.nft_collections
+в таблицу nft_holdings и поддерживает ее актуальной по событиям транзакций
+NFT (TONAPI.io SSE). Проверка доступа становится одним индексным запросом
+к базе данных вместо обращения к TON API.
+"""
+
+import asyncio
+import logging
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import delete, func, select
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal, dialect_insert
+from app.core.redis import get_redis
+from app.models.nft_holding import NFTCollectionSync, NFTHolding
+from ton_api import TONAPIClient, to_raw_address
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class NFTHolderIndex:
+    """Синхронизация и поиск по локальному индексу владельцев NFT"""
+
+    LOCK_KEY = "nft_index:leader"
+    # Блокировка продлевается, пока идет цикл лидера (выгрузка может быть долгой)
+    LOCK_TTL = 90
+    LOCK_RENEW_INTERVAL = 30
+    UPSERT_BATCH = 1000
+    SSE_ACCOUNTS_PER_STREAM = 500
+    TRANSFER_BATCH_DELAY = 1.0
+
+    def __init__(
+        self,
+        client: TONAPIClient,
+        collections: Optional[List[str]] = None,
+        session_factory=AsyncSessionLocal
+    ):
+        self.client = client
+        self.collections = [to_raw_address(c) for c in (collections or settings.nft_collections)]
+        self.session_factory = session_factory
+        self._synced: set = set()
+        self._task: Optional[asyncio.Task] = None
+        self._is_leader = False
+        self._token = uuid.uuid4().hex
+
+    # -------------------------------------------------------------------------
+    # Поиск
+    # -------------------------------------------------------------------------
+
+    def is_ready(self) -> bool:
+        """Все коллекции выгружены хотя бы один раз"""
+        return self._synced.issuperset(self.collections)
+
+    async def lookup(self, wallet_address: str) -> Dict[str, int]:
+        """Количество NFT кошелька по коллекциям (один индексный запрос)"""
+        owner = to_raw_address(wallet_address)
+        async with self.session_factory() as db:
+            rows = await db.execute(
+                select(NFTHolding.collection, func.count())
+                .where(NFTHolding.owner == owner, NFTHolding.collection.in_(self.collections))
+                .group_by(NFTHolding.collection)
+            )
+            return {collection: count for collection, count in rows.all()}
+
+    async def load_state(self) -> None:
+        """Чтение состояния синхронизации (для воркеров, не ведущих синхронизацию)"""
+        async with self.session_factory() as db:
+            rows = await db.execute(
+                select(NFTCollectionSync.collection).where(NFTCollectionSync.last_full_sync_at.isnot(None))
+            )
+            self._synced = set(rows.scalars().all())
+
+    # -------------------------------------------------------------------------
+    # Полная синхронизация
+    # -------------------------------------------------------------------------
+
+    async def sync_collection(self, collection: str) -> int:
+        """Полная выгрузка коллекции; записываются только изменившиеся элементы"""
+        async with self.session_factory() as db:
+            rows = await db.execute(
+                select(NFTHolding.item_index, NFTHolding.owner).where(NFTHolding.collection == collection)
+            )
+            existing = dict(rows.all())
+
+            seen = set()
+            changed: List[Dict[str, Any]] = []
+            written = 0
+            async for page in self.client.iter_collection_items(collection, settings.NFT_INDEX_PAGE_SIZE):
+                for item in page:
+                    seen.add(item["index"])
+                    if existing.get(item["index"], _MISSING) != item["owner"]:
+                        changed.append(self._row(collection, item))
+                if len(changed) >= self.UPSERT_BATCH:
+                    written += await self._upsert(db, changed)
+                    changed = []
+            written += await self._upsert(db, changed)
+
+            # Сожженные элементы
+            removed = list(set(existing) - seen)
+            for start in range(0, len(removed), self.UPSERT_BATCH):
+                await db.execute(
+                    delete(NFTHolding).where(
+                        NFTHolding.collection == collection,
+                        NFTHolding.item_index.in_(removed[start:start + self.UPSERT_BATCH])
+                    )
+                )
+
+            now = datetime.utcnow()
+            insert = dialect_insert(db)
+            statement = insert(NFTCollectionSync).values(
+                collection=collection,
+                items_count=len(seen),
+                last_full_sync_at=now
+            )
+            await db.execute(statement.on_conflict_do_update(
+                index_elements=[NFTCollectionSync.collection],
+                set_={"items_count": len(seen), "last_full_sync_at": now}
+            ))
+            await db.commit()
+
+        self._synced.add(collection)
+        logger.info(
+            "NFT индекс: коллекция %s синхронизирована (%d элементов, изменено %d, удалено %d)",
+            collection, len(seen), written, len(removed)
+        )
+        return written
+
+    async def sync_all(self) -> None:
+        """Полная синхронизация всех коллекций"""
+        for collection in self.collections:
+            try:
+                await self.sync_collection(collection)
+            except Exception as e:
+                logger.error("NFT индекс: ошибка синхронизации %s: %s", collection, e)
+
+    # -------------------------------------------------------------------------
+    # Инкрементальные обновления
+    # -------------------------------------------------------------------------
+
+    async def apply_item_updates(self, items: List[Dict[str, Any]]) -> int:
+        """Запись новых владельцев для набора элементов"""
+        rows = [
+            self._row(item["collection"], item)
+            for item in items
+            if item.get("collection") in self.collections
+        ]
+        if not rows:
+            return 0
+        async with self.session_factory() as db:
+            written = await self._upsert(db, rows)
+            await db.execute(
+                NFTCollectionSync.__table__.update()
+                .where(NFTCollectionSync.collection.in_({row["collection"] for row in rows}))
+                .values(last_incremental_at=datetime.utcnow())
+            )
+            await db.commit()
+        return written
+
+    async def watch_transfers(self) -> None:
+        """Подписка на транзакции элементов коллекций и точечное обновление владельцев"""
+        async with self.session_factory() as db:
+            rows = await db.execute(
+                select(NFTHolding.item_address).where(NFTHolding.collection.in_(self.collections))
+            )
+            addresses = list(rows.scalars().all())
+        if not addresses:
+            return
+
+        touched: asyncio.Queue = asyncio.Queue()
+
+        async def listen(chunk: List[str]) -> None:
+            while True:
+                try:
+                    async for account in self.client.stream_account_transactions(chunk):
+                        touched.put_nowait(account)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.warning("NFT индекс: поток событий прерван (%s), переподключение", e)
+                    await asyncio.sleep(5)
+
+        listeners = [
+            asyncio.create_task(listen(addresses[start:start + self.SSE_ACCOUNTS_PER_STREAM]))
+            for start in range(0, len(addresses), self.SSE_ACCOUNTS_PER_STREAM)
+        ]
+        try:
+            while True:
+                batch = {await touched.get()}
+                # Собираем события за короткое окно, чтобы обновить их одним запросом
+                await asyncio.sleep(self.TRANSFER_BATCH_DELAY)
+                while not touched.empty() and len(batch) < 100:
+                    batch.add(touched.get_nowait())
+                try:
+                    items = await self.client.get_nft_items_bulk(list(batch))
+                    written = await self.apply_item_updates(items)
+                    logger.debug("NFT индекс: обновлено %d элементов по событиям", written)
+                except Exception as e:
+                    logger.warning("NFT индекс: ошибка инкрементального обновления: %s", e)
+        finally:
+            for task in listeners:
+                task.cancel()
+
+    # -------------------------------------------------------------------------
+    # Фоновая задача
+    # -------------------------------------------------------------------------
+
+    def start(self) -> None:
+        """Запуск фоновой синхронизации"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Остановка фоновой синхронизации"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        interval = settings.NFT_INDEX_RESYNC_INTERVAL
+        while True:
+            try:
+                if await self._acquire_leadership():
+                    try:
+                        await self._lead(interval)
+                    finally:
+                        await self._release_leadership()
+                else:
+                    await self.load_state()
+                    await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                await self._release_leadership()
+                raise
+            except Exception as e:
+                logger.error("NFT индекс: ошибка фоновой синхронизации: %s", e, exc_info=True)
+                await asyncio.sleep(60)
+
+    async def _lead(self, interval: int) -> None:
+        """Цикл лидера с продлением блокировки; потеря блокировки останавливает цикл"""
+        cycle = asyncio.create_task(self._cycle(interval))
+        try:
+            while True:
+                done, _ = await asyncio.wait({cycle}, timeout=self.LOCK_RENEW_INTERVAL)
+                if done:
+                    break
+                if not await self._renew_leadership():
+                    logger.warning("NFT индекс: блокировка потеряна, цикл синхронизации остановлен")
+                    self._is_leader = False
+                    break
+        finally:
+            cycle.cancel()
+            await asyncio.gather(cycle, return_exceptions=True)
+        if not cycle.cancelled():
+            cycle.result()
+
+    async def _cycle(self, interval: int) -> None:
+        # Полная выгрузка как страховка, между ними - события
+        deadline = asyncio.get_running_loop().time() + interval
+        await self.sync_all()
+        try:
+            await asyncio.wait_for(self.watch_transfers(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        # watch_transfers завершается сразу без элементов в индексе
+        # (пустые коллекции, ошибка выгрузки): ждем остаток интервала
+        await asyncio.sleep(max(0.0, deadline - asyncio.get_running_loop().time()))
+
+    async def _acquire_leadership(self) -> bool:
+        """Синхронизацию ведет только один воркер (блокировка в Redis)"""
+        redis = await get_redis()
+        if redis is None:
+            self._is_leader = True
+        else:
+            self._is_leader = bool(await redis.set(self.LOCK_KEY, self._token, nx=True, ex=self.LOCK_TTL))
+        return self._is_leader
+
+    async def _renew_leadership(self) -> bool:
+        """Продление своей блокировки; False - блокировка истекла или у другого воркера"""
+        redis = await get_redis()
+        if redis is None:
+            return True
+        try:
+            if await redis.get(self.LOCK_KEY) != self._token:
+                return False
+            return bool(await redis.expire(self.LOCK_KEY, self.LOCK_TTL))
+        except Exception as e:
+            logger.warning("NFT индекс: ошибка продления блокировки: %s", e)
+            return False
+
+    async def _release_leadership(self) -> None:
+        if not self._is_leader:
+            return
+        self._is_leader = False
+        redis = await get_redis()
+        if redis is not None:
+            try:
+                # Блокировка могла истечь и перейти к другому воркеру
+                if await redis.get(self.LOCK_KEY) == self._token:
+                    await redis.delete(self.LOCK_KEY)
+            except Exception as e:
+                logger.warning("NFT индекс: ошибка снятия блокировки: %s", e)
+
+    # -------------------------------------------------------------------------
+    # Вспомогательные методы
+    # -------------------------------------------------------------------------
+
+    @staticmethod
+    def _row(collection: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "collection": collection,
+            "item_index": item["index"],
+            "item_address": item["address"],
+            "owner": item["owner"]
+        }
+
+    async def _upsert(self, db, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        insert = dialect_insert(db)
+        statement = insert(NFTHolding).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[NFTHolding.collection, NFTHolding.item_index],
+            set_={
+                "owner": statement.excluded.owner,
+                "item_address": statement.excluded.item_address,
+                "updated_at": func.now()
+            }
+        )
+        await db.execute(statement)
+        return len(rows)
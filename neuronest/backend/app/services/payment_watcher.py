@@ -0,0 +1,378 @@
+"""
+Наблюдатель платежей NOTPUNKS в блокчейне TON
+
+Вместо опроса блокчейна по каждой ожидающей транзакции наблюдатель один
+раз на новый блок мастерчейна читает входящие транзакции кошелька
+платформы (PAYMENT_RECEIVER_ADDRESS) и сопоставляет их с ожидающими
+Transaction через индекс в памяти: по комментарию (transaction_id) или,
+если комментария нет, по уникальной сумме. Подтверждения, завершение и
+истечение платежей обновляются пакетными UPDATE на каждый блок, поэтому
+стоимость зависит от частоты блоков, а не от числа ожидающих платежей.
+
+Работает только в одном процессе (блокировка в Redis); без Redis
+наблюдатель не запускается. При первом запуске курсор ставится на
+последнюю транзакцию кошелька: более ранние переводы не сопоставляются,
+а перевод, уже подтвердивший Transaction, не засчитывается повторно.
+"""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from sqlalchemy import bindparam, select, update
+
+from app.core.config import settings
+from app.core.database import AsyncSessionLocal
+from app.core.redis import get_redis
+from app.models.transaction import Transaction, TransactionStatus, TransactionType
+from app.services import ledger
+from ton_api import TONAPIClient, to_raw_address
+
+logger = logging.getLogger(__name__)
+
+# Типы транзакций, которые оплачиваются переводом на кошелек платформы
+PAYABLE_TYPES = (TransactionType.PAYMENT, TransactionType.DEPOSIT)
+
+
+class PendingPayment(NamedTuple):
+    id: int
+    transaction_id: str
+    total_amount: int
+    expires_at: Optional[datetime]
+
+
+def parse_incoming_transfer(tx: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Входящий перевод jetton из транзакции TONAPI.io
+    Учитываются только уведомления jetton_notify: суммы Transaction в NOTPUNKS.
+    """
+    in_msg = tx.get("in_msg") or {}
+    if not tx.get("success", True) or in_msg.get("decoded_op_name") != "jetton_notify":
+        return None
+    body = in_msg.get("decoded_body") or {}
+    payload = (body.get("forward_payload") or {}).get("value") or {}
+    comment = (payload.get("value") or {}).get("text") if isinstance(payload, dict) else None
+    try:
+        return {
+            "hash": tx["hash"],
+            "lt": int(tx["lt"]),
+            "amount": int(body.get("amount", 0)),
+            "comment": comment.strip() if comment else None,
+            "jetton_wallet": to_raw_address(in_msg["source"]["address"]),
+            "sender": to_raw_address(body["sender"]) if body.get("sender") else None,
+        }
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class PendingIndex:
+    """Ожидающие оплаты транзакции по комментарию и по сумме"""
+
+    def __init__(self):
+        self.by_id: Dict[int, PendingPayment] = {}
+        self.by_comment: Dict[str, PendingPayment] = {}
+        self.by_amount: Dict[int, set] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self.by_id)
+
+    def add(self, payment: PendingPayment) -> None:
+        self.by_id[payment.id] = payment
+        self.by_comment[payment.transaction_id] = payment
+        self.by_amount[payment.total_amount].add(payment.id)
+
+    def remove(self, payment_id: int) -> None:
+        payment = self.by_id.pop(payment_id, None)
+        if payment is None:
+            return
+        self.by_comment.pop(payment.transaction_id, None)
+        ids = self.by_amount.get(payment.total_amount)
+        if ids is not None:
+            ids.discard(payment_id)
+            if not ids:
+                del self.by_amount[payment.total_amount]
+
+    def match(self, transfer: Dict[str, Any]) -> Optional[PendingPayment]:
+        """Транзакция для перевода: по комментарию, иначе по однозначной сумме"""
+        if transfer.get("comment"):
+            payment = self.by_comment.get(transfer["comment"])
+            if payment is not None:
+                return payment
+        ids = self.by_amount.get(transfer["amount"])
+        if ids and len(ids) == 1:
+            return self.by_id[next(iter(ids))]
+        return None
+
+    def expire(self, now: datetime) -> None:
+        for payment in [p for p in self.by_id.values() if p.expires_at and p.expires_at < now]:
+            self.remove(payment.id)
+
+
+class PaymentWatcher:
+    """Отслеживание входящих платежей на кошелек платформы"""
+
+    LOCK_KEY = "payments:watcher:leader"
+    CURSOR_KEY = "payments:watcher:last_lt"
+    PAGE_SIZE = 100
+    # Полная перезагрузка индекса (отмененные и удаленные транзакции)
+    FULL_RELOAD_SECONDS = 300
+
+    def __init__(self, client: TONAPIClient, receiver: Optional[str] = None, session_factory=AsyncSessionLocal):
+        self.client = client
+        self.receiver = to_raw_address(receiver or settings.PAYMENT_RECEIVER_ADDRESS)
+        self.jetton_wallet = (
+            to_raw_address(settings.PAYMENT_JETTON_WALLET) if settings.PAYMENT_JETTON_WALLET else None
+        )
+        self.session_factory = session_factory
+        self.index = PendingIndex()
+        self._max_loaded_id = 0
+        self._reloaded_at = 0.0
+        self._last_lt: Optional[int] = None
+        self._head: Optional[int] = None
+        self._token = uuid.uuid4().hex
+        self._is_leader = False
+        self._redis_warned = False
+        self._task: Optional[asyncio.Task] = None
+
+    # -------------------------------------------------------------------------
+    # Обработка блока
+    # -------------------------------------------------------------------------
+
+    async def process_block(self) -> int:
+        """Обработка нового блока мастерчейна; количество сопоставленных платежей"""
+        head = await self.client.get_masterchain_seqno()
+        if head is None or head == self._head:
+            return 0
+
+        await self._refresh_index()
+        transactions = await self._fetch_transactions()
+        transfers = [transfer for transfer in map(parse_incoming_transfer, transactions) if transfer]
+        used_hashes = await self._used_hashes([transfer["hash"] for transfer in transfers])
+
+        matched = []
+        matched_ids = set()
+        for transfer in transfers:
+            if self.jetton_wallet and transfer["jetton_wallet"] != self.jetton_wallet:
+                continue
+            if transfer["hash"] in used_hashes:
+                continue
+            payment = self.index.match(transfer)
+            if payment is None or payment.id in matched_ids:
+                continue
+            if transfer["amount"] < payment.total_amount:
+                logger.warning(
+                    "Платежи: недостаточная сумма %s для %s (%d < %d)",
+                    transfer["hash"], payment.transaction_id, transfer["amount"], payment.total_amount
+                )
+                continue
+            matched_ids.add(payment.id)
+            used_hashes.add(transfer["hash"])
+            matched.append({
+                "b_id": payment.id,
+                "b_hash": transfer["hash"],
+                "b_height": head,
+                "b_from": transfer["sender"],
+                "b_to": self.receiver,
+            })
+
+        now = datetime.utcnow()
+        async with self.session_factory() as db:
+            completed = await apply_block(db, head, matched, now)
+            await db.commit()
+
+        # Индекс и курсор меняются только после commit: при ошибке блок будет обработан заново
+        for payment_id in matched_ids:
+            self.index.remove(payment_id)
+        self.index.expire(now)
+        self._head = head
+        if transactions:
+            self._last_lt = max(int(tx["lt"]) for tx in transactions)
+            await self._save_cursor()
+
+        if matched or completed:
+            logger.info("Платежи: блок %d, сопоставлено %d, завершено %d", head, len(matched), completed)
+        return len(matched)
+
+    async def _refresh_index(self) -> None:
+        """Новые ожидающие транзакции (по id), периодически - полная перезагрузка"""
+        full = time.monotonic() - self._reloaded_at > self.FULL_RELOAD_SECONDS
+        statement = select(
+            Transaction.id, Transaction.transaction_id, Transaction.total_amount, Transaction.expires_at
+        ).where(Transaction.status == TransactionStatus.PENDING, Transaction.type.in_(PAYABLE_TYPES))
+        if not full:
+            statement = statement.where(Transaction.id > self._max_loaded_id)
+
+        async with self.session_factory() as db:
+            rows = (await db.execute(statement)).all()
+
+        if full:
+            self.index = PendingIndex()
+            self._reloaded_at = time.monotonic()
+        for row in rows:
+            self.index.add(PendingPayment(row.id, row.transaction_id, row.total_amount, row.expires_at))
+            self._max_loaded_id = max(self._max_loaded_id, row.id)
+
+    async def _used_hashes(self, hashes: List[str]) -> set:
+        """Хэши переводов, уже подтвердивших транзакции"""
+        if not hashes:
+            return set()
+        async with self.session_factory() as db:
+            rows = await db.execute(
+                select(Transaction.ton_transaction_hash).where(Transaction.ton_transaction_hash.in_(hashes))
+            )
+            return set(rows.scalars())
+
+    async def _fetch_transactions(self) -> List[Dict[str, Any]]:
+        """Транзакции кошелька платформы с прошлого блока"""
+        if self._last_lt is None:
+            self._last_lt = await self._load_cursor()
+        if self._last_lt is None:
+            # Первый запуск: курсор на последнюю транзакцию, история не сопоставляется
+            latest = await self.client.get_account_transactions(self.receiver, limit=1, sort_order="desc")
+            self._last_lt = int(latest[0]["lt"]) if latest else 0
+            await self._save_cursor()
+            logger.info("Платежи: курсор установлен на lt %d", self._last_lt)
+            return []
+
+        transactions = []
+        after_lt = self._last_lt
+        while True:
+            page = await self.client.get_account_transactions(self.receiver, after_lt=after_lt, limit=self.PAGE_SIZE)
+            transactions.extend(page)
+            if len(page) < self.PAGE_SIZE:
+                break
+            after_lt = int(page[-1]["lt"])
+        return transactions
+
+    async def _load_cursor(self) -> Optional[int]:
+        redis = await get_redis()
+        if redis is None:
+            return None
+        value = await redis.get(self.CURSOR_KEY)
+        return int(value) if value else None
+
+    async def _save_cursor(self) -> None:
+        redis = await get_redis()
+        if redis is not None and self._last_lt is not None:
+            await redis.set(self.CURSOR_KEY, self._last_lt)
+
+    # -------------------------------------------------------------------------
+    # Фоновая задача
+    # -------------------------------------------------------------------------
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self._release_leadership()
+
+    async def _run(self) -> None:
+        interval = settings.PAYMENT_WATCH_INTERVAL
+        while True:
+            try:
+                if await self._acquire_leadership(interval):
+                    await self.process_block()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error("Платежи: ошибка обработки блока: %s", e, exc_info=True)
+            await asyncio.sleep(interval)
+
+    async def _acquire_leadership(self, interval: float) -> bool:
+        """Наблюдатель один на все процессы: блокировка продлевается каждым проходом"""
+        redis = await get_redis()
+        if redis is None:
+            # Без блокировки каждый воркер API стал бы наблюдателем
+            if self._is_leader or not self._redis_warned:
+                logger.warning("Платежи: Redis недоступен, наблюдатель отключен")
+                self._redis_warned = True
+            self._is_leader = False
+            return False
+        ttl = int(interval * 3) + 1
+        if self._is_leader and await redis.get(self.LOCK_KEY) == self._token:
+            await redis.expire(self.LOCK_KEY, ttl)
+        else:
+            became_leader = bool(await redis.set(self.LOCK_KEY, self._token, nx=True, ex=ttl))
+            if became_leader and not self._is_leader:
+                # Смена лидера: курсор и индекс перечитываются
+                self._last_lt = None
+                self._reloaded_at = 0.0
+            self._is_leader = became_leader
+        return self._is_leader
+
+    async def _release_leadership(self) -> None:
+        if not self._is_leader:
+            return
+        self._is_leader = False
+        redis = await get_redis()
+        if redis is not None:
+            try:
+                if await redis.get(self.LOCK_KEY) == self._token:
+                    await redis.delete(self.LOCK_KEY)
+            except Exception as e:
+                logger.warning("Платежи: ошибка снятия блокировки: %s", e)
+
+
+async def apply_block(db, head: int, matched: List[Dict[str, Any]], now: datetime) -> int:
+    """
+    Пакетные изменения транзакций за один блок; количество завершенных
+    Найденные платежи переходят в CONFIRMING, подтверждения всех CONFIRMING
+    пересчитываются от высоты блока, набравшие PAYMENT_CONFIRMATION_BLOCKS
+    завершаются (пополнения зачисляются через журнал), просроченные PENDING истекают.
+    """
+    transactions = Transaction.__table__
+    if matched:
+        await db.execute(
+            update(transactions)
+            .where(transactions.c.id == bindparam("b_id"), transactions.c.status == TransactionStatus.PENDING)
+            .values(
+                status=TransactionStatus.CONFIRMING,
+                ton_transaction_hash=bindparam("b_hash"),
+                ton_block_height=bindparam("b_height"),
+                from_address=bindparam("b_from"),
+                to_address=bindparam("b_to"),
+                confirmations=0,
+            ),
+            matched
+        )
+
+    confirming = transactions.c.status == TransactionStatus.CONFIRMING
+    await db.execute(
+        update(transactions)
+        .where(confirming)
+        .values(confirmations=head - transactions.c.ton_block_height)
+    )
+    completed = (await db.execute(
+        update(transactions)
+        .where(confirming, transactions.c.confirmations >= settings.PAYMENT_CONFIRMATION_BLOCKS)
+        .values(status=TransactionStatus.COMPLETED, confirmed_at=now)
+        .returning(transactions.c.id, transactions.c.transaction_id, transactions.c.user_id,
+                   transactions.c.type, transactions.c.amount)
+    )).all()
+
+    for row in completed:
+        if row.type == TransactionType.DEPOSIT:
+            await ledger.post_entry(
+                db, row.user_id, row.amount, f"deposit:{row.transaction_id}",
+                transaction_id=row.id, description="Deposit"
+            )
+
+    await db.execute(
+        update(transactions)
+        .where(
+            transactions.c.status == TransactionStatus.PENDING,
+            transactions.c.expires_at.is_not(None),
+            transactions.c.expires_at < now
+        )
+        .values(status=TransactionStatus.EXPIRED)
+    )
+    return len(completed)
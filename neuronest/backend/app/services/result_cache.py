@@ -0,0 +1,153 @@
+"""
+Кэш результатов выполнений AI агентов
+
+Для агентов с result_cache_ttl повторный запуск с теми же входными данными
+получает сохраненный результат без запуска контейнера. Ключ - имя агента
+и sha256 от версии, docker тега и канонического JSON input_data (ключи
+отсортированы на всех уровнях), поэтому новая версия или тег образа не
+видят старых результатов. Значения хранятся в Redis сжатыми zstd (в base64:
+клиент декодирует ответы как UTF-8) и живут result_cache_ttl секунд;
+sorted set времени обращений ограничивает кэш AGENT_RESULT_CACHE_MAX_ENTRIES
+записями, лишние вытесняются по LRU.
+"""
+
+import base64
+import hashlib
+import logging
+from typing import Any, Dict, NamedTuple, Optional
+
+import orjson
+import zstandard
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.redis import get_redis
+from app.models.agent import Agent
+
+logger = logging.getLogger(__name__)
+
+RESULT_KEY = "agents:results:{name}:{digest}"
+LRU_KEY = "agents:results:lru"
+
+# Чтение с обновлением времени обращения; истекшая запись удаляется из индекса
+GET_RESULT_LUA = """
+local value = redis.call('GET', KEYS[2])
+if not value then
+    redis.call('ZREM', KEYS[1], KEYS[2])
+    return false
+end
+local t = redis.call('TIME')
+redis.call('ZADD', KEYS[1], tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000), KEYS[2])
+return value
+"""
+
+# Запись с TTL и вытеснением давно не читанных записей сверх лимита
+SET_RESULT_LUA = """
+local t = redis.call('TIME')
+redis.call('SET', KEYS[2], ARGV[1], 'EX', tonumber(ARGV[2]))
+redis.call('ZADD', KEYS[1], tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000), KEYS[2])
+local excess = redis.call('ZCARD', KEYS[1]) - tonumber(ARGV[3])
+if excess > 0 then
+    local evicted = redis.call('ZPOPMIN', KEYS[1], excess)
+    for i = 1, #evicted, 2 do
+        redis.call('DEL', evicted[i])
+    end
+end
+return excess > 0 and excess or 0
+"""
+
+
+class CachedResult(NamedTuple):
+    output_data: Any
+    logs: str
+    execution_id: Optional[str]  # Выполнение, чей результат сохранен
+
+
+def result_key(agent: Agent, input_data: Dict[str, Any]) -> str:
+    """Ключ результата агента для входных данных"""
+    digest = hashlib.sha256()
+    for part in (agent.version or "", agent.docker_tag or "latest"):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(orjson.dumps(input_data, option=orjson.OPT_SORT_KEYS))
+    return RESULT_KEY.format(name=agent.name, digest=digest.hexdigest())
+
+
+def is_cacheable(agent: Agent) -> bool:
+    return settings.AGENT_RESULT_CACHE_ENABLED and bool(agent.result_cache_ttl)
+
+
+class AgentResultCache:
+    """Результаты детерминированных агентов в Redis"""
+
+    def __init__(self, max_entries: int = None, max_bytes: int = None):
+        self.max_entries = settings.AGENT_RESULT_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.max_bytes = settings.AGENT_RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        self._compressor = zstandard.ZstdCompressor(level=settings.AGENT_RESULT_CACHE_ZSTD_LEVEL)
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._scripts: Dict[str, object] = {}
+        self._count = metrics.cache_counter("agent_result")
+
+    def _pack(self, output_data: Any, logs: Optional[str], execution_id: str) -> bytes:
+        return self._compressor.compress(orjson.dumps({
+            "output_data": output_data,
+            "logs": logs or "",
+            "execution_id": execution_id,
+        }))
+
+    def _unpack(self, value: str) -> CachedResult:
+        data = orjson.loads(self._decompressor.decompress(base64.b64decode(value)))
+        return CachedResult(data["output_data"], data["logs"], data.get("execution_id"))
+
+    async def get(self, agent: Agent, input_data: Dict[str, Any]) -> Optional[CachedResult]:
+        """Сохраненный результат; None - агент не кэшируется, промах или Redis недоступен"""
+        if not is_cacheable(agent):
+            return None
+        redis = await get_redis()
+        if redis is None:
+            return None
+        try:
+            value = await self._script(redis, "get")(keys=[LRU_KEY, result_key(agent, input_data)])
+            if value is None:
+                self._count("misses")
+                return None
+            result = self._unpack(value)
+        except Exception as e:
+            logger.warning("Кэш результатов агентов: ошибка чтения: %s", e)
+            self._count("errors")
+            return None
+        self._count("hits")
+        return result
+
+    async def store(self, agent: Agent, input_data: Dict[str, Any], output_data: Any, logs: Optional[str], execution_id: str) -> bool:
+        """Сохранение успешного результата; False - не сохранен"""
+        if not is_cacheable(agent):
+            return False
+        redis = await get_redis()
+        if redis is None:
+            return False
+        try:
+            blob = self._pack(output_data, logs, execution_id)
+            if len(blob) > self.max_bytes:
+                logger.debug("Результат %s агента %s не кэшируется: %d байт", execution_id, agent.name, len(blob))
+                return False
+            await self._script(redis, "set")(
+                keys=[LRU_KEY, result_key(agent, input_data)],
+                args=[base64.b64encode(blob).decode(), int(agent.result_cache_ttl), self.max_entries]
+            )
+            return True
+        except Exception as e:
+            logger.warning("Кэш результатов агентов: ошибка записи: %s", e)
+            return False
+
+    def _script(self, redis, name: str):
+        if not self._scripts:
+            self._scripts = {
+                "get": redis.register_script(GET_RESULT_LUA),
+                "set": redis.register_script(SET_RESULT_LUA),
+            }
+        return self._scripts[name]
+
+
+# Глобальный кэш результатов
+agent_result_cache = AgentResultCache()
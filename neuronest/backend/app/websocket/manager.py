@@ -0,0 +1,323 @@
+"""
+Менеджер WebSocket соединений
+
+Соединения индексируются по пользователю и по темам (dict -> set), поэтому
+подключение, отключение и адресная доставка не зависят от числа клиентов.
+События публикуются в Redis pub/sub и доходят до соединений во всех
+воркерах; без Redis доставляются только локально.
+
+У каждого соединения своя ограниченная очередь отправки и задача-отправитель:
+медленный клиент не задерживает остальных. При переполнении очереди
+сообщение отбрасывается или клиент отключается (WS_BACKPRESSURE_POLICY).
+Соединения без ответа на ping дольше WS_HEARTBEAT_TIMEOUT закрываются.
+Число подписок на темы и отслеживаемых выполнений на соединение ограничено
+(WS_MAX_TOPICS, WS_MAX_FOLLOWS).
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import re
+import time
+from typing import Any, Callable, Coroutine, Dict, Optional, Set
+
+from fastapi import WebSocket
+from starlette import status
+
+from app.core.config import settings
+from app.core.redis import get_redis
+
+logger = logging.getLogger(__name__)
+
+TOPIC_RE = re.compile(r"[\w.:-]{1,100}")
+
+
+class Connection:
+    """WebSocket соединение с собственной очередью отправки"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, websocket: WebSocket, user_id: Optional[int], queue_size: int):
+        self.id = next(self._ids)
+        self.websocket = websocket
+        self.user_id = user_id
+        self.topics: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.last_seen = time.monotonic()
+        self.sender: Optional[asyncio.Task] = None
+        self.tasks: Set[asyncio.Task] = set()
+        # execution_id -> задача пересылки событий выполнения
+        self.follows: Dict[str, asyncio.Task] = {}
+        self.dropped = 0
+
+    def __hash__(self) -> int:
+        return self.id
+
+    def __eq__(self, other) -> bool:
+        return self is other
+
+
+class ConnectionManager:
+    """Реестр соединений и доставка событий через Redis pub/sub"""
+
+    CHANNEL = "ws:events"
+
+    def __init__(
+        self,
+        queue_size: int = None,
+        backpressure_policy: str = None,
+        heartbeat_interval: float = None,
+        heartbeat_timeout: float = None,
+        max_topics: int = None,
+        max_follows: int = None,
+    ):
+        self.queue_size = queue_size or settings.WS_SEND_QUEUE_SIZE
+        self.backpressure_policy = backpressure_policy or settings.WS_BACKPRESSURE_POLICY
+        self.heartbeat_interval = heartbeat_interval or settings.WS_HEARTBEAT_INTERVAL
+        self.heartbeat_timeout = heartbeat_timeout or settings.WS_HEARTBEAT_TIMEOUT
+        self.max_topics = max_topics or settings.WS_MAX_TOPICS
+        self.max_follows = max_follows or settings.WS_MAX_FOLLOWS
+
+        self.connections: Set[Connection] = set()
+        self.by_user: Dict[int, Set[Connection]] = {}
+        self.by_topic: Dict[str, Set[Connection]] = {}
+
+        self._listener: Optional[asyncio.Task] = None
+        self._reaper: Optional[asyncio.Task] = None
+        self.counters = {"sent": 0, "dropped": 0, "slow_disconnects": 0, "reaped": 0}
+
+    # -------------------------------------------------------------------------
+    # Реестр соединений
+    # -------------------------------------------------------------------------
+
+    async def connect(self, websocket: WebSocket, user_id: Optional[int] = None) -> Connection:
+        """Принять соединение и запустить его отправитель"""
+        await websocket.accept()
+        connection = Connection(websocket, user_id, self.queue_size)
+        connection.sender = asyncio.create_task(self._sender(connection))
+        self.connections.add(connection)
+        if user_id is not None:
+            self.by_user.setdefault(user_id, set()).add(connection)
+        logger.debug("WebSocket подключен. Всего соединений: %d", len(self.connections))
+        return connection
+
+    def disconnect(self, connection: Connection) -> None:
+        """Удаление соединения из всех реестров"""
+        if connection not in self.connections:
+            return
+        self.connections.discard(connection)
+        if connection.user_id is not None:
+            self._discard(self.by_user, connection.user_id, connection)
+        for topic in connection.topics:
+            self._discard(self.by_topic, topic, connection)
+        connection.topics.clear()
+        current = asyncio.current_task()
+        for task in (connection.sender, *connection.tasks):
+            if task and task is not current:
+                task.cancel()
+        connection.tasks.clear()
+        connection.follows.clear()
+        logger.debug("WebSocket отключен. Всего соединений: %d", len(self.connections))
+
+    def subscribe(self, connection: Connection, topic: str) -> bool:
+        """Подписка соединения на тему; False - недопустимое имя или лимит подписок"""
+        if topic in connection.topics:
+            return True
+        if not TOPIC_RE.fullmatch(topic) or len(connection.topics) >= self.max_topics:
+            return False
+        connection.topics.add(topic)
+        self.by_topic.setdefault(topic, set()).add(connection)
+        return True
+
+    def unsubscribe(self, connection: Connection, topic: str) -> None:
+        """Отписка соединения от темы"""
+        connection.topics.discard(topic)
+        self._discard(self.by_topic, topic, connection)
+
+    def start_task(self, connection: Connection, coro) -> asyncio.Task:
+        """Фоновая задача соединения (отменяется при отключении)"""
+        task = asyncio.create_task(coro)
+        connection.tasks.add(task)
+        task.add_done_callback(connection.tasks.discard)
+        return task
+
+    def follow(self, connection: Connection, execution_id: str, factory: Callable[[], Coroutine]) -> bool:
+        """Пересылка событий выполнения, одна задача на execution_id; False - лимит WS_MAX_FOLLOWS"""
+        if execution_id in connection.follows:
+            return True
+        if len(connection.follows) >= self.max_follows:
+            return False
+        task = self.start_task(connection, factory())
+        connection.follows[execution_id] = task
+        task.add_done_callback(lambda _: connection.follows.pop(execution_id, None))
+        return True
+
+    def touch(self, connection: Connection) -> None:
+        """Отметка активности клиента (любое входящее сообщение)"""
+        connection.last_seen = time.monotonic()
+
+    @staticmethod
+    def _discard(registry: Dict[Any, Set[Connection]], key, connection: Connection) -> None:
+        connections = registry.get(key)
+        if connections is not None:
+            connections.discard(connection)
+            if not connections:
+                del registry[key]
+
+    # -------------------------------------------------------------------------
+    # Публикация
+    # -------------------------------------------------------------------------
+
+    async def send_to_user(self, user_id: int, message: dict) -> None:
+        """Событие всем соединениям пользователя во всех воркерах"""
+        await self._publish("user", user_id, message)
+
+    async def send_to_topic(self, topic: str, message: dict) -> None:
+        """Событие подписчикам темы во всех воркерах"""
+        await self._publish("topic", topic, message)
+
+    async def broadcast(self, message: dict) -> None:
+        """Событие всем соединениям во всех воркерах"""
+        await self._publish("all", None, message)
+
+    async def _publish(self, kind: str, target, message: dict) -> None:
+        payload = json.dumps(message, ensure_ascii=False, separators=(",", ":"))
+        redis = await get_redis()
+        if redis is not None and self._listener is not None:
+            envelope = json.dumps({"kind": kind, "target": target, "payload": payload}, separators=(",", ":"))
+            try:
+                # Свой воркер получит событие через подписку, как и остальные
+                await redis.publish(self.CHANNEL, envelope)
+                return
+            except Exception as e:
+                logger.warning("WebSocket: Redis недоступен, локальная доставка: %s", e)
+        self.deliver_local(kind, target, payload)
+
+    def send_local(self, connection: Connection, message: dict) -> bool:
+        """Событие одному соединению этого воркера"""
+        return self._enqueue(connection, json.dumps(message, ensure_ascii=False, separators=(",", ":")))
+
+    def deliver_local(self, kind: str, target, payload: str) -> int:
+        """Постановка сериализованного события в очереди локальных соединений"""
+        if kind == "user":
+            connections = self.by_user.get(int(target), ())
+        elif kind == "topic":
+            connections = self.by_topic.get(target, ())
+        else:
+            connections = self.connections
+
+        delivered = 0
+        # Копия: disconnect при переполнении изменяет множество
+        for connection in tuple(connections):
+            if self._enqueue(connection, payload):
+                delivered += 1
+        return delivered
+
+    def _enqueue(self, connection: Connection, payload: str) -> bool:
+        try:
+            connection.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            pass
+
+        if self.backpressure_policy == "disconnect":
+            self.counters["slow_disconnects"] += 1
+            logger.warning("WebSocket: клиент %s не успевает читать, отключаем", connection.id)
+            self._close(connection, status.WS_1013_TRY_AGAIN_LATER)
+            return False
+
+        connection.dropped += 1
+        self.counters["dropped"] += 1
+        return False
+
+    async def _sender(self, connection: Connection) -> None:
+        try:
+            while True:
+                payload = await connection.queue.get()
+                await connection.websocket.send_text(payload)
+                self.counters["sent"] += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug("WebSocket: ошибка отправки клиенту %s: %s", connection.id, e)
+            self.disconnect(connection)
+
+    def _close(self, connection: Connection, code: int) -> None:
+        self.disconnect(connection)
+        asyncio.create_task(self._safe_close(connection.websocket, code))
+
+    @staticmethod
+    async def _safe_close(websocket: WebSocket, code: int) -> None:
+        try:
+            await websocket.close(code=code)
+        except Exception:
+            pass
+
+    # -------------------------------------------------------------------------
+    # Жизненный цикл
+    # -------------------------------------------------------------------------
+
+    async def start(self) -> None:
+        """Подписка на Redis и запуск проверки heartbeat"""
+        if await get_redis() is not None:
+            self._listener = asyncio.create_task(self._listen())
+        self._reaper = asyncio.create_task(self._reap())
+
+    async def stop(self) -> None:
+        """Остановка фоновых задач и закрытие соединений"""
+        tasks = [task for task in (self._listener, self._reaper) if task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._listener = self._reaper = None
+        for connection in tuple(self.connections):
+            self._close(connection, status.WS_1001_GOING_AWAY)
+
+    def stats(self) -> Dict[str, Any]:
+        """Количество соединений и счетчики доставки"""
+        return {
+            **self.counters,
+            "connections": len(self.connections),
+            "users": len(self.by_user),
+            "topics": len(self.by_topic),
+        }
+
+    async def _listen(self) -> None:
+        """Доставка событий из Redis; при обрыве соединения подписка восстанавливается"""
+        while True:
+            pubsub = None
+            try:
+                pubsub = (await get_redis()).pubsub()
+                await pubsub.subscribe(self.CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    try:
+                        envelope = json.loads(message["data"])
+                        self.deliver_local(envelope["kind"], envelope["target"], envelope["payload"])
+                    except Exception as e:
+                        logger.error("WebSocket: некорректное событие из Redis: %s", e)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("WebSocket: подписка Redis прервана: %s", e)
+                await asyncio.sleep(1)
+            finally:
+                if pubsub is not None:
+                    await pubsub.close()
+
+    async def _reap(self) -> None:
+        ping = json.dumps({"type": "ping"})
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            deadline = time.monotonic() - self.heartbeat_timeout
+            for connection in tuple(self.connections):
+                if connection.last_seen < deadline:
+                    self.counters["reaped"] += 1
+                    self._close(connection, status.WS_1001_GOING_AWAY)
+                else:
+                    self._enqueue(connection, ping)
+
+
+manager = ConnectionManager()
@@ -3,42 +3,95 @@ WebSocket роутер для real-time коммуникации
 """
 
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from sqlalchemy import select
 import logging
 
+from app.core.database import AsyncSessionLocal
+from app.models.agent import AgentExecution
+from app.models.user import User
+from app.services import execution_events
+from app.websocket.manager import Connection, manager
+
 logger = logging.getLogger(__name__)
 
 websocket_router = APIRouter()
 
-# Менеджер активных соединений
-class ConnectionManager:
-    def __init__(self):
-        self.active_connections: list[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"WebSocket подключен. Всего соединений: {len(self.active_connections)}")
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        logger.info(f"WebSocket отключен. Всего соединений: {len(self.active_connections)}")
-
-    async def broadcast(self, message: dict):
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Ошибка отправки сообщения: {e}")
-
-manager = ConnectionManager()
 
 @websocket_router.websocket("/connect")
 async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+    """
+    Соединение клиента
+    Сообщения клиента: subscribe/unsubscribe темы, follow_execution
+    (события выполнения с last_event_id), pong на ping сервера.
+    """
+    connection = await manager.connect(websocket, user_id=websocket.scope.get("state", {}).get("telegram_id"))
     try:
         while True:
-            data = await websocket.receive_json()
-            # TODO: Обработка сообщений
-            await websocket.send_json({"echo": data})
+            try:
+                data = await websocket.receive_json()
+            except (ValueError, TypeError, KeyError):
+                # Не JSON или бинарный кадр: соединение остается открытым
+                manager.touch(connection)
+                manager.send_local(connection, {"type": "error", "detail": "invalid json"})
+                continue
+            manager.touch(connection)
+
+            message_type = data.get("type") if isinstance(data, dict) else None
+            if message_type == "pong":
+                continue
+            if message_type == "subscribe" and data.get("topic"):
+                if not manager.subscribe(connection, str(data["topic"])):
+                    manager.send_local(connection, {"type": "error", "detail": "invalid topic or too many subscriptions"})
+            elif message_type == "unsubscribe" and data.get("topic"):
+                manager.unsubscribe(connection, str(data["topic"]))
+            elif message_type == "follow_execution" and data.get("execution_id"):
+                execution_id = str(data["execution_id"])
+                last_event_id = data.get("last_event_id")
+                started = manager.follow(
+                    connection,
+                    execution_id,
+                    lambda: follow_execution(connection, execution_id, last_event_id)
+                )
+                if not started:
+                    manager.send_local(connection, {"type": "error", "execution_id": execution_id, "detail": "too many followed executions"})
+            else:
+                manager.send_local(connection, {"type": "error", "detail": "unknown message"})
     except WebSocketDisconnect:
-        manager.disconnect(websocket) 
\ No newline at end of file
+        pass
+    finally:
+        manager.disconnect(connection)
+
+
+async def follow_execution(connection: Connection, execution_id: str, last_event_id: str = None) -> None:
+    """Пересылка событий выполнения владельцу выполнения"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(AgentExecution)
+            .join(User, User.id == AgentExecution.user_id)
+            .where(AgentExecution.execution_id == execution_id, User.telegram_id == connection.user_id)
+        )
+        execution = result.scalar_one_or_none()
+    if connection.user_id is None or execution is None:
+        manager.send_local(connection, {"type": "error", "execution_id": execution_id, "detail": "Выполнение не найдено"})
+        return
+
+    if execution.is_completed and not await execution_events.has_events(execution_id):
+        # Поток событий уже удален по TTL: отдаем итоговый статус из БД
+        name, data = execution_events.status_event(execution)
+        _send_event(connection, execution_id, ("0-0", name, data))
+        return
+
+    async for event in execution_events.follow(execution_id, last_event_id or "0"):
+        if event is not None:
+            _send_event(connection, execution_id, event)
+
+
+def _send_event(connection: Connection, execution_id: str, event: execution_events.Event) -> None:
+    event_id, name, data = event
+    manager.send_local(connection, {
+        "type": "execution_event",
+        "execution_id": execution_id,
+        "id": event_id,
+        "event": name,
+        "data": data,
+    })
@@ -0,0 +1,70 @@
+"""
+Процесс воркера выполнения AI агентов
+
+Запуск: python -m app.workers.agent_worker
+Количество процессов масштабируется независимо от API, общий лимит
+AGENTS_MAX_CONCURRENT соблюдается через Redis.
+"""
+
+import asyncio
+import logging
+import signal
+
+import docker
+
+from app.core import metrics
+from app.core.config import settings
+from app.core.database import close_database, load_models
+from app.core.logging import setup_logging
+from app.core.redis import close_redis, init_redis
+from app.services.agent_catalog import track_agent_writes
+from app.services.agent_runner import DockerAgentRunner
+from app.services.agent_scheduler import AgentScheduler
+from app.services.agent_stats import agent_stats
+from app.services.container_pool import ContainerPool
+from app.services.execution_archive import execution_archive
+
+logger = logging.getLogger(__name__)
+
+
+async def main() -> None:
+    setup_logging()
+    load_models()
+    if settings.PROMETHEUS_ENABLED:
+        # У воркера нет HTTP API: метрики выполнений на отдельном порту
+        metrics.start_exporter()
+    # Статистика выполнений меняет каталог агентов
+    track_agent_writes()
+    await init_redis()
+
+    client = docker.from_env()
+    pool = ContainerPool(client) if settings.AGENTS_POOL_ENABLED else None
+    if pool is not None:
+        await pool.start()
+
+    scheduler = AgentScheduler(runner=DockerAgentRunner(client, pool=pool))
+    await scheduler.start()
+    await agent_stats.start()
+    await execution_archive.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await stop.wait()
+    finally:
+        logger.info("Остановка воркера агентов...")
+        await scheduler.stop()
+        await agent_stats.stop()
+        await execution_archive.stop()
+        if pool is not None:
+            await pool.stop()
+        await close_redis()
+        await close_database()
+        metrics.mark_process_dead()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,66 @@
+"""
+Общие утилиты для бенчмарков NeuroNest
+
+Бенчмарки запускаются из каталога backend: python -m benchmarks.<имя>
+"""
+
+import os
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def load_env(path: Path = BACKEND_DIR / "config.env") -> None:
+    """Загрузка config.env в окружение (не перетирая заданные переменные)"""
+    if not path.exists():
+        return
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if not line or line.startswith("#") or "=" not in line:
+            continue
+        key, value = line.split("=", 1)
+        os.environ.setdefault(key.strip(), value.strip())
+
+
+def summarize(samples_ns: List[int]) -> Dict[str, float]:
+    """Сводка по замерам в микросекундах"""
+    samples = sorted(samples_ns)
+    n = len(samples)
+    return {
+        "n": n,
+        "mean_us": statistics.fmean(samples) / 1000,
+        "p50_us": samples[n // 2] / 1000,
+        "p95_us": samples[max(0, int(n * 0.95) - 1)] / 1000,
+        "p99_us": samples[max(0, int(n * 0.99) - 1)] / 1000,
+    }
+
+
+def print_row(name: str, stats: Dict[str, float]) -> None:
+    """Печать строки результатов"""
+    print(
+        f"{name:<40} n={stats['n']:<8} mean={stats['mean_us']:>9.2f}us "
+        f"p50={stats['p50_us']:>9.2f}us p95={stats['p95_us']:>9.2f}us p99={stats['p99_us']:>9.2f}us"
+    )
+
+
+def measure(fn: Callable[[], object], iterations: int) -> List[int]:
+    """Замер синхронной функции"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - start)
+    return samples
+
+
+async def measure_async(fn, iterations: int) -> List[int]:
+    """Замер асинхронной функции"""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter_ns()
+        await fn()
+        samples.append(time.perf_counter_ns() - start)
+    return samples
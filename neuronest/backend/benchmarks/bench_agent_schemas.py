@@ -0,0 +1,93 @@
+"""
+Микробенчмарк проверки входных и выходных данных по JSON Schema агентов
+
+Схемы трех демо-агентов. Сравниваются:
+  - jsonschema.validate на каждый вызов (разбор и проверка схемы каждый раз);
+  - закэшированный валидатор jsonschema;
+  - функция, сгенерированная fastjsonschema;
+  - AgentSchemaRegistry (поиск по (agent.id, version) и сверка схем).
+
+    python -m benchmarks.bench_agent_schemas [--iterations 20000]
+"""
+
+import argparse
+import time
+
+from benchmarks._env import load_env, measure, print_row, summarize
+
+load_env()
+
+import jsonschema  # noqa: E402
+
+from app.core.database import demo_agent_data, load_models  # noqa: E402
+from app.models.agent import Agent  # noqa: E402
+from app.services import agent_schemas as schemas  # noqa: E402
+
+PAYLOADS = {
+    "crypto-portfolio-analyzer": {
+        "input": ({"wallet_address": "UQ" + "a" * 46, "timeframe": "30d"}, {"timeframe": "1y"}),
+        "output": (
+            {"portfolio_value": 1520.5, "recommendations": ["hold TON", "rebalance"], "risk_score": 42},
+            {"portfolio_value": "1520", "risk_score": 420},
+        ),
+    },
+    "nft-collection-valuator": {
+        "input": ({"collection_address": "EQ" + "b" * 46, "analysis_depth": "advanced"}, {"analysis_depth": "deep"}),
+        "output": (
+            {"floor_price": 12.5, "trend_direction": "up", "confidence": 0.82},
+            {"floor_price": 12.5, "trend_direction": "sideways", "confidence": 3},
+        ),
+    },
+    "smart-contract-auditor": {
+        "input": ({"contract_code": "() recv_internal() { }" * 20, "audit_level": "comprehensive"}, {"contract_code": 42}),
+        "output": (
+            {"vulnerabilities": [{"id": "reentrancy"}], "security_score": 71, "recommendations": ["add bounce check"]},
+            {"vulnerabilities": "none", "security_score": -1},
+        ),
+    },
+}
+
+
+def validating(validate, data):
+    def call():
+        try:
+            validate(data)
+        except (schemas.SchemaValidationError, jsonschema.ValidationError):
+            pass
+    return call
+
+
+def main(iterations: int) -> None:
+    load_models()
+    agents = [Agent(id=i + 1, **data) for i, data in enumerate(demo_agent_data())]
+    engine = "fastjsonschema + jsonschema" if schemas.fastjsonschema is not None else "только jsonschema"
+    print(f"JSON Schema демо-агентов ({engine}), {iterations} проверок на строку")
+
+    for agent in agents:
+        print(f"\n{agent.name}")
+        for kind, schema in (("input", agent.input_schema), ("output", agent.output_schema)):
+            started = time.perf_counter()
+            cached = schemas._jsonschema_validator(schema)
+            cached_ms = (time.perf_counter() - started) * 1000
+            started = time.perf_counter()
+            compiled = schemas.compile_schema(schema)
+            compiled_ms = (time.perf_counter() - started) * 1000
+            print(f"  {kind}: компиляция jsonschema {cached_ms:.2f}ms, основной движок {compiled_ms:.2f}ms")
+
+            registry_validate = schemas.agent_schemas.validate_input if kind == "input" else schemas.agent_schemas.validate_output
+            for label, data in zip(("valid", "invalid"), PAYLOADS[agent.name][kind]):
+                rows = [
+                    ("jsonschema.validate", validating(lambda d: jsonschema.validate(d, schema), data)),
+                    ("jsonschema кэш", validating(cached, data)),
+                    ("скомпилированная", validating(compiled, data)),
+                    ("реестр агента", validating(lambda d: registry_validate(agent, d), data)),
+                ]
+                for name, call in rows:
+                    print_row(f"  {kind}/{label}: {name}", summarize(measure(call, iterations)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args()
+    main(args.iterations)
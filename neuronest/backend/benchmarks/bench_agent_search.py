@@ -0,0 +1,141 @@
+"""
+Бенчмарк поиска и автодополнения на синтетическом каталоге из 100k агентов
+
+По умолчанию каталог создается во временной SQLite базе (FTS5). Для
+PostgreSQL (tsvector + pg_trgm) укажите --database-url с пустой базой.
+Для сравнения замеряется прежний вариант LIKE '%q%' по описанию.
+
+    python -m benchmarks.bench_agent_search [--agents 100000] [--queries 500]
+        [--database-url postgresql+asyncpg://...]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+
+from benchmarks._env import load_env, measure_async, print_row, summarize
+
+load_env()
+
+from sqlalchemy import insert, select  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.core.database import Base, load_models  # noqa: E402
+from app.models.agent import Agent, AgentCategory, AgentStatus  # noqa: E402
+from app.services.agent_search import AgentSearch  # noqa: E402
+
+# Целевые p99 (мс)
+SEARCH_P99_MS = 50
+AUTOCOMPLETE_P99_MS = 10
+
+WORDS = [
+    "assistant", "trader", "analyst", "writer", "translator", "coach", "planner", "tutor",
+    "scanner", "monitor", "summarizer", "designer", "coder", "reviewer", "forecaster", "scout",
+    "crypto", "market", "news", "code", "fitness", "recipe", "travel", "legal", "research",
+    "ассистент", "аналитик", "переводчик", "трейдер", "помощник", "репетитор", "дизайнер",
+]
+SYLLABLES = ["ka", "lo", "mi", "ren", "dor", "vel", "sta", "qui", "ne", "tor", "bra", "zu", "fi", "gan", "pex"]
+# Словарь описаний: базовые слова и синтетические термины, как в реальном каталоге
+VOCABULARY = WORDS + sorted({
+    "".join(random.Random(n).choices(SYLLABLES, k=3)) for n in range(5000)
+})
+TAGS = ["ai", "nft", "ton", "defi", "gpt", "telegram", "trading", "education", "health", "games"]
+
+
+def synthetic_agents(count: int, seed: int = 42):
+    rnd = random.Random(seed)
+    categories = list(AgentCategory)
+    for i in range(count):
+        words = rnd.sample(WORDS, 3)
+        yield {
+            "name": f"{words[0]}-{words[1]}-{i}",
+            "display_name": f"{words[0].title()} {words[1].title()} {i}",
+            "description": " ".join(rnd.choices(VOCABULARY, k=40)),
+            "short_description": " ".join(words),
+            "category": rnd.choice(categories),
+            "tags": rnd.sample(TAGS, 3),
+            "status": AgentStatus.ACTIVE,
+            "is_featured": rnd.random() < 0.01,
+            "popularity_score": int(rnd.paretovariate(1.2) * 10),
+            "rating": rnd.randint(0, 100),
+            "base_price": 10 ** 9,
+            "docker_image": "neuronest/agents/synthetic",
+            "input_schema": {},
+        }
+
+
+async def populate(engine, count: int) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    batch = []
+    async with engine.begin() as conn:
+        for row in synthetic_agents(count):
+            batch.append(row)
+            if len(batch) == 5000:
+                await conn.execute(insert(Agent.__table__), batch)
+                batch = []
+        if batch:
+            await conn.execute(insert(Agent.__table__), batch)
+        if engine.dialect.name == "postgresql":
+            await conn.exec_driver_sql("ANALYZE agents")
+
+
+async def main(agents: int, queries: int, database_url: str) -> None:
+    load_models()
+    if not database_url:
+        database_url = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "agent_search.db")
+    engine = create_async_engine(database_url)
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    print(f"Заполнение каталога: {agents} агентов ({engine.dialect.name})...")
+    await populate(engine, agents)
+
+    rnd = random.Random(7)
+    search_terms = [" ".join(rnd.sample(VOCABULARY, rnd.choice((1, 2)))) for _ in range(queries)]
+    prefixes = [rnd.choice(WORDS)[:rnd.randint(2, 5)] for _ in range(queries)]
+
+    # Кэш автодополнения отключен, чтобы замерять запросы к БД
+    search = AgentSearch(session_factory=session_factory, cache_ttl=0)
+    term_iter = iter(search_terms * 2)
+    prefix_iter = iter(prefixes * 2)
+
+    search_stats = summarize(await measure_async(lambda: search.search(next(term_iter)), queries))
+    autocomplete_stats = summarize(await measure_async(lambda: search.autocomplete(next(prefix_iter)), queries))
+
+    like_iter = iter(search_terms)
+
+    async def like_scan():
+        term = next(like_iter).split()[0]
+        async with session_factory() as db:
+            await db.execute(
+                select(Agent)
+                .where(Agent.description.like(f"%{term}%"))
+                .order_by(Agent.popularity_score.desc())
+                .limit(20)
+            )
+
+    like_stats = summarize(await measure_async(like_scan, min(queries, 50)))
+
+    print_row("LIKE '%q%' scan (прежний вариант)", like_stats)
+    print_row("search", search_stats)
+    print_row("autocomplete", autocomplete_stats)
+    for name, stats, target in (
+        ("search", search_stats, SEARCH_P99_MS),
+        ("autocomplete", autocomplete_stats, AUTOCOMPLETE_P99_MS),
+    ):
+        p99_ms = stats["p99_us"] / 1000
+        verdict = "OK" if p99_ms <= target else "FAIL"
+        print(f"{name:<14} p99={p99_ms:.2f} ms target<={target} ms: {verdict}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--agents", type=int, default=100000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--database-url", default="", help="async URL пустой базы (по умолчанию временная SQLite)")
+    args = parser.parse_args()
+    asyncio.run(main(args.agents, args.queries, args.database_url))
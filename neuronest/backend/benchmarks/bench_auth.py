@@ -0,0 +1,90 @@
+"""
+Микробенчмарк аутентификации запроса
+
+Сравнивает стоимость проверки одного запроса:
+  - прежняя схема: initData в каждом запросе, ключ HMAC выводится из
+    токена бота, строка разбирается и сортируется при каждом вызове;
+  - JWT без кэша (jose.jwt.decode на каждый запрос);
+  - TokenVerifier с LRU кэшем (повторный запрос с тем же токеном).
+
+    python -m benchmarks.bench_auth [--iterations 20000] [--users 1000]
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import time
+import urllib.parse
+
+from benchmarks._env import load_env, measure, print_row, summarize
+
+load_env()
+
+from jose import jwt  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.core.security import TelegramInitDataVerifier, TokenVerifier  # noqa: E402
+
+
+def sign_init_data(bot_token: str, user_id: int) -> str:
+    fields = {
+        "auth_date": str(int(time.time())),
+        "query_id": f"AAH{user_id:010d}",
+        "user": json.dumps({"id": user_id, "first_name": "Bench", "username": f"user{user_id}", "language_code": "ru"}),
+    }
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    fields["hash"] = hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urllib.parse.urlencode(fields)
+
+
+def legacy_verify(init_data: str, bot_token: str) -> dict:
+    """Прежняя проверка initData на каждый запрос"""
+    fields = dict(urllib.parse.parse_qsl(init_data))
+    received_hash = fields.pop("hash")
+    data_check_string = "\n".join(f"{key}={fields[key]}" for key in sorted(fields))
+    secret = hmac.new(b"WebAppData", bot_token.encode(), hashlib.sha256).digest()
+    calculated = hmac.new(secret, data_check_string.encode(), hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(received_hash, calculated):
+        raise ValueError("bad hash")
+    fields["user"] = json.loads(fields["user"])
+    return fields
+
+
+def main(iterations: int, users: int) -> None:
+    bot_token = settings.TELEGRAM_BOT_TOKEN
+    secret, algorithm = settings.JWT_SECRET_KEY, settings.JWT_ALGORITHM
+    init_data = [sign_init_data(bot_token, 100000 + i) for i in range(users)]
+    verifier = TokenVerifier(secret, algorithm, cache_size=users * 2)
+    tokens = [verifier.issue({"sub": str(100000 + i), "uid": i + 1})[0] for i in range(users)]
+
+    rng = random.Random(42)
+    picks = [rng.randrange(users) for _ in range(iterations)]
+
+    def cycle(fn):
+        it = iter(picks)
+        return lambda: fn(next(it))
+
+    telegram = TelegramInitDataVerifier(bot_token, max_age=0)
+    print(f"Аутентификация запроса: {iterations} запросов, {users} пользователей")
+    print_row("initData на запрос (прежняя схема)", summarize(measure(
+        cycle(lambda i: legacy_verify(init_data[i], bot_token)), iterations)))
+    print_row("initData, ключ HMAC выведен заранее", summarize(measure(
+        cycle(lambda i: telegram.verify(init_data[i])), iterations)))
+    print_row("JWT jose.decode без кэша", summarize(measure(
+        cycle(lambda i: jwt.decode(tokens[i], secret, algorithms=[algorithm])), iterations)))
+
+    for token in tokens:
+        verifier.verify(token)
+    print_row("JWT TokenVerifier (LRU кэш)", summarize(measure(
+        cycle(lambda i: verifier.verify(tokens[i])), iterations)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+    main(args.iterations, args.users)
@@ -0,0 +1,143 @@
+"""
+Бенчмарк истории выполнений: OFFSET против keyset пагинации
+
+Таблица agent_executions заполняется синтетическими строками (по умолчанию
+10M, строки генерирует сама БД) с тяжелыми input_data/output_data/logs.
+Замеряется страница на разной глубине истории одного пользователя:
+OFFSET со всеми колонками (прежний вариант) и курсор с отложенной
+загрузкой тяжелых колонок, как в GET /agents/executions.
+
+    python -m benchmarks.bench_history_pagination [--rows 10000000] [--users 100]
+        [--database-url postgresql+asyncpg://...]
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from benchmarks._env import load_env, measure_async, print_row, summarize
+
+load_env()
+
+from sqlalchemy import insert, select, text  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.orm import defer  # noqa: E402
+
+from app.core.database import Base, load_models  # noqa: E402
+from app.core.pagination import encode_cursor, keyset_page, split_page  # noqa: E402
+from app.models.agent import Agent, AgentCategory, AgentExecution  # noqa: E402
+from app.models.user import User  # noqa: E402
+
+PAGE_SIZE = 20
+CHUNK = 1_000_000
+LOGS_SIZE = 2000
+
+SQLITE_FILL = """
+INSERT INTO agent_executions (execution_id, user_id, agent_id, status, progress, input_data, output_data,
+                              logs, price_paid, commission_paid, created_at)
+WITH RECURSIVE seq(n) AS (SELECT :start UNION ALL SELECT n + 1 FROM seq WHERE n < :stop)
+SELECT 'bench-' || n, n % :users + 1, 1, 'COMPLETED', 100, '{"prompt": "' || hex(randomblob(64)) || '"}',
+       '{"result": "' || hex(randomblob(256)) || '"}', printf('%.*c', :logs_size, 'x'), 1000000000, 10000000,
+       strftime('%Y-%m-%d %H:%M:%S', '2024-01-01', '+' || n || ' seconds') || '.000000'
+FROM seq
+"""
+
+POSTGRES_FILL = """
+INSERT INTO agent_executions (execution_id, user_id, agent_id, status, progress, input_data, output_data,
+                              logs, price_paid, commission_paid, created_at)
+SELECT 'bench-' || n, n % :users + 1, 1, 'COMPLETED', 100, json_build_object('prompt', md5(n::text)),
+       json_build_object('result', repeat(md5(n::text), 8)), repeat('x', :logs_size), 1000000000, 10000000,
+       timestamp '2024-01-01' + n * interval '1 second'
+FROM generate_series(:start, :stop) AS n
+"""
+
+
+async def populate(engine, rows: int, users: int) -> None:
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User.__table__), [{"id": i, "telegram_id": i} for i in range(1, users + 1)])
+        await conn.execute(insert(Agent.__table__), [{
+            "id": 1, "name": "bench-agent", "display_name": "Bench", "description": "bench",
+            "category": AgentCategory.PRODUCTIVITY, "base_price": 10 ** 9,
+            "docker_image": "neuronest/agents/synthetic", "input_schema": {},
+        }])
+
+    fill = POSTGRES_FILL if engine.dialect.name == "postgresql" else SQLITE_FILL
+    for start in range(1, rows + 1, CHUNK):
+        stop = min(rows, start + CHUNK - 1)
+        async with engine.begin() as conn:
+            await conn.execute(text(fill), {"start": start, "stop": stop, "users": users, "logs_size": LOGS_SIZE})
+        print(f"  {stop}/{rows}")
+
+    async with engine.begin() as conn:
+        await conn.exec_driver_sql("ANALYZE")
+
+
+async def main(rows: int, users: int, queries: int, database_url: str) -> None:
+    load_models()
+    if not database_url:
+        database_url = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "history.db")
+    engine = create_async_engine(database_url)
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    print(f"Заполнение agent_executions: {rows} строк, {users} пользователей ({engine.dialect.name})...")
+    started = time.monotonic()
+    await populate(engine, rows, users)
+    print(f"Заполнено за {time.monotonic() - started:.1f}s")
+
+    user_id = 1
+    per_user = rows // users
+    base = select(AgentExecution).where(AgentExecution.user_id == user_id)
+
+    async def offset_page(offset: int) -> None:
+        async with session_factory() as db:
+            statement = (
+                base.order_by(AgentExecution.created_at.desc(), AgentExecution.id.desc())
+                .offset(offset).limit(PAGE_SIZE)
+            )
+            (await db.execute(statement)).scalars().all()
+
+    async def cursor_for(offset: int):
+        """Курсор строки, после которой начинается страница с данным OFFSET"""
+        if offset == 0:
+            return None
+        async with session_factory() as db:
+            row = (await db.execute(
+                select(AgentExecution.created_at, AgentExecution.id)
+                .where(AgentExecution.user_id == user_id)
+                .order_by(AgentExecution.created_at.desc(), AgentExecution.id.desc())
+                .offset(offset - 1).limit(1)
+            )).one()
+        return encode_cursor(row.created_at, row.id)
+
+    async def keyset(cursor) -> None:
+        async with session_factory() as db:
+            statement = keyset_page(
+                base.options(
+                    defer(AgentExecution.input_data), defer(AgentExecution.output_data), defer(AgentExecution.logs)
+                ),
+                AgentExecution.created_at, AgentExecution.id, cursor, PAGE_SIZE
+            )
+            split_page((await db.execute(statement)).scalars().all(), PAGE_SIZE)
+
+    for depth in (0, 0.01, 0.5, 0.99):
+        offset = int(per_user * depth) // PAGE_SIZE * PAGE_SIZE
+        cursor = await cursor_for(offset)
+        offset_stats = summarize(await measure_async(lambda: offset_page(offset), queries))
+        keyset_stats = summarize(await measure_async(lambda: keyset(cursor), queries))
+        print_row(f"OFFSET {offset} (все колонки)", offset_stats)
+        print_row(f"keyset @ {offset} (defer)", keyset_stats)
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--database-url", default="", help="async URL пустой базы (по умолчанию временная SQLite)")
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.users, args.queries, args.database_url))
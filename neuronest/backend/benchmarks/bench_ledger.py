@@ -0,0 +1,150 @@
+"""
+Стресс-тест журнала баланса: параллельные списания одного пользователя
+
+Баланс пополняется ровно на половину запрошенных списаний, затем все
+списания запускаются параллельно, каждый ключ идемпотентности - дважды
+одновременно. Проверяется, что успешных списаний ровно столько, сколько
+покрывает баланс, остаток равен нулю, повторы не списали средства и
+сумма записей журнала совпадает со снимком users.notpunks_balance.
+
+Для сравнения тот же поток списаний прогоняется через прежнюю схему
+SELECT баланса и UPDATE вычисленного значения (потерянные обновления).
+
+    python -m benchmarks.bench_ledger [--debits 2000] [--parallel 200]
+        [--database-url postgresql+asyncpg://...]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks._env import load_env, print_row, summarize
+
+load_env()
+
+from sqlalchemy import func, insert, select, update  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.core.database import Base, load_models  # noqa: E402
+from app.models.ledger import LedgerEntry  # noqa: E402
+from app.models.user import User  # noqa: E402
+from app.services import ledger  # noqa: E402
+
+AMOUNT = 10
+
+
+async def run_parallel(jobs, parallel: int):
+    semaphore = asyncio.Semaphore(parallel)
+    samples = []
+
+    async def guarded(job):
+        async with semaphore:
+            start = time.perf_counter_ns()
+            try:
+                return await job()
+            finally:
+                samples.append(time.perf_counter_ns() - start)
+
+    results = await asyncio.gather(*(guarded(job) for job in jobs), return_exceptions=True)
+    return results, samples
+
+
+async def main(debits: int, parallel: int, database_url: str) -> int:
+    load_models()
+    if not database_url:
+        database_url = "sqlite+aiosqlite:///" + os.path.join(tempfile.mkdtemp(), "ledger.db")
+    if database_url.startswith("sqlite"):
+        # SQLite сериализует запись: ожидание блокировки вместо ошибки
+        engine = create_async_engine(database_url, connect_args={"timeout": 60})
+    else:
+        engine = create_async_engine(database_url, pool_size=min(parallel, 50), max_overflow=0)
+    session_factory = async_sessionmaker(bind=engine, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(insert(User.__table__), [{"id": 1, "telegram_id": 1}, {"id": 2, "telegram_id": 2}])
+
+    funded = debits // 2
+    async with session_factory() as db:
+        await ledger.post_entry(db, 1, funded * AMOUNT, "seed")
+        await db.commit()
+
+    def debit(i: int):
+        async def job():
+            async with session_factory() as db:
+                posting = await ledger.post_entry(db, 1, -AMOUNT, f"debit:{i}")
+                await db.commit()
+                return posting
+        return job
+
+    # Каждый ключ дважды: параллельный повтор не должен списать второй раз
+    jobs = [debit(i) for i in range(debits) for _ in range(2)]
+    print(f"Журнал ({engine.dialect.name}): {len(jobs)} запросов, {debits} ключей, параллельно {parallel}")
+    started = time.monotonic()
+    results, samples = await run_parallel(jobs, parallel)
+    elapsed = time.monotonic() - started
+
+    applied = sum(1 for r in results if isinstance(r, ledger.Posting) and not r.replayed)
+    replayed = sum(1 for r in results if isinstance(r, ledger.Posting) and r.replayed)
+    insufficient = sum(1 for r in results if isinstance(r, ledger.InsufficientFunds))
+    errors = [r for r in results if isinstance(r, Exception) and not isinstance(r, ledger.InsufficientFunds)]
+
+    async with session_factory() as db:
+        snapshot = await db.scalar(select(User.notpunks_balance).where(User.id == 1))
+        spent = await db.scalar(select(User.total_spent).where(User.id == 1))
+        journal = await ledger.ledger_balance(db, 1)
+        entries = await db.scalar(select(func.count()).select_from(LedgerEntry).where(LedgerEntry.user_id == 1))
+
+    print_row("post_entry (debit)", summarize(samples))
+    print(f"  {len(jobs) / elapsed:.0f} запросов/с; списано {applied}, повторов {replayed}, "
+          f"отказов {insufficient}, ошибок {len(errors)}")
+    checks = [
+        ("успешных списаний = покрытых балансом", applied == funded),
+        ("остаток = 0", snapshot == 0),
+        ("total_spent = сумма списаний", spent == funded * AMOUNT),
+        ("журнал = снимок баланса", journal == snapshot),
+        ("записей журнала = пополнение + списания", entries == funded + 1),
+        ("нет ошибок", not errors),
+    ]
+    for name, ok in checks:
+        print(f"  {name:<42} {'OK' if ok else 'FAIL'}")
+    if errors:
+        print(f"  первая ошибка: {errors[0]!r}")
+
+    # Прежняя схема: чтение баланса и запись вычисленного значения
+    async with engine.begin() as conn:
+        await conn.execute(update(User.__table__).where(User.id == 2).values(notpunks_balance=debits * AMOUNT))
+
+    def naive(_):
+        async def job():
+            async with session_factory() as db:
+                balance = await db.scalar(select(User.notpunks_balance).where(User.id == 2))
+                if balance < AMOUNT:
+                    return False
+                await db.execute(update(User.__table__).where(User.id == 2).values(notpunks_balance=balance - AMOUNT))
+                await db.commit()
+                return True
+        return job
+
+    results, _ = await run_parallel([naive(i) for i in range(debits)], parallel)
+    succeeded = sum(1 for r in results if r is True)
+    async with session_factory() as db:
+        left = await db.scalar(select(User.notpunks_balance).where(User.id == 2))
+    lost = (debits * AMOUNT - left) // AMOUNT
+    print(f"SELECT + UPDATE: успешных {succeeded}, фактически списано {lost}, "
+          f"потеряно обновлений {succeeded - lost}, ошибок {sum(isinstance(r, Exception) for r in results)}")
+
+    await engine.dispose()
+    return 0 if all(ok for _, ok in checks) else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--debits", type=int, default=2000)
+    parser.add_argument("--parallel", type=int, default=200)
+    parser.add_argument("--database-url", default="", help="async URL пустой базы (по умолчанию временная SQLite)")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args.debits, args.parallel, args.database_url)))
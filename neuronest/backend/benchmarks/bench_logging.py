@@ -0,0 +1,125 @@
+"""
+Пропускная способность запросов с логированием и без
+
+Обработчик повторяет путь проверки NFT: несколько записей INFO на запрос,
+включая список NFT и итоговый словарь. Сравниваются режимы:
+  - off: записи ниже WARNING отключены;
+  - sync: прежняя схема, JSON форматирование и запись в event loop;
+  - queue: QueueHandler/QueueListener, форматирование в потоке записи;
+  - queue+limit: то же с лимитом записей в секунду на логгер.
+
+    python -m benchmarks.bench_logging [--requests 20000] [--concurrency 100]
+        [--output /tmp/bench.log]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+
+from benchmarks._env import load_env, print_row, summarize
+
+load_env()
+
+from app.core.logging import build_pipeline  # noqa: E402
+
+logger = logging.getLogger("bench.nft")
+
+NFTS = [
+    {
+        "address": f"0:{i:064x}",
+        "collection": "0:" + "ab" * 32,
+        "name": f"NOT PUNK #{i}",
+        "image": f"https://cache.tonapi.io/imgproxy/{i}.png",
+        "metadata": {"attributes": [{"trait_type": "Background", "value": "Blue"}]},
+    }
+    for i in range(12)
+]
+
+
+class LegacyJSONFormatter(logging.Formatter):
+    """Прежний форматтер setup_logging"""
+
+    def format(self, record):
+        log_obj = {
+            'timestamp': self.formatTime(record, self.datefmt),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pathname': record.pathname,
+            'line': record.lineno
+        }
+        return json.dumps(log_obj)
+
+
+async def handle_request(wallet_address: str) -> dict:
+    logger.info("Checking NFT ownership for wallet: %s", wallet_address)
+    await asyncio.sleep(0)
+    logger.info("Retrieved NFTs: %s", NFTS)
+    result = {"has_access": True, "access_level": "premium", "nfts": NFTS, "total_nfts": len(NFTS)}
+    logger.info("Valid NFTs found: %d", len(NFTS))
+    logger.info("Final result: %s", result)
+    return result
+
+
+async def run(requests: int, concurrency: int):
+    samples = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(i: int):
+        async with semaphore:
+            start = time.perf_counter_ns()
+            await handle_request(f"UQ{i:046d}")
+            samples.append(time.perf_counter_ns() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return requests / (time.perf_counter() - started), samples
+
+
+def configure(mode: str, stream):
+    """Обработчик режима и поток записи (если есть)"""
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO if mode != "off" else logging.WARNING)
+
+    if mode in ("off", "sync"):
+        handler = logging.StreamHandler(stream)
+        handler.setFormatter(LegacyJSONFormatter())
+        root.addHandler(handler)
+        return handler, None
+
+    limits = {"bench": 1000} if mode == "queue+limit" else {}
+    handler, listener = build_pipeline(stream=stream, log_format="json", rate_limits=limits, debug_sample_rate=1.0)
+    root.addHandler(handler)
+    listener.start()
+    return handler, listener
+
+
+def main(requests: int, concurrency: int, output: str) -> None:
+    print(f"Логирование пути проверки NFT: {requests} запросов, параллельно {concurrency}, вывод {output}")
+    for mode in ("off", "sync", "queue", "queue+limit"):
+        with open(output, "a", encoding="utf-8") as stream:
+            handler, listener = configure(mode, stream)
+            rps, samples = asyncio.run(run(requests, concurrency))
+            drain_started = time.perf_counter()
+            if listener is not None:
+                listener.stop()
+            drain = time.perf_counter() - drain_started
+        print_row(f"{mode:<12} {rps:>8.0f} запросов/с", summarize(samples))
+        if listener is not None:
+            print(f"  дозапись очереди после нагрузки: {drain * 1000:.0f}ms, отброшено при переполнении: {handler.dropped}")
+    logging.getLogger().handlers.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--output", default=os.path.join(tempfile.gettempdir(), "neuronest-bench.log"))
+    args = parser.parse_args()
+    main(args.requests, args.concurrency, args.output)
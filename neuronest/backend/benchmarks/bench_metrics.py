@@ -0,0 +1,92 @@
+"""
+Накладные расходы метрик Prometheus
+
+Замеряет стоимость операций prometheus_client на горячем пути (inc, observe,
+labels) и полный вызов MetricsMiddleware вокруг пустого ASGI приложения.
+С --multiprocess метрики пишутся в mmap файлы каталога, как при
+нескольких воркерах gunicorn.
+
+    python -m benchmarks.bench_metrics [--iterations 100000] [--multiprocess]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks._env import load_env, measure, measure_async, print_row, summarize
+
+# Режим multiprocess нужно выбрать до импорта prometheus_client
+if "--multiprocess" in sys.argv:
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="prometheus-")
+load_env()
+
+from app.core import metrics  # noqa: E402
+from app.middleware.metrics import MetricsMiddleware  # noqa: E402
+
+
+class Route:
+    path = "/api/v1/agents/{agent_id}"
+
+
+async def endpoint(scope, receive, send):
+    scope["route"] = Route
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"{}"})
+
+
+async def receive():
+    return {"type": "http.request", "body": b"", "more_body": False}
+
+
+async def send(message):
+    pass
+
+
+async def bench_middleware(iterations: int) -> None:
+    middleware = MetricsMiddleware(endpoint)
+
+    def scope():
+        return {"type": "http", "method": "GET", "path": "/api/v1/agents/42", "headers": []}
+
+    bare = await measure_async(lambda: endpoint(scope(), receive, send), iterations)
+    wrapped = await measure_async(lambda: middleware(scope(), receive, send), iterations)
+    print_row("ASGI приложение без метрик", summarize(bare))
+    print_row("ASGI приложение + MetricsMiddleware", summarize(wrapped))
+    overhead = summarize(wrapped)["p50_us"] - summarize(bare)["p50_us"]
+    print(f"  накладные расходы на запрос (p50): {overhead:.2f}us")
+
+
+def main(iterations: int) -> None:
+    mode = f"multiprocess ({os.environ['PROMETHEUS_MULTIPROC_DIR']})" if metrics.MULTIPROCESS else "один процесс"
+    print(f"Метрики Prometheus, режим: {mode}, {iterations} итераций")
+
+    counter = metrics.AGENT_EXECUTIONS.labels("completed")
+    histogram = metrics.HTTP_REQUEST_DURATION.labels("GET", Route.path, "2xx")
+    print_row("Counter.inc", summarize(measure(counter.inc, iterations)))
+    print_row("Histogram.observe", summarize(measure(lambda: histogram.observe(0.012), iterations)))
+    print_row("labels() + observe", summarize(measure(
+        lambda: metrics.HTTP_REQUEST_DURATION.labels("GET", Route.path, "2xx").observe(0.012), iterations)))
+    print_row("Gauge.inc + dec (в обработке)", summarize(measure(
+        lambda: (metrics.HTTP_REQUESTS_IN_PROGRESS.inc(), metrics.HTTP_REQUESTS_IN_PROGRESS.dec()), iterations)))
+
+    def redis_command():
+        started = time.perf_counter()
+        metrics.REDIS_COMMAND_DURATION.observe(time.perf_counter() - started)
+
+    print_row("замер команды Redis", summarize(measure(redis_command, iterations)))
+    asyncio.run(bench_middleware(iterations))
+
+    started = time.perf_counter()
+    size = len(metrics.render())
+    print(f"Выдача /metrics: {(time.perf_counter() - started) * 1000:.1f}ms, {size} байт")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=100000)
+    parser.add_argument("--multiprocess", action="store_true", help="метрики в общем каталоге (несколько воркеров)")
+    args = parser.parse_args()
+    main(args.iterations)
@@ -0,0 +1,109 @@
+"""
+Микробенчмарк стека middleware: BaseHTTPMiddleware против чистого ASGI
+
+Запросы идут через httpx.ASGITransport без сети, поэтому замер показывает
+накладные расходы самого стека. Redis не подключается, лимитер работает
+в локальном режиме.
+
+    python -m benchmarks.bench_middleware [--requests 5000]
+"""
+
+import argparse
+import asyncio
+import time
+from collections import defaultdict, deque
+
+from benchmarks._env import load_env
+
+load_env()
+
+import httpx  # noqa: E402
+from fastapi import FastAPI, Request  # noqa: E402
+from starlette.middleware.base import BaseHTTPMiddleware  # noqa: E402
+
+from app.api.v1.router import api_router  # noqa: E402
+from app.core.rate_limiter import RateLimiter  # noqa: E402
+from app.core.security import token_verifier  # noqa: E402
+from app.middleware.auth import AuthMiddleware  # noqa: E402
+from app.middleware.rate_limit import RateLimitMiddleware  # noqa: E402
+
+PATHS = ["/health", "/api/v1/test"]
+
+
+class LegacyAuthMiddleware(BaseHTTPMiddleware):
+    """Прежний AuthMiddleware"""
+
+    PUBLIC_PATHS = AuthMiddleware.PUBLIC_PATHS
+
+    async def dispatch(self, request: Request, call_next):
+        if any(request.url.path.startswith(path) for path in self.PUBLIC_PATHS):
+            return await call_next(request)
+        return await call_next(request)
+
+
+class LegacyRateLimitMiddleware(BaseHTTPMiddleware):
+    """Прежний RateLimitMiddleware (deque на IP)"""
+
+    def __init__(self, app, requests_per_minute: int):
+        super().__init__(app)
+        self.requests_per_minute = requests_per_minute
+        self.requests = defaultdict(deque)
+
+    async def dispatch(self, request: Request, call_next):
+        client_ip = request.client.host
+        now = time.time()
+        while self.requests[client_ip] and self.requests[client_ip][0] < now - 60:
+            self.requests[client_ip].popleft()
+        self.requests[client_ip].append(now)
+        return await call_next(request)
+
+
+def build_app(legacy: bool) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/health")
+    async def health_check():
+        return {"status": "healthy", "service": "neuronest-backend"}
+
+    app.include_router(api_router, prefix="/api/v1")
+
+    # Лимит заведомо выше числа запросов, чтобы замерять только накладные расходы
+    if legacy:
+        app.add_middleware(LegacyRateLimitMiddleware, requests_per_minute=10 ** 9)
+        app.add_middleware(LegacyAuthMiddleware)
+    else:
+        limiter = RateLimiter(requests_per_minute=10 ** 9, burst=10 ** 9)
+        app.add_middleware(RateLimitMiddleware, limiter=limiter)
+        app.add_middleware(AuthMiddleware)
+    return app
+
+
+async def run(app: FastAPI, path: str, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app, client=("127.0.0.1", 12345))
+    token, _ = token_verifier.issue({"sub": "1", "uid": 1})
+    headers = {"Authorization": f"Bearer {token}"}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers) as client:
+        for _ in range(100):
+            await client.get(path)
+        start = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get(path)
+            assert response.status_code == 200, response.status_code
+        return requests / (time.perf_counter() - start)
+
+
+async def main(requests: int) -> None:
+    for path in PATHS:
+        before = await run(build_app(legacy=True), path, requests)
+        after = await run(build_app(legacy=False), path, requests)
+        print(
+            f"{path:<16} BaseHTTPMiddleware: {before:>9.0f} req/s   "
+            f"pure ASGI: {after:>9.0f} req/s   ({after / before:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests))
@@ -0,0 +1,119 @@
+"""
+Бенчмарк проверки NFT-доступа: локальный индекс против TON API
+
+TON API заменен локальным stand-in сервером (aiohttp), отвечающим в формате
+TONAPI.io с искусственной задержкой. Индекс хранится в SQLite (aiosqlite).
+
+    python -m benchmarks.bench_nft_index [--iterations 2000] [--items 30000] [--latency-ms 40]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+
+from benchmarks._env import load_env, measure_async, print_row, summarize
+
+load_env()
+
+from aiohttp import web  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+
+from app.core.database import Base  # noqa: E402
+from app.models.nft_holding import NFTHolding  # noqa: E402
+from app.services.nft_index import NFTHolderIndex  # noqa: E402
+from ton_api import TONAPIClient  # noqa: E402
+
+COLLECTIONS = [f"0:{i:064x}" for i in (1, 2, 3)]
+
+
+def owner_address(n: int) -> str:
+    return f"0:{n + 1000:064x}"
+
+
+def build_stand_in(holdings, latency: float) -> web.Application:
+    """Stand-in для GET /v2/accounts/{wallet}/nfts"""
+    by_owner = {}
+    for collection, index, owner in holdings:
+        by_owner.setdefault((owner, collection), []).append(index)
+
+    async def account_nfts(request: web.Request) -> web.Response:
+        await asyncio.sleep(latency)
+        owner = request.match_info["wallet"]
+        collection = request.query["collection"]
+        offset = int(request.query.get("offset", 0))
+        limit = int(request.query.get("limit", 100))
+        indexes = by_owner.get((owner, collection), [])[offset:offset + limit]
+        return web.json_response({
+            "nft_items": [
+                {
+                    "address": f"0:{index:064x}",
+                    "index": index,
+                    "collection": {"address": collection},
+                    "owner": {"address": owner},
+                    "metadata": {"name": f"#{index}"},
+                    "verified": True,
+                }
+                for index in indexes
+            ]
+        })
+
+    app = web.Application()
+    app.router.add_get("/v2/accounts/{wallet}/nfts", account_nfts)
+    return app
+
+
+async def main(iterations: int, items: int, latency_ms: float) -> None:
+    owners = max(1, items // 3)
+    holdings = [
+        (COLLECTIONS[i % len(COLLECTIONS)], i, owner_address(random.randrange(owners)))
+        for i in range(items)
+    ]
+
+    runner = web.AppRunner(build_stand_in(holdings, latency_ms / 1000))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    db_path = os.path.join(tempfile.mkdtemp(), "nft_index.db")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all, tables=[NFTHolding.__table__])
+        await conn.execute(
+            NFTHolding.__table__.insert(),
+            [
+                {"collection": c, "item_index": i, "item_address": f"0:{i:064x}", "owner": o}
+                for c, i, o in holdings
+            ]
+        )
+
+    client = TONAPIClient(tonapi_token="bench")
+    client.tonapi_base = f"http://127.0.0.1:{port}/v2"
+    await client.start()
+    index = NFTHolderIndex(client, collections=COLLECTIONS, session_factory=async_sessionmaker(engine))
+
+    def wallet() -> str:
+        return owner_address(random.randrange(owners))
+
+    samples = await measure_async(
+        lambda: client.get_wallet_collection_nfts(wallet(), COLLECTIONS), iterations
+    )
+    print_row(f"TON API path (stand-in, {latency_ms:.0f}ms)", summarize(samples))
+
+    samples = await measure_async(lambda: index.lookup(wallet()), iterations)
+    print_row("local index lookup (SQLite)", summarize(samples))
+
+    await client.close()
+    await engine.dispose()
+    await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=2000)
+    parser.add_argument("--items", type=int, default=30000)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.items, args.latency_ms))
@@ -0,0 +1,77 @@
+"""
+Бенчмарк накладных расходов rate limiter на запрос
+
+Сравнивает прежний limiter (deque на IP в памяти воркера) с GCRA лимитером:
+локальным fallback и Lua-скриптом в Redis (если REDIS_URL доступен).
+
+    python -m benchmarks.bench_rate_limit [--iterations 50000] [--clients 1000]
+"""
+
+import argparse
+import asyncio
+import time
+from collections import defaultdict, deque
+
+from benchmarks._env import load_env, measure, measure_async, print_row, summarize
+
+load_env()
+
+from app.core import redis as redis_module  # noqa: E402
+from app.core.rate_limiter import LocalRateLimiter, RateLimiter  # noqa: E402
+
+
+class LegacyDequeLimiter:
+    """Алгоритм прежнего RateLimitMiddleware"""
+
+    def __init__(self, requests_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self.requests = defaultdict(deque)
+
+    def hit(self, client_ip: str) -> bool:
+        now = time.time()
+        minute_ago = now - 60
+        while self.requests[client_ip] and self.requests[client_ip][0] < minute_ago:
+            self.requests[client_ip].popleft()
+        if len(self.requests[client_ip]) >= self.requests_per_minute:
+            return False
+        self.requests[client_ip].append(now)
+        return True
+
+
+async def main(iterations: int, clients: int) -> None:
+    keys = [f"ip:10.0.{i // 256}.{i % 256}" for i in range(clients)]
+    counter = iter(range(10 ** 12))
+
+    legacy = LegacyDequeLimiter(requests_per_minute=60)
+    samples = measure(lambda: legacy.hit(keys[next(counter) % clients]), iterations)
+    print_row("legacy deque (per-worker)", summarize(samples))
+    print(f"{'':<40} tracked keys after run: {len(legacy.requests)} (never evicted)")
+
+    local = LocalRateLimiter(max_keys=clients // 2)
+    limiter = RateLimiter()
+    limit, emission_ms, tolerance_ms = limiter.limits_for(False)
+    samples = measure(lambda: local.hit(keys[next(counter) % clients], emission_ms, tolerance_ms), iterations)
+    print_row("GCRA local fallback", summarize(samples))
+    print(f"{'':<40} tracked keys after run: {len(local)} (bounded LRU)")
+
+    try:
+        await redis_module.init_redis()
+    except Exception as e:
+        print(f"Redis недоступен, пропуск замера Redis GCRA: {e}")
+        return
+
+    async def redis_hit():
+        await limiter.hit(keys[next(counter) % clients])
+
+    await redis_hit()  # загрузка скрипта (SCRIPT LOAD)
+    samples = await measure_async(redis_hit, iterations)
+    print_row("GCRA Redis Lua (cluster-wide)", summarize(samples))
+    await redis_module.close_redis()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=50000)
+    parser.add_argument("--clients", type=int, default=1000)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.clients))
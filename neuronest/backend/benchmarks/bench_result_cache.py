@@ -0,0 +1,85 @@
+"""
+Микробенчмарк кэша результатов агентов
+
+Результат аудита контракта (smart-contract-auditor) с логами контейнера:
+  - ключ: sha256 канонического JSON входных данных;
+  - упаковка (orjson + zstd + base64) и распаковка, степень сжатия;
+  - чтение и запись через Lua скрипты в Redis (если REDIS_URL доступен).
+
+    python -m benchmarks.bench_result_cache [--iterations 20000] [--findings 40]
+"""
+
+import argparse
+import asyncio
+import base64
+
+from benchmarks._env import load_env, measure, measure_async, print_row, summarize
+
+load_env()
+
+import orjson  # noqa: E402
+
+from app.core import redis as redis_module  # noqa: E402
+from app.core.database import demo_agent_data, load_models  # noqa: E402
+from app.models.agent import Agent  # noqa: E402
+from app.services.result_cache import AgentResultCache, result_key  # noqa: E402
+
+
+def audit_result(findings: int) -> dict:
+    return {
+        "vulnerabilities": [
+            {
+                "id": f"TON-{i:03d}",
+                "severity": ("low", "medium", "high")[i % 3],
+                "title": "Unchecked bounce in recv_internal",
+                "description": "Message bounce flag is not checked before updating the stored balance. " * 3,
+                "line": 40 + i,
+            }
+            for i in range(findings)
+        ],
+        "security_score": 71,
+        "recommendations": ["add bounce check", "validate sender address", "limit gas per message"],
+    }
+
+
+async def main(iterations: int, findings: int) -> None:
+    load_models()
+    data = next(data for data in demo_agent_data() if data["name"] == "smart-contract-auditor")
+    agent = Agent(id=3, **data)
+    input_data = {"audit_level": "comprehensive", "contract_code": "() recv_internal() { }\n" * 200}
+    output = audit_result(findings)
+    logs = "".join(f"[{i:05d}] analyzing function recv_internal: ok\n" for i in range(500))
+
+    cache = AgentResultCache()
+    raw = len(orjson.dumps({"output_data": output, "logs": logs}))
+    blob = cache._pack(output, logs, "bench")
+    value = base64.b64encode(blob).decode()
+    print(f"Результат: {raw} байт JSON, {len(blob)} байт zstd, {len(value)} байт в Redis ({raw / len(value):.1f}x)")
+
+    print_row("ключ (sha256 канонического JSON)", summarize(measure(lambda: result_key(agent, input_data), iterations)))
+    print_row("упаковка", summarize(measure(lambda: cache._pack(output, logs, "bench"), iterations)))
+    print_row("распаковка", summarize(measure(lambda: cache._unpack(value), iterations)))
+
+    try:
+        await redis_module.init_redis()
+    except Exception as e:
+        print(f"Redis недоступен, пропуск замера Redis: {e}")
+        return
+
+    await cache.store(agent, input_data, output, logs, "bench")
+    samples = await measure_async(lambda: cache.store(agent, input_data, output, logs, "bench"), iterations // 10)
+    print_row("запись в Redis", summarize(samples))
+    samples = await measure_async(lambda: cache.get(agent, input_data), iterations)
+    print_row("попадание из Redis", summarize(samples))
+    missing = {**input_data, "audit_level": "basic"}
+    samples = await measure_async(lambda: cache.get(agent, missing), iterations)
+    print_row("промах", summarize(samples))
+    await redis_module.close_redis()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--findings", type=int, default=40)
+    args = parser.parse_args()
+    asyncio.run(main(args.iterations, args.findings))
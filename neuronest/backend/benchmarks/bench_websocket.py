@@ -0,0 +1,165 @@
+"""
+Нагрузочный тест WebSocket fan-out на 10k клиентов
+
+Клиенты имитируются объектами с send_text без сети, часть из них медленные.
+Сравнивается прежний последовательный broadcast и ConnectionManager
+с очередями на соединение. С --redis события идут через Redis pub/sub
+между двумя менеджерами (как между двумя воркерами uvicorn).
+
+    python -m benchmarks.bench_websocket [--clients 10000] [--slow 50] [--redis]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks._env import load_env
+
+load_env()
+
+from app.core.redis import close_redis, init_redis  # noqa: E402
+from app.websocket.manager import ConnectionManager  # noqa: E402
+
+
+class FakeWebSocket:
+    """Клиент без сети; медленный клиент ждет delay на каждое сообщение"""
+
+    def __init__(self, counter: "DeliveryCounter", delay: float = 0.0):
+        self.counter = counter
+        self.delay = delay
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.counter.hit(self.delay == 0)
+
+    async def send_json(self, data: dict):
+        await self.send_text(json.dumps(data))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+class DeliveryCounter:
+    """Ожидание доставки сообщения всем быстрым клиентам"""
+
+    def __init__(self):
+        self.expected = 0
+        self.received = 0
+        self.done = asyncio.Event()
+
+    def reset(self, expected: int):
+        self.expected = expected
+        self.received = 0
+        self.done.clear()
+
+    def hit(self, fast: bool):
+        if fast:
+            self.received += 1
+            if self.received >= self.expected:
+                self.done.set()
+
+
+async def legacy_broadcast(sockets, message: dict) -> None:
+    """Прежний ConnectionManager.broadcast"""
+    for connection in sockets:
+        await connection.send_json(message)
+
+
+async def connect_clients(manager: ConnectionManager, counter: DeliveryCounter, clients: int, slow: int):
+    connections = []
+    for i in range(clients):
+        websocket = FakeWebSocket(counter, delay=0.05 if i < slow else 0.0)
+        connection = await manager.connect(websocket, user_id=i)
+        manager.subscribe(connection, f"agent:{i % 100}")
+        connections.append(connection)
+    return connections
+
+
+async def main(clients: int, slow: int, use_redis: bool) -> None:
+    message = {"type": "execution_update", "status": "running", "progress": 50}
+    fast = clients - slow
+
+    # Прежняя реализация: последовательная отправка, медленные клиенты блокируют всех
+    counter = DeliveryCounter()
+    sockets = [FakeWebSocket(counter, delay=0.05 if i < slow else 0.0) for i in range(clients)]
+    counter.reset(fast)
+    start = time.perf_counter()
+    await legacy_broadcast(sockets, message)
+    legacy = time.perf_counter() - start
+    print(f"legacy serial broadcast          {clients} clients: {legacy * 1000:>9.1f} ms")
+
+    # Новый менеджер: очереди на соединение
+    counter = DeliveryCounter()
+    manager = ConnectionManager(queue_size=100, backpressure_policy="drop", heartbeat_interval=3600, heartbeat_timeout=7200)
+    start = time.perf_counter()
+    connections = await connect_clients(manager, counter, clients, slow)
+    print(f"connect + subscribe              {clients} clients: {(time.perf_counter() - start) * 1000:>9.1f} ms")
+
+    counter.reset(fast)
+    start = time.perf_counter()
+    manager.deliver_local("all", None, json.dumps(message))
+    enqueued = time.perf_counter() - start
+    await counter.done.wait()
+    delivered = time.perf_counter() - start
+    print(f"queued broadcast (enqueue)       {clients} clients: {enqueued * 1000:>9.1f} ms")
+    print(f"queued broadcast (fast received) {fast} clients: {delivered * 1000:>9.1f} ms   ({legacy / delivered:.1f}x)")
+
+    counter.reset(1)
+    start = time.perf_counter()
+    manager.deliver_local("user", slow + 1, json.dumps(message))
+    await counter.done.wait()
+    print(f"send_to_user                     1 client:      {(time.perf_counter() - start) * 1000:>9.3f} ms")
+
+    start = time.perf_counter()
+    for connection in connections:
+        manager.disconnect(connection)
+    print(f"disconnect                       {clients} clients: {(time.perf_counter() - start) * 1000:>9.1f} ms")
+
+    if use_redis:
+        await bench_redis(clients, slow, message)
+
+
+async def bench_redis(clients: int, slow: int, message: dict) -> None:
+    """Два менеджера (два воркера) с общей шиной Redis pub/sub"""
+    await init_redis()
+    counter = DeliveryCounter()
+    managers = [
+        ConnectionManager(queue_size=100, backpressure_policy="drop", heartbeat_interval=3600, heartbeat_timeout=7200)
+        for _ in range(2)
+    ]
+    for manager in managers:
+        await manager.start()
+        await connect_clients(manager, counter, clients // 2, slow // 2)
+    await asyncio.sleep(0.5)  # подписки Redis
+
+    fast = clients - (slow // 2) * 2
+    samples = []
+    for _ in range(20):
+        counter.reset(fast)
+        start = time.perf_counter()
+        await managers[0].broadcast(message)
+        await counter.done.wait()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    print(
+        f"redis broadcast across 2 workers {fast} clients: "
+        f"p50={samples[len(samples) // 2] * 1000:.1f} ms  max={samples[-1] * 1000:.1f} ms"
+    )
+
+    for manager in managers:
+        await manager.stop()
+    await close_redis()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--slow", type=int, default=50, help="клиентов с задержкой 50 мс на сообщение")
+    parser.add_argument("--redis", action="store_true", help="замер доставки через Redis (REDIS_URL)")
+    args = parser.parse_args()
+    asyncio.run(main(args.clients, args.slow, args.redis))
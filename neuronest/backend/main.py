@@ -6,19 +6,26 @@ Telegram Mini-App маркетплейс AI агентов с NFT-доступо
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
 import uvicorn
 import logging
 from contextlib import asynccontextmanager
 
+from app.core import metrics
 from app.core.config import settings
-from app.core.database import init_database
-from app.core.redis import init_redis
+from app.core.database import init_database, close_database, replicas
+from app.core.redis import init_redis, close_redis
 from app.core.logging import setup_logging
+from app.core.rate_limiter import RateLimiter
 from app.middleware.auth import AuthMiddleware
+from app.middleware.metrics import MetricsMiddleware
 from app.middleware.rate_limit import RateLimitMiddleware
 from app.api.v1.router import api_router
 from app.websocket.router import websocket_router
+from app.websocket.manager import manager as ws_manager
+from app.services.agent_scheduler import agent_scheduler
+from app.services.nft_access import nft_access
+from app.services.payment_watcher import PaymentWatcher
 
 # Настройка логирования
 setup_logging()
@@ -28,6 +35,7 @@ logger = logging.getLogger(__name__)
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
+    payment_watcher = None
     try:
         # Инициализация при запуске
         logger.info("🚀 Запуск NeuroNest Backend...")
@@ -40,6 +48,20 @@ async def lifespan(app: FastAPI):
         await init_redis()
         logger.info("✅ Redis подключен")
         
+        # Проверка отставания реплик для чтения (если заданы)
+        replicas.start()
+        
+        # Пул соединений TON API и кэш NFT
+        await nft_access.start()
+        
+        # Подтверждение входящих платежей (один наблюдатель на все воркеры)
+        if settings.PAYMENT_RECEIVER_ADDRESS:
+            payment_watcher = PaymentWatcher(nft_access.client)
+            payment_watcher.start()
+        
+        # Доставка WebSocket событий между воркерами
+        await ws_manager.start()
+        
         logger.info("🎉 NeuroNest Backend готов к работе!")
         yield
         
@@ -49,6 +71,13 @@ async def lifespan(app: FastAPI):
     finally:
         # Очистка при завершении
         logger.info("🔄 Завершение работы NeuroNest Backend...")
+        await ws_manager.stop()
+        if payment_watcher is not None:
+            await payment_watcher.stop()
+        await nft_access.close()
+        await close_redis()
+        await close_database()
+        metrics.mark_process_dead()
 
 
 def create_app() -> FastAPI:
@@ -91,11 +120,27 @@ def setup_middleware(app: FastAPI):
             allowed_hosts=settings.allowed_hosts_list
         )
     
+    # Rate limiting (добавляется раньше аутентификации, чтобы выполняться после нее
+    # и видеть пользователя Telegram в request.state)
+    app.add_middleware(RateLimitMiddleware)
+
     # Аутентификация
     app.add_middleware(AuthMiddleware)
+
+    # Лимит по IP до аутентификации: запросы с неверным токеном (401) тоже ограничены
+    app.add_middleware(
+        RateLimitMiddleware,
+        limiter=RateLimiter(
+            requests_per_minute=settings.RATE_LIMIT_IP_REQUESTS_PER_MINUTE,
+            burst=settings.RATE_LIMIT_IP_BURST,
+            key_prefix="ratelimit:preauth"
+        ),
+        by_ip=True
+    )
     
-    # Rate limiting
-    app.add_middleware(RateLimitMiddleware)
+    # Метрики (внешний слой: задержка включает аутентификацию и rate limiting)
+    if settings.PROMETHEUS_ENABLED:
+        app.add_middleware(MetricsMiddleware)
 
 
 def setup_routes(app: FastAPI):
@@ -106,6 +151,16 @@ def setup_routes(app: FastAPI):
     async def health_check():
         return {"status": "healthy", "service": "neuronest-backend"}
     
+    # Метрики Prometheus (всех воркеров при PROMETHEUS_MULTIPROC_DIR)
+    if settings.PROMETHEUS_ENABLED:
+        @app.get("/metrics", include_in_schema=False)
+        async def prometheus_metrics():
+            try:
+                await agent_scheduler.publish_queue_depth()
+            except Exception as e:
+                logger.warning(f"Глубина очереди агентов недоступна: {e}")
+            return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+    
     # API routes
     app.include_router(api_router, prefix="/api/v1")
     
@@ -7,16 +7,20 @@ import os
 import logging
 import hashlib
 import hmac
+import json
+import time
 import urllib.parse
 from contextlib import asynccontextmanager
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Tuple
 
 from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from jose import jwt
 from pydantic import BaseModel, Field
 
-from ton_api import TONAPIClient
+from ton_api import ProviderError, TONAPIClient, get_access_level, filter_collection_nfts
+from nft_cache import NFTOwnershipCache
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
@@ -31,6 +35,20 @@ class Settings:
     TON_API_KEY = os.getenv("TON_API_KEY", "")
     TONAPI_TOKEN = os.getenv("TONAPI_TOKEN", "")
     
+    # Redis для общего кэша NFT (опционально, без него работает только локальный LRU)
+    REDIS_URL = os.getenv("REDIS_URL", "")
+    
+    # Кэш владения NFT (секунды)
+    NFT_CACHE_TTL = int(os.getenv("NFT_CACHE_TTL", "60"))
+    NFT_CACHE_STALE_TTL = int(os.getenv("NFT_CACHE_STALE_TTL", "600"))
+    NFT_CACHE_UPSTREAM_TIMEOUT = float(os.getenv("NFT_CACHE_UPSTREAM_TIMEOUT", "3"))
+    
+    # Токен сессии, выдаваемый только после проверки подписи initData
+    # (без JWT_SECRET_KEY токены не выдаются)
+    JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "")
+    JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+    JWT_ACCESS_TOKEN_MINUTES = int(os.getenv("JWT_ACCESS_TOKEN_MINUTES", "60"))
+    
     # Режим разработки
     DEVELOPMENT_MODE = os.getenv("DEVELOPMENT_MODE", "true").lower() == "true"
     
@@ -41,6 +59,11 @@ class Settings:
 
 settings = Settings()
 
+# app.core.security не используется: он загружает app.core.config, которому
+# нужно полное окружение приложения (DATABASE_URL, ключи и т.д.). Ключ HMAC
+# WebApp, как и там, выводится из токена бота один раз при запуске.
+WEBAPP_SECRET = hmac.new(b"WebAppData", settings.TELEGRAM_BOT_TOKEN.encode(), hashlib.sha256).digest()
+
 # Pydantic модели
 class WalletCheckRequest(BaseModel):
     wallet_address: str = Field(..., min_length=10, max_length=100)
@@ -62,22 +85,60 @@ def get_ton_client():
     if ton_client is None:
         ton_client = TONAPIClient(
             api_key=settings.TON_API_KEY if settings.TON_API_KEY else None,
-            tonapi_token=settings.TONAPI_TOKEN if settings.TONAPI_TOKEN else None
+            tonapi_token=settings.TONAPI_TOKEN if settings.TONAPI_TOKEN else None,
+            allow_mock=settings.DEVELOPMENT_MODE
         )
     return ton_client
 
+async def fetch_wallet_nfts(wallet_address: str) -> List[Dict[str, Any]]:
+    """Запрос NFT разрешенных коллекций в TON API (без кэша)"""
+    return await get_ton_client().get_wallet_collection_nfts(
+        wallet_address,
+        settings.ALLOWED_NFT_COLLECTIONS
+    )
+
+# Кэш владения NFT (Redis подключается в lifespan)
+nft_cache = NFTOwnershipCache(
+    fetch=fetch_wallet_nfts,
+    ttl=settings.NFT_CACHE_TTL,
+    stale_ttl=settings.NFT_CACHE_STALE_TTL,
+    upstream_timeout=settings.NFT_CACHE_UPSTREAM_TIMEOUT
+)
+
+async def connect_cache_redis():
+    """Подключение Redis-уровня кэша NFT"""
+    if not settings.REDIS_URL:
+        logger.info("REDIS_URL не задан, кэш NFT работает только в памяти процесса")
+        return None
+    try:
+        import redis.asyncio as redis
+        client = redis.from_url(settings.REDIS_URL, encoding="utf-8", decode_responses=True)
+        await client.ping()
+        nft_cache.redis = client
+        logger.info("✅ Redis кэш NFT подключен")
+        return client
+    except Exception as e:
+        logger.warning(f"Redis недоступен, кэш NFT работает только в памяти процесса: {e}")
+        return None
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Управление жизненным циклом приложения"""
     logger.info("🚀 NeuroNest API запускается...")
     
-    # Startup
+    # Startup: одна HTTP сессия TON API на все время жизни приложения
+    await get_ton_client().start()
+    redis_client = await connect_cache_redis()
     try:
         logger.info("✅ NeuroNest API готов к работе")
         yield
     finally:
         # Shutdown
         logger.info("🔄 NeuroNest API завершает работу...")
+        if redis_client:
+            nft_cache.redis = None
+            await redis_client.close()
+        await get_ton_client().close()
 
 # Создание приложения FastAPI
 app = FastAPI(
@@ -96,15 +157,17 @@ app.add_middleware(
     allow_headers=["*"],
     expose_headers=["*"]
 )
-def verify_telegram_data(init_data: str, bot_token: str = None) -> Dict[str, Any]:
+def verify_telegram_data(init_data: str) -> Tuple[Dict[str, Any], bool]:
     """
     Проверяет подлинность данных от Telegram WebApp
+    Возвращает данные и признак проверенной подписи (False - данные
+    разобраны без проверки в режиме разработки).
     """
-    if not bot_token or bot_token == "":
+    if not settings.TELEGRAM_BOT_TOKEN:
         if settings.DEVELOPMENT_MODE:
             logger.warning("🔓 Development mode: пропуск проверки Telegram данных")
             # В режиме разработки парсим данные без проверки подписи
-            return parse_init_data_without_verification(init_data)
+            return parse_init_data_without_verification(init_data), False
         else:
             raise HTTPException(status_code=401, detail="Telegram bot token не настроен")
     
@@ -120,25 +183,39 @@ def verify_telegram_data(init_data: str, bot_token: str = None) -> Dict[str, Any
         # Создаем строку для проверки
         data_check_string = '\n'.join([f"{k}={v}" for k, v in sorted(parsed_data.items())])
         
-        # Вычисляем ключ
-        secret_key = hmac.new("WebAppData".encode(), bot_token.encode(), hashlib.sha256).digest()
-        
         # Вычисляем hash
-        calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+        calculated_hash = hmac.new(WEBAPP_SECRET, data_check_string.encode(), hashlib.sha256).hexdigest()
         
         # Проверяем hash
         if not hmac.compare_digest(received_hash, calculated_hash):
             raise HTTPException(status_code=401, detail="Неверная подпись данных")
         
-        return parsed_data
+        return parsed_data, True
         
     except Exception as e:
         logger.error(f"Ошибка проверки Telegram данных: {e}")
         if settings.DEVELOPMENT_MODE:
             logger.warning("🔓 Development mode: fallback к парсингу без проверки")
-            return parse_init_data_without_verification(init_data)
+            return parse_init_data_without_verification(init_data), False
         raise HTTPException(status_code=401, detail="Ошибка проверки данных")
 
+def issue_session_token(user_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Короткоживущий JWT сессии, как в /api/v1/telegram/verify основного API"""
+    user = user_data.get("user")
+    if isinstance(user, str):
+        user = json.loads(user)
+    if not isinstance(user, dict) or "id" not in user:
+        raise HTTPException(status_code=401, detail="В данных нет пользователя Telegram")
+    
+    ttl = settings.JWT_ACCESS_TOKEN_MINUTES * 60
+    now = int(time.time())
+    token = jwt.encode(
+        {"sub": str(user["id"]), "iat": now, "exp": now + ttl},
+        settings.JWT_SECRET_KEY,
+        algorithm=settings.JWT_ALGORITHM
+    )
+    return {"access_token": token, "token_type": "bearer", "expires_in": ttl}
+
 def parse_init_data_without_verification(init_data: str) -> Dict[str, Any]:
     """Парсинг данных без проверки подписи (только для разработки)"""
     try:
@@ -152,61 +229,43 @@ async def check_nft_ownership(wallet_address: str) -> Dict[str, Any]:
     """
     Проверяет владение NFT из разрешенных коллекций
     """
-    logger.info(f"Checking NFT ownership for wallet: {wallet_address}")
-    logger.info(f"Allowed collections: {settings.ALLOWED_NFT_COLLECTIONS}")
+    logger.debug("Checking NFT ownership for wallet: %s", wallet_address)
+    logger.debug("Allowed collections: %s", settings.ALLOWED_NFT_COLLECTIONS)
     
     try:
-        client = get_ton_client()
-        async with client:
-            nfts = await client.get_wallet_nfts(wallet_address)
-            logger.info(f"Retrieved NFTs: {nfts}")
-            
-            # Фильтруем NFT из разрешенных коллекций
-            valid_nfts = []
-            for nft in nfts:
-                nft_collection = nft.get("collection")
-                is_verified = nft.get("verified", False)
-                logger.info(f"Checking NFT: collection={nft_collection}, verified={is_verified}")
-                
-                if nft_collection in settings.ALLOWED_NFT_COLLECTIONS:
-                    valid_nfts.append(nft)
-                    logger.info(f"Valid NFT found: {nft}")
-            
-            # В режиме разработки всегда даем доступ
-            if settings.DEVELOPMENT_MODE and len(valid_nfts) == 0:
-                logger.warning("Development mode: granting access without NFT")
-                valid_nfts = [{
-                    "collection": settings.ALLOWED_NFT_COLLECTIONS[0],
-                    "name": "Development Access",
-                    "verified": True
-                }]
-            
-            # Определяем уровень доступа
-            access_level = "none"
-            has_access = len(valid_nfts) > 0
-            
-            if has_access:
-                nft_count = len(valid_nfts)
-                if nft_count >= 10:
-                    access_level = "premium"
-                elif nft_count >= 3:
-                    access_level = "advanced"
-                else:
-                    access_level = "basic"
-            
-            result = {
-                "has_access": has_access,
-                "access_level": access_level,
-                "nfts": valid_nfts,
-                "total_nfts": len(valid_nfts),
-                "development_mode": settings.DEVELOPMENT_MODE
-            }
-            
-            logger.info(f"Final result: {result}")
-            return result
-            
+        nfts = await nft_cache.get(wallet_address)
+        logger.debug("Retrieved %d NFTs", len(nfts))
+        
+        # Фильтруем NFT из разрешенных коллекций (TONAPI отдает адреса в raw форме)
+        valid_nfts = filter_collection_nfts(nfts, settings.ALLOWED_NFT_COLLECTIONS)
+        logger.debug("Valid NFTs found: %d", len(valid_nfts))
+        
+        # В режиме разработки всегда даем доступ
+        if settings.DEVELOPMENT_MODE and len(valid_nfts) == 0:
+            logger.warning("Development mode: granting access without NFT")
+            valid_nfts = [{
+                "collection": settings.ALLOWED_NFT_COLLECTIONS[0],
+                "name": "Development Access",
+                "verified": True
+            }]
+        
+        # Определяем уровень доступа
+        has_access = len(valid_nfts) > 0
+        access_level = get_access_level(len(valid_nfts))
+        
+        result = {
+            "has_access": has_access,
+            "access_level": access_level,
+            "nfts": valid_nfts,
+            "total_nfts": len(valid_nfts),
+            "development_mode": settings.DEVELOPMENT_MODE
+        }
+        
+        logger.debug("Final result: has_access=%s level=%s", has_access, access_level)
+        return result
+        
     except Exception as e:
-        logger.error(f"Ошибка проверки NFT: {e}", exc_info=True)
+        logger.error("Ошибка проверки NFT: %s", e, exc_info=True)
         
         # В режиме разработки возвращаем доступ
         if settings.DEVELOPMENT_MODE:
@@ -223,7 +282,8 @@ async def check_nft_ownership(wallet_address: str) -> Dict[str, Any]:
                 "error": str(e)
             }
         else:
-            raise HTTPException(status_code=500, detail=f"Ошибка проверки NFT: {str(e)}")
+            status_code = 503 if isinstance(e, ProviderError) else 500
+            raise HTTPException(status_code=status_code, detail=f"Ошибка проверки NFT: {str(e)}")
 
 # API маршруты
 @app.get("/health")
@@ -247,13 +307,12 @@ async def check_wallet_nft(request: WalletCheckRequest):
 async def get_wallet_nfts(wallet_address: str):
     """Получение всех NFT кошелька"""
     try:
-        async with ton_client as client:
-            nfts = await client.get_wallet_nfts(wallet_address)
-            return {
-                "wallet_address": wallet_address,
-                "nfts": nfts,
-                "total_count": len(nfts)
-            }
+        nfts = await get_ton_client().get_wallet_nfts(wallet_address)
+        return {
+            "wallet_address": wallet_address,
+            "nfts": nfts,
+            "total_count": len(nfts)
+        }
     except Exception as e:
         logger.error(f"Error getting wallet NFTs: {e}")
         raise HTTPException(status_code=500, detail="Ошибка получения NFT")
@@ -262,12 +321,16 @@ async def get_wallet_nfts(wallet_address: str):
 async def verify_telegram(request: TelegramInitData):
     """Проверка данных от Telegram WebApp"""
     try:
-        verified_data = verify_telegram_data(request.init_data, settings.TELEGRAM_BOT_TOKEN)
-        return {
-            "verified": True,
-            "user_data": verified_data,
+        user_data, verified = verify_telegram_data(request.init_data)
+        response = {
+            "verified": verified,
+            "user_data": user_data,
             "development_mode": settings.DEVELOPMENT_MODE
         }
+        # Непроверенные данные можно подделать: токен на них не выдается
+        if verified and settings.JWT_SECRET_KEY:
+            response.update(issue_session_token(user_data))
+        return response
     except HTTPException:
         raise
     except Exception as e:
@@ -316,6 +379,16 @@ async def get_allowed_collections():
         ]
     }
 
+@app.get("/api/v1/cache/nft/stats")
+async def get_nft_cache_stats():
+    """Счетчики попаданий и промахов кэша NFT"""
+    return nft_cache.stats()
+
+@app.get("/api/v1/ton/providers")
+async def get_ton_providers_status():
+    """Состояние провайдеров TON API (circuit breaker, задержки)"""
+    return get_ton_client().provider_status()
+
 # Обработчик ошибок
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
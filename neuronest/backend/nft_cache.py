@@ -0,0 +1,176 @@
+"""
+Кэш владения NFT для TON API клиента
+
+Двухуровневый кэш по адресу кошелька: LRU в памяти процесса и Redis с TTL.
+Одновременные запросы одного кошелька объединяются в один вызов TON API
+(single-flight). Если TON API не ответил вовремя, отдаются устаревшие данные,
+а обновление продолжается в фоне (stale-while-revalidate).
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+NFTList = List[Dict[str, Any]]
+
+
+class NFTOwnershipCache:
+    """Двухуровневый кэш NFT кошельков с single-flight"""
+
+    KEY_PREFIX = "nft:wallet"
+
+    def __init__(
+        self,
+        fetch: Callable[[str], Awaitable[NFTList]],
+        redis_client=None,
+        max_entries: int = 10000,
+        ttl: float = 60,
+        stale_ttl: float = 600,
+        upstream_timeout: float = 3.0,
+        on_count: Optional[Callable[[str], None]] = None,
+    ):
+        self.fetch = fetch
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.upstream_timeout = upstream_timeout
+
+        # wallet -> (nfts, fetched_at)
+        self._local: "OrderedDict[str, tuple[NFTList, float]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Task] = {}
+
+        self.counters = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "coalesced": 0,
+            "stale_served": 0,
+            "upstream_errors": 0,
+        }
+        # Хук метрик: вызывается с именем счетчика при каждом увеличении
+        self.on_count = on_count
+
+    async def get(self, wallet_address: str) -> NFTList:
+        """NFT кошелька из кэша или TON API"""
+        now = time.time()
+        stale: Optional[NFTList] = None
+
+        entry = self._local.get(wallet_address)
+        if entry:
+            nfts, fetched_at = entry
+            if now - fetched_at < self.ttl:
+                self._local.move_to_end(wallet_address)
+                self._count("local_hits")
+                return nfts
+            if now - fetched_at < self.stale_ttl:
+                stale = nfts
+
+        entry = await self._redis_get(wallet_address)
+        if entry:
+            nfts, fetched_at = entry
+            if now - fetched_at < self.ttl:
+                self._store_local(wallet_address, nfts, fetched_at)
+                self._count("redis_hits")
+                return nfts
+            if stale is None and now - fetched_at < self.stale_ttl:
+                stale = nfts
+
+        task = self._inflight.get(wallet_address)
+        if task is None:
+            self._count("misses")
+            task = asyncio.create_task(self._refresh(wallet_address))
+            self._inflight[wallet_address] = task
+            task.add_done_callback(lambda t: self._on_refresh_done(wallet_address, t))
+        else:
+            self._count("coalesced")
+
+        if stale is None:
+            return await asyncio.shield(task)
+
+        # Есть устаревшие данные: ждем TON API не дольше upstream_timeout
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), self.upstream_timeout)
+        except Exception as e:
+            self._count("stale_served")
+            logger.warning("NFT cache: отдаем устаревшие данные для %s (%s)", wallet_address, type(e).__name__)
+            return stale
+
+    async def invalidate(self, wallet_address: str) -> None:
+        """Удаление кошелька из кэша"""
+        self._local.pop(wallet_address, None)
+        if self.redis is not None:
+            try:
+                await self.redis.delete(self._key(wallet_address))
+            except Exception as e:
+                logger.warning("NFT cache: ошибка удаления из Redis: %s", e)
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики попаданий и промахов"""
+        hits = self.counters["local_hits"] + self.counters["redis_hits"]
+        total = hits + self.counters["misses"] + self.counters["coalesced"]
+        return {
+            **self.counters,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+            "local_entries": len(self._local),
+            "inflight": len(self._inflight),
+        }
+
+    def _count(self, name: str) -> None:
+        self.counters[name] += 1
+        if self.on_count is not None:
+            self.on_count(name)
+
+    async def _refresh(self, wallet_address: str) -> NFTList:
+        """Запрос к TON API и запись в оба уровня кэша"""
+        try:
+            nfts = await self.fetch(wallet_address)
+        except Exception:
+            self._count("upstream_errors")
+            raise
+        fetched_at = time.time()
+        self._store_local(wallet_address, nfts, fetched_at)
+        await self._redis_set(wallet_address, nfts, fetched_at)
+        return nfts
+
+    def _on_refresh_done(self, wallet_address: str, task: asyncio.Task) -> None:
+        self._inflight.pop(wallet_address, None)
+        # Ошибка фонового обновления уже учтена, ее может никто не ждать
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("NFT cache: ошибка обновления %s: %s", wallet_address, task.exception())
+
+    def _store_local(self, wallet_address: str, nfts: NFTList, fetched_at: float) -> None:
+        self._local[wallet_address] = (nfts, fetched_at)
+        self._local.move_to_end(wallet_address)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    def _key(self, wallet_address: str) -> str:
+        return f"{self.KEY_PREFIX}:{wallet_address}"
+
+    async def _redis_get(self, wallet_address: str) -> Optional[tuple[NFTList, float]]:
+        if self.redis is None:
+            return None
+        try:
+            raw = await self.redis.get(self._key(wallet_address))
+        except Exception as e:
+            logger.warning("NFT cache: ошибка чтения из Redis: %s", e)
+            return None
+        if not raw:
+            return None
+        data = json.loads(raw)
+        return data["nfts"], data["fetched_at"]
+
+    async def _redis_set(self, wallet_address: str, nfts: NFTList, fetched_at: float) -> None:
+        if self.redis is None:
+            return
+        payload = json.dumps({"nfts": nfts, "fetched_at": fetched_at}, separators=(",", ":"))
+        try:
+            await self.redis.set(self._key(wallet_address), payload, ex=int(self.stale_ttl))
+        except Exception as e:
+            logger.warning("NFT cache: ошибка записи в Redis: %s", e)
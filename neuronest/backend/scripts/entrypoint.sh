@@ -29,6 +29,12 @@ if [[ $REDIS_URL =~ redis://([^:]+):([0-9]+) ]]; then
     wait_for_service $REDIS_HOST $REDIS_PORT "Redis"
 fi
 
+# Метрики предыдущего запуска воркеров не должны попасть в новые значения
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 # Запускаем миграции
 echo "Запуск миграций базы данных..."
 alembic upgrade head
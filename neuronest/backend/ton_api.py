@@ -4,19 +4,188 @@ TON API клиент для проверки NFT
 
 import asyncio
 import aiohttp
+import base64
+import json
 import requests
-from typing import List, Dict, Any
+import time
+from typing import AsyncIterator, Awaitable, Callable, List, Dict, Any, Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Уровни доступа по количеству NFT из разрешенных коллекций (по убыванию порога)
+ACCESS_LEVEL_THRESHOLDS = [
+    ("premium", 10),
+    ("advanced", 3),
+    ("basic", 1),
+]
+
+# Количество NFT, после которого дальнейший поиск не меняет уровень доступа
+MAX_ACCESS_THRESHOLD = ACCESS_LEVEL_THRESHOLDS[0][1]
+
+
+def get_access_level(nft_count: int) -> str:
+    """Уровень доступа по количеству NFT"""
+    for level, threshold in ACCESS_LEVEL_THRESHOLDS:
+        if nft_count >= threshold:
+            return level
+    return "none"
+
+
+def to_raw_address(address: str) -> str:
+    """
+    Адрес TON в raw форме (workchain:hex)
+    Принимает raw и user-friendly (base64/base64url) формы.
+    """
+    address = address.strip()
+    if ":" in address:
+        workchain, account = address.split(":", 1)
+        return f"{int(workchain)}:{account.lower()}"
+    
+    data = base64.urlsafe_b64decode(
+        address.replace("+", "-").replace("/", "_") + "=" * (-len(address) % 4)
+    )
+    if len(data) != 36:
+        raise ValueError(f"Некорректный адрес TON: {address}")
+    workchain = int.from_bytes(data[1:2], "big", signed=True)
+    return f"{workchain}:{data[2:34].hex()}"
+
+
+def filter_collection_nfts(nfts: List[Dict[str, Any]], collections: List[str]) -> List[Dict[str, Any]]:
+    """NFT из указанных коллекций (адреса сравниваются в raw форме)"""
+    allowed = set()
+    for collection in collections:
+        try:
+            allowed.add(to_raw_address(collection))
+        except ValueError:
+            allowed.add(collection)
+    
+    result = []
+    for nft in nfts:
+        collection = nft.get("collection")
+        if not collection:
+            continue
+        try:
+            collection = to_raw_address(collection)
+        except ValueError:
+            pass
+        if collection in allowed:
+            result.append(nft)
+    return result
+
+
+class ProviderError(Exception):
+    """Ошибка ответа провайдера TON API"""
+    
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+    
+    @property
+    def unavailable(self) -> bool:
+        """Провайдер перегружен или неисправен (5xx, 429)"""
+        return self.status is not None and (self.status >= 500 or self.status == 429)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker для провайдера TON API
+    После failure_threshold сбоев подряд (таймаут, ответ 5xx или 429, нет
+    соединения) провайдер отключается на reset_timeout секунд, затем
+    пропускается один пробный запрос (half-open). Прочие ошибки (4xx,
+    неразбираемый ответ) на состояние не влияют.
+    """
+    
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+    
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probe_in_flight = False
+    
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+    
+    def allow(self) -> bool:
+        """Можно ли отправить запрос провайдеру"""
+        state = self.state
+        if state == self.CLOSED:
+            return True
+        if state == self.HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+    
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info("Circuit breaker %s: провайдер снова доступен", self.name)
+        self.failures = 0
+        self.opened_at = None
+        self._probe_in_flight = False
+    
+    def record_cancelled(self) -> None:
+        """Запрос отменен (например, поиск уже завершен) и не влияет на состояние"""
+        self._probe_in_flight = False
+    
+    def record_ignored(self) -> None:
+        """Ошибка не говорит о недоступности провайдера и не влияет на состояние"""
+        self._probe_in_flight = False
+    
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probe_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning("Circuit breaker %s: провайдер отключен на %sс", self.name, self.reset_timeout)
+            self.opened_at = time.monotonic()
+
+
 class TONAPIClient:
     """Клиент для работы с TON API для проверки NFT"""
     
-    def __init__(self, api_key: str = None, tonapi_token: str = None):
+    TONAPI = "tonapi"
+    TONCENTER = "toncenter"
+    
+    def __init__(
+        self,
+        api_key: str = None,
+        tonapi_token: str = None,
+        request_timeout: float = 10.0,
+        connection_limit: int = 100,
+        connection_limit_per_host: int = 20,
+        breaker_failure_threshold: int = 5,
+        breaker_reset_timeout: float = 30.0,
+        allow_mock: bool = False,
+        on_request: Optional[Callable[[str, str, Optional[float]], None]] = None
+    ):
         self.api_key = api_key
         self.tonapi_token = tonapi_token
         self.session = None
+        self._owns_session = False
+        # Мок данные вместо недоступного TON API - только для разработки:
+        # в них есть NFT разрешенной коллекции, то есть доступ любому кошельку
+        self.allow_mock = allow_mock
+        
+        self.request_timeout = request_timeout
+        self.connection_limit = connection_limit
+        self.connection_limit_per_host = connection_limit_per_host
+        
+        self.breakers = {
+            name: CircuitBreaker(name, breaker_failure_threshold, breaker_reset_timeout)
+            for name in (self.TONAPI, self.TONCENTER)
+        }
+        # Хук метрик: (провайдер, исход, секунды или None для пропущенного запроса)
+        self.on_request = on_request
         
         # Базовые URL для различных API
         self.ton_center_base = "https://toncenter.com/api/v2"
@@ -25,57 +194,342 @@ class TONAPIClient:
         
         logger.info(f"TON API Client initialized. Has API key: {api_key is not None}, Has TONAPI token: {tonapi_token is not None}")
     
+    async def start(self) -> None:
+        """Создание долгоживущей HTTP сессии с пулом соединений"""
+        if self.session and not self.session.closed:
+            return
+        connector = aiohttp.TCPConnector(
+            limit=self.connection_limit,
+            limit_per_host=self.connection_limit_per_host,
+            ttl_dns_cache=300,
+            keepalive_timeout=60,
+            enable_cleanup_closed=True
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.request_timeout)
+        )
+    
+    async def close(self) -> None:
+        """Закрытие HTTP сессии"""
+        if self.session:
+            await self.session.close()
+            self.session = None
+    
     async def __aenter__(self):
         """Async context manager entry"""
-        self.session = aiohttp.ClientSession()
+        # Сессию, открытую через start() (lifespan приложения), не закрываем на выходе
+        self._owns_session = self.session is None or self.session.closed
+        await self.start()
         return self
     
     async def __aexit__(self, exc_type, exc_val, exc_tb):
         """Async context manager exit"""
-        if self.session:
-            await self.session.close()
+        if self._owns_session:
+            await self.close()
+            self._owns_session = False
+    
+    def provider_status(self) -> Dict[str, Dict[str, Any]]:
+        """Состояние circuit breaker провайдеров"""
+        return {
+            name: {
+                "state": breaker.state,
+                "consecutive_failures": breaker.failures,
+            }
+            for name, breaker in self.breakers.items()
+        }
     
     async def get_wallet_nfts(self, wallet_address: str) -> List[Dict[str, Any]]:
         """
         Получает NFT для указанного кошелька
-        Пробует несколько API источников для получения данных
+        Пробует несколько API источников для получения данных. Если ни один
+        не ответил, поднимается ProviderError (мок данные - только при allow_mock).
         """
+        logger.debug("Checking NFTs for wallet: %s", wallet_address)
+        
+        if not self.tonapi_token and not self.api_key:
+            return await self._mock_or_raise(wallet_address, "Не настроены ключи TON API")
+        
+        # Пробуем TONAPI.io (пустой список - кошелек без NFT, None - ошибка)
+        if self.tonapi_token:
+            nfts = await self._get_nfts_from_tonapi(wallet_address)
+            if nfts is not None:
+                logger.debug("Получено %d NFT с TONAPI.io", len(nfts))
+                return nfts
+        
+        # Fallback к TONCenter
+        if self.api_key:
+            nfts = await self._get_nfts_from_toncenter(wallet_address)
+            if nfts:
+                logger.debug("Получено %d NFT с TONCenter", len(nfts))
+                return nfts
+        
+        return await self._mock_or_raise(wallet_address, "Все TON API недоступны")
+    
+    async def _mock_or_raise(self, wallet_address: str, reason: str) -> List[Dict[str, Any]]:
+        if not self.allow_mock:
+            raise ProviderError(f"{reason}, NFT кошелька не получены")
+        logger.warning("%s, используем мок данные", reason)
+        return await self._get_mock_nfts(wallet_address)
+    
+    async def _call_provider(
+        self,
+        name: str,
+        request: Callable[[], Awaitable[Any]]
+    ) -> Optional[Any]:
+        """Вызов провайдера через circuit breaker с учетом задержки (None при ошибке)"""
+        breaker = self.breakers[name]
+        if not breaker.allow():
+            logger.debug("%s: circuit breaker открыт, запрос пропущен", name)
+            self._observe(name, "rejected", None)
+            return None
+        
+        await self.start()
+        started = time.perf_counter()
         try:
-            # Логируем входные данные
-            logger.info(f"Checking NFTs for wallet: {wallet_address}")
-            
-            # Если нет API ключей, сразу возвращаем мок данные
-            if not self.tonapi_token and not self.api_key:
-                logger.warning("No API keys configured, using mock data")
-                return await self._get_mock_nfts(wallet_address)
-            
-            # Пробуем TONAPI.io
-            if self.tonapi_token:
-                nfts = await self._get_nfts_from_tonapi(wallet_address)
-                if nfts:
-                    logger.info(f"Получено {len(nfts)} NFT с TONAPI.io")
-                    return nfts
-            
-            # Fallback к TONCenter
-            if self.api_key:
-                nfts = await self._get_nfts_from_toncenter(wallet_address)
-                if nfts:
-                    logger.info(f"Получено {len(nfts)} NFT с TONCenter")
-                    return nfts
+            result = await request()
+        except asyncio.CancelledError:
+            # Отмененный запрос не считается ошибкой провайдера
+            breaker.record_cancelled()
+            self._observe(name, "cancelled", time.perf_counter() - started)
+            raise
+        except asyncio.TimeoutError:
+            logger.warning("%s timeout", name)
+            breaker.record_failure()
+            self._observe(name, "timeout", time.perf_counter() - started)
+            return None
+        except Exception as e:
+            if self._is_outage(e):
+                logger.error("Ошибка %s: %s", name, e)
+                breaker.record_failure()
+            else:
+                logger.warning("Ошибка %s: %s", name, e)
+                breaker.record_ignored()
+            self._observe(name, "error", time.perf_counter() - started)
+            return None
+        
+        elapsed = time.perf_counter() - started
+        breaker.record_success()
+        self._observe(name, "ok", elapsed)
+        return result
+    
+    @staticmethod
+    def _is_outage(error: Exception) -> bool:
+        """Ошибка, которую учитывает circuit breaker (таймауты учитываются отдельно)"""
+        if isinstance(error, ProviderError):
+            return error.unavailable
+        return isinstance(error, aiohttp.ClientConnectionError)
+    
+    def _observe(self, name: str, outcome: str, seconds: Optional[float]) -> None:
+        if self.on_request is not None:
+            self.on_request(name, outcome, seconds)
+    
+    async def get_wallet_collection_nfts(
+        self,
+        wallet_address: str,
+        collections: List[str],
+        stop_after: Optional[int] = MAX_ACCESS_THRESHOLD,
+        page_size: int = 100
+    ) -> List[Dict[str, Any]]:
+        """
+        NFT кошелька только из указанных коллекций
+        Коллекции запрашиваются параллельно с фильтрацией и пагинацией на стороне
+        TONAPI.io. Поиск прекращается, как только найдено stop_after NFT.
+        """
+        if not self.tonapi_token:
+            nfts = await self.get_wallet_nfts(wallet_address)
+            return filter_collection_nfts(nfts, collections)
+        
+        found: List[Dict[str, Any]] = []
+        
+        async def fetch_collection(collection: str) -> None:
+            offset = 0
+            while not (stop_after and len(found) >= stop_after):
+                page = await self._get_tonapi_collection_page(wallet_address, collection, offset, page_size)
+                if page is None:
+                    raise ProviderError(f"TONAPI.io: не удалось получить NFT коллекции {collection}")
+                nfts, page_count = page
+                found.extend(nfts)
+                if page_count < page_size:
+                    return
+                offset += page_size
+        
+        # Ошибка провайдера поднимается дальше: кэш отдаст устаревшие данные, если они есть
+        tasks = [asyncio.create_task(fetch_collection(collection)) for collection in collections]
+        pending = set(tasks)
+        try:
+            while pending and not (stop_after and len(found) >= stop_after):
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+            # Забираем результаты остальных задач, чтобы их ошибки не терялись
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        logger.debug("Найдено %d NFT из %d коллекций на TONAPI.io", len(found), len(collections))
+        return found[:stop_after] if stop_after else found
+    
+    async def _get_tonapi_collection_page(
+        self,
+        wallet_address: str,
+        collection: str,
+        offset: int,
+        limit: int
+    ) -> Optional[tuple]:
+        """Одна страница NFT кошелька из коллекции: (NFT, количество элементов на странице)"""
+        headers = {
+            "Authorization": f"Bearer {self.tonapi_token}",
+            "accept": "application/json"
+        }
+        params = {
+            "collection": collection,
+            "limit": limit,
+            "offset": offset,
+            "indirect_ownership": "false"
+        }
+        
+        url = f"{self.tonapi_base}/accounts/{wallet_address}/nfts"
+        
+        async def request():
+            async with self.session.get(url, headers=headers, params=params) as response:
+                if response.status >= 500 or response.status == 429:
+                    raise ProviderError(f"TONAPI.io ошибка: {response.status}", response.status)
+                if response.status != 200:
+                    logger.warning("TONAPI.io ошибка: %s", response.status)
+                    return [], 0
+                # Страница ограничена limit элементами и разбирается сразу
+                items = (await response.json()).get('nft_items', [])
+                return self._parse_tonapi_nfts(items), len(items)
+        
+        return await self._call_provider(self.TONAPI, request)
+    
+    def _tonapi_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.tonapi_token}",
+            "accept": "application/json"
+        }
+    
+    async def iter_collection_items(
+        self,
+        collection: str,
+        page_size: int = 1000
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Постраничный обход всех NFT коллекции (index, address, owner)"""
+        url = f"{self.tonapi_base}/nfts/collections/{collection}/items"
+        offset = 0
+        while True:
+            params = {"limit": page_size, "offset": offset}
             
-            # Если все API недоступны, используем мок данные
-            logger.warning("Все TON API недоступны, используем мок данные")
-            return await self._get_mock_nfts(wallet_address)
+            async def request():
+                async with self.session.get(url, headers=self._tonapi_headers(), params=params) as response:
+                    if response.status != 200:
+                        raise ProviderError(f"TONAPI.io ошибка: {response.status}", response.status)
+                    return (await response.json()).get("nft_items", [])
             
-        except Exception as e:
-            logger.error(f"Ошибка получения NFT: {e}", exc_info=True)
-            return await self._get_mock_nfts(wallet_address)
+            items = await self._call_provider(self.TONAPI, request)
+            if items is None:
+                raise ProviderError(f"TONAPI.io: не удалось получить элементы коллекции {collection}")
+            yield [self._parse_collection_item(item) for item in items]
+            if len(items) < page_size:
+                return
+            offset += page_size
     
-    async def _get_nfts_from_tonapi(self, wallet_address: str) -> List[Dict[str, Any]]:
-        """Получение NFT через TONAPI.io"""
-        if not self.session:
-            self.session = aiohttp.ClientSession()
+    async def get_nft_items_bulk(self, item_addresses: List[str]) -> List[Dict[str, Any]]:
+        """Текущие владельцы набора NFT одним запросом"""
+        url = f"{self.tonapi_base}/nfts/_bulk"
+        
+        async def request():
+            async with self.session.post(
+                url,
+                headers=self._tonapi_headers(),
+                json={"account_ids": item_addresses}
+            ) as response:
+                if response.status != 200:
+                    raise ProviderError(f"TONAPI.io ошибка: {response.status}", response.status)
+                return (await response.json()).get("nft_items", [])
         
+        items = await self._call_provider(self.TONAPI, request)
+        if items is None:
+            raise ProviderError("TONAPI.io: не удалось получить NFT")
+        return [self._parse_collection_item(item) for item in items]
+    
+    async def stream_account_transactions(self, accounts: List[str]) -> AsyncIterator[str]:
+        """
+        Поток адресов аккаунтов с новыми транзакциями (TONAPI.io SSE)
+        Соединение без общего таймаута: поток живет, пока его не отменят.
+        """
+        await self.start()
+        url = f"{self.tonapi_base}/sse/accounts/transactions"
+        async with self.session.get(
+            url,
+            headers={**self._tonapi_headers(), "accept": "text/event-stream"},
+            params={"accounts": ",".join(accounts)},
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=None)
+        ) as response:
+            if response.status != 200:
+                raise ProviderError(f"TONAPI.io SSE ошибка: {response.status}", response.status)
+            async for line in response.content:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                try:
+                    event = json.loads(line[5:].strip())
+                except ValueError:
+                    continue
+                if event.get("account_id"):
+                    yield event["account_id"]
+    
+    async def get_masterchain_seqno(self) -> Optional[int]:
+        """Номер последнего блока мастерчейна (None при ошибке провайдера)"""
+        url = f"{self.tonapi_base}/blockchain/masterchain-head"
+
+        async def request():
+            async with self.session.get(url, headers=self._tonapi_headers()) as response:
+                if response.status != 200:
+                    raise ProviderError(f"TONAPI.io ошибка: {response.status}", response.status)
+                return int((await response.json())["seqno"])
+
+        return await self._call_provider(self.TONAPI, request)
+
+    async def get_account_transactions(
+        self,
+        account: str,
+        after_lt: Optional[int] = None,
+        limit: int = 100,
+        sort_order: str = "asc"
+    ) -> List[Dict[str, Any]]:
+        """Транзакции аккаунта после логического времени after_lt"""
+        url = f"{self.tonapi_base}/blockchain/accounts/{account}/transactions"
+        params = {"limit": limit, "sort_order": sort_order}
+        if after_lt is not None:
+            params["after_lt"] = after_lt
+
+        async def request():
+            async with self.session.get(url, headers=self._tonapi_headers(), params=params) as response:
+                if response.status != 200:
+                    raise ProviderError(f"TONAPI.io ошибка: {response.status}", response.status)
+                return (await response.json()).get("transactions", [])
+
+        transactions = await self._call_provider(self.TONAPI, request)
+        if transactions is None:
+            raise ProviderError(f"TONAPI.io: не удалось получить транзакции {account}")
+        return transactions
+
+    @staticmethod
+    def _parse_collection_item(item: Dict[str, Any]) -> Dict[str, Any]:
+        """Элемент коллекции: адрес, индекс и владелец в raw форме"""
+        owner = (item.get("owner") or {}).get("address")
+        return {
+            "address": to_raw_address(item["address"]),
+            "collection": to_raw_address(item["collection"]["address"]) if item.get("collection") else None,
+            "index": int(item.get("index", 0)),
+            "owner": to_raw_address(owner) if owner else None
+        }
+    
+    async def _get_nfts_from_tonapi(self, wallet_address: str) -> Optional[List[Dict[str, Any]]]:
+        """Получение NFT через TONAPI.io (None при ошибке провайдера)"""
         headers = {
             "Authorization": f"Bearer {self.tonapi_token}",
             "accept": "application/json"
@@ -83,26 +537,21 @@ class TONAPIClient:
         
         url = f"{self.tonapi_base}/accounts/{wallet_address}/nfts"
         
-        try:
-            async with self.session.get(url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    return self._parse_tonapi_nfts(data.get('nft_items', []))
-                else:
-                    logger.warning(f"TONAPI.io ошибка: {response.status}")
+        async def request():
+            async with self.session.get(url, headers=headers) as response:
+                if response.status >= 500 or response.status == 429:
+                    raise ProviderError(f"TONAPI.io ошибка: {response.status}", response.status)
+                if response.status != 200:
+                    # Ошибка запроса (например, неверный адрес), провайдер исправен
+                    logger.warning("TONAPI.io ошибка: %s", response.status)
                     return []
-        except asyncio.TimeoutError:
-            logger.warning("TONAPI.io timeout")
-            return []
-        except Exception as e:
-            logger.error(f"Ошибка TONAPI.io: {e}")
-            return []
+                data = await response.json()
+                return self._parse_tonapi_nfts(data.get('nft_items', []))
+        
+        return await self._call_provider(self.TONAPI, request)
     
     async def _get_nfts_from_toncenter(self, wallet_address: str) -> List[Dict[str, Any]]:
         """Получение NFT через TONCenter API"""
-        if not self.session:
-            self.session = aiohttp.ClientSession()
-        
         params = {
             "address": wallet_address,
             "api_key": self.api_key
@@ -110,21 +559,18 @@ class TONAPIClient:
         
         url = f"{self.ton_center_base}/getAddressInformation"
         
-        try:
-            async with self.session.get(url, params=params, timeout=10) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    # TONCenter требует дополнительную обработку для NFT
-                    return self._parse_toncenter_data(data)
-                else:
-                    logger.warning(f"TONCenter ошибка: {response.status}")
+        async def request():
+            async with self.session.get(url, params=params) as response:
+                if response.status >= 500 or response.status == 429:
+                    raise ProviderError(f"TONCenter ошибка: {response.status}", response.status)
+                if response.status != 200:
+                    logger.warning("TONCenter ошибка: %s", response.status)
                     return []
-        except asyncio.TimeoutError:
-            logger.warning("TONCenter timeout")
-            return []
-        except Exception as e:
-            logger.error(f"Ошибка TONCenter: {e}")
-            return []
+                data = await response.json()
+                # TONCenter требует дополнительную обработку для NFT
+                return self._parse_toncenter_data(data)
+        
+        return await self._call_provider(self.TONCENTER, request)
     
     def _parse_tonapi_nfts(self, nft_items: List[Dict]) -> List[Dict[str, Any]]:
         """Парсинг NFT данных от TONAPI.io"""
@@ -142,7 +588,7 @@ class TONAPIClient:
                 }
                 parsed_nfts.append(nft_data)
             except Exception as e:
-                logger.error(f"Ошибка парсинга NFT: {e}")
+                logger.error("Ошибка парсинга NFT: %s", e)
                 continue
         
         return parsed_nfts
@@ -155,7 +601,7 @@ class TONAPIClient:
     
     async def _get_mock_nfts(self, wallet_address: str) -> List[Dict[str, Any]]:
         """Мок данные для тестирования и fallback"""
-        logger.info(f"Using mock NFT data for address: {wallet_address}")
+        logger.debug("Using mock NFT data for address: %s", wallet_address)
         
         # Симулируем задержку API
         await asyncio.sleep(1)
@@ -0,0 +1,10 @@
+#!/bin/bash
+# Роль и слот для потоковой реплики (выполняется при первой инициализации primary)
+set -e
+
+psql -v ON_ERROR_STOP=1 --username "$POSTGRES_USER" --dbname "$POSTGRES_DB" <<-EOSQL
+    CREATE ROLE replicator WITH REPLICATION LOGIN PASSWORD '${POSTGRES_REPLICATION_PASSWORD}';
+    SELECT pg_create_physical_replication_slot('neuronest_replica');
+EOSQL
+
+echo "host replication replicator all scram-sha-256" >> "$PGDATA/pg_hba.conf"